@@ -1,14 +1,16 @@
 import type { Request, Response } from "express";
 import prisma from "../../config/prisma";
-import { parseSmsAndPredict } from "../../services/ml/ml.service";
+import { parseSmsAndPredict, recordMerchantOverride, recordSmsSeen } from "../../services/ml/ml.service";
 
 const CONFIDENCE_THRESHOLD = 0.6;
 const FALLBACK_DEBIT_THRESHOLD = 0.55;
+// Past this the ML service answers with its rule-based category instead
+const ML_LATENCY_BUDGET_MS = 300;
 
 function hasClearDebitPattern(smsText: string): boolean {
   const lower = smsText.toLowerCase();
   const hasDebitVerb = /\b(debited|spent|paid|purchase|txn|transaction|withdrawn|dr\.?)\b/.test(lower);
-  const hasAmount = /(?:₹|rs\.?|inr)\s*[\d,]+(?:\.\d{1,2})?/i.test(smsText);
+  const hasAmount = /(?:₹|\b(?:rs\.?|inr))\s*[\d,]+(?:\.\d{1,2})?/i.test(smsText);
   const isCreditOnly = /\b(credited|salary|refund|cashback|interest)\b/.test(lower) && !hasDebitVerb;
   return hasDebitVerb && hasAmount && !isCreditOnly;
 }
@@ -29,7 +31,23 @@ export async function autoIngestSms(req: AuthReq, res: Response) {
   }
 
   try {
-    const parsed = await parseSmsAndPredict(smsText);
+    const parsed = await parseSmsAndPredict(smsText, {
+      dedupeForUser: userId,
+      latencyBudgetMs: ML_LATENCY_BUDGET_MS,
+    });
+
+    if (parsed.duplicate) {
+      return res.json({
+        saved: false,
+        amount: parsed.amount ? Number(parsed.amount) : null,
+        merchant: parsed.merchant || null,
+        category: null,
+        confidence: 0,
+        date: parsed.date || null,
+        rawSms: smsText,
+        reason: "duplicate",
+      });
+    }
 
     const amount = parsed.amount ? Number(parsed.amount) : null;
     const merchant = parsed.merchant || null;
@@ -63,6 +81,8 @@ export async function autoIngestSms(req: AuthReq, res: Response) {
           source: "sms",
         },
       });
+      // Only now: a failed create above must leave the SMS retryable
+      await recordSmsSeen(userId, smsText);
 
       return res.json({
         saved: true,
@@ -117,6 +137,10 @@ export async function confirmSmsCategory(req: AuthReq, res: Response) {
       },
     });
 
+    if (merchant) {
+      void recordMerchantOverride(userId, String(merchant), String(category));
+    }
+
     return res.json({ saved: true, expenseId: expense.id });
   } catch (err) {
     console.error("[SMS confirm]", err);
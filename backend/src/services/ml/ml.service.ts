@@ -9,6 +9,11 @@ type MLRequestOptions = {
   userId?: string;
   req?: Request;
   shouldLog?: boolean;
+  // Auto-ingest only: the ML service drops a second SMS for a payment already
+  // stored (and recorded with recordSmsSeen)
+  dedupeForUser?: string;
+  // Rule-based category instead of a model answer that would arrive later than this
+  latencyBudgetMs?: number;
 };
 
 const ML_BASE_URL = (env as any).ML_SERVICE_URL ?? "http://localhost:8001";
@@ -19,6 +24,7 @@ export interface MerchantPrediction {
   category: string;
   confidence: number;
   used_model: boolean;
+  override?: boolean;
 }
 
 export interface SmsPrediction {
@@ -29,6 +35,8 @@ export interface SmsPrediction {
   confidence: number;
   type: "expense" | "cash_withdrawal";
   used_model: boolean;
+  duplicate?: boolean;
+  override?: boolean;
 }
 
 export interface BatchPrediction {
@@ -76,14 +84,19 @@ function normalizeSmsPrediction(parsed: SmsPrediction, smsText: string): SmsPred
   };
 }
 
-async function mlFetch<T>(path: string, body: unknown): Promise<T> {
+async function mlFetch<T>(path: string, body: unknown, latencyBudgetMs?: number): Promise<T> {
   const controller = new AbortController();
   const timer = setTimeout(() => controller.abort(), TIMEOUT_MS);
 
   try {
     const res = await fetch(`${ML_BASE_URL}${path}`, {
       method: "POST",
-      headers: { "Content-Type": "application/json" },
+      headers: {
+        "Content-Type": "application/json",
+        // Lets the ML service drop the request instead of scoring it after we gave up
+        "X-Request-Deadline": String(Date.now() + TIMEOUT_MS),
+        ...(latencyBudgetMs ? { "X-Latency-Budget-Ms": String(latencyBudgetMs) } : {})
+      },
       body: JSON.stringify(body),
       signal: controller.signal
     });
@@ -169,6 +182,24 @@ export async function checkMlHealth(): Promise<boolean> {
   }
 }
 
+// The user's own category for a merchant wins over the model on later predictions
+export async function recordMerchantOverride(userId: string, merchant: string, category: string): Promise<void> {
+  try {
+    await mlFetch("/overrides", { overrides: [{ user_id: userId, merchant, category }] });
+  } catch (error) {
+    console.warn("[ML override]", error instanceof Error ? error.message : error);
+  }
+}
+
+// Called once the expense is stored, so a retry after a failed save is not answered as a duplicate
+export async function recordSmsSeen(userId: string, smsText: string): Promise<void> {
+  try {
+    await mlFetch("/dedup/record", { user_id: userId, sms_text: smsText });
+  } catch (error) {
+    console.warn("[ML dedup]", error instanceof Error ? error.message : error);
+  }
+}
+
 export async function predictMerchantCategory(
   merchant: string,
   options: MLRequestOptions = {}
@@ -176,7 +207,10 @@ export async function predictMerchantCategory(
   const startedAt = Date.now();
 
   try {
-    const result = await mlFetch<MerchantPrediction>("/predict/merchant", { merchant });
+    const result = await mlFetch<MerchantPrediction>("/predict/merchant", {
+      merchant,
+      ...(options.userId ? { user_id: options.userId } : {})
+    });
     if (options.shouldLog !== false) {
       await logMLRequest({
         requestType: "PREDICT_CATEGORY",
@@ -221,7 +255,10 @@ export async function parseSmsAndPredict(
   const startedAt = Date.now();
 
   try {
-    const rawResult = await mlFetch<SmsPrediction>("/predict/sms", { sms_text: smsText });
+    const rawResult = await mlFetch<SmsPrediction>("/predict/sms", {
+      sms_text: smsText,
+      ...(options.dedupeForUser ? { user_id: options.dedupeForUser } : {})
+    }, options.latencyBudgetMs);
     const result = normalizeSmsPrediction(rawResult, smsText);
 
     if (options.shouldLog !== false) {
@@ -0,0 +1,213 @@
+"""
+admission.py — per-endpoint admission control in front of the threadpool.
+
+Each limited path gets `concurrency` slots and a waiting room of
+`queue_depth`. A request that finds both full is turned away at once with
+429; one that waits longer than `max_wait_ms`, or past its own deadline, gets
+503. Both carry Retry-After. Nothing reaches the sync handlers (and so the
+threadpool) without a slot, so a burst can no longer pile up work whose
+caller has already given up.
+
+Deadlines come from the caller:
+  X-Request-Deadline: <unix epoch ms>     absolute, what the backend sends
+  X-Request-Timeout-Ms: <ms>              relative to arrival here
+
+Queue wait and service time are recorded separately per path, and queue wait
+is added to the request's Server-Timing as "queue".
+
+Keep the sum of `concurrency` at or below the threadpool size (40 by
+default) so that requests wait here, where the wait is visible, and not
+inside the threadpool.
+
+Used by: main.py
+"""
+
+import asyncio
+import json
+import math
+import time
+from collections import Counter, deque
+from typing import Optional
+
+import numpy as np
+
+from profiling import current_timings
+
+
+def parse_limits(spec: str) -> dict[str, tuple[int, int]]:
+    """"/predict/sms=32:64,/predict/batch=4:8" → {path: (concurrency, queue_depth)}"""
+    limits = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        path, _, numbers = item.partition("=")
+        concurrency, _, depth = numbers.partition(":")
+        limits[path.strip()] = (int(concurrency), int(depth or 0))
+    return limits
+
+
+class _Gate:
+    """Counting semaphore with a bounded FIFO waiting room; slots are handed over."""
+
+    def __init__(self, concurrency: int, queue_depth: int, window: int = 5000):
+        self.concurrency = concurrency
+        self.queue_depth = queue_depth
+        self.in_flight = 0
+        self._waiters: deque[asyncio.Future] = deque()
+        self.outcomes: Counter = Counter()
+        self.queue_ms: deque = deque(maxlen=window)
+        self.service_ms: deque = deque(maxlen=window)
+
+    @property
+    def full(self) -> bool:
+        return len(self._waiters) >= self.queue_depth
+
+    async def acquire(self, timeout: float) -> bool:
+        if self.in_flight < self.concurrency and not self._waiters:
+            self.in_flight += 1
+            return True
+        fut = asyncio.get_running_loop().create_future()
+        self._waiters.append(fut)
+        try:
+            await asyncio.wait((fut,), timeout=max(timeout, 0.0))
+        except asyncio.CancelledError:      # client went away while queued
+            self._abandon(fut)
+            raise
+        if fut.done():
+            return True
+        self._abandon(fut)
+        return False
+
+    def _abandon(self, fut: asyncio.Future) -> None:
+        if fut.done():                      # a slot was handed over meanwhile
+            self.release()
+        else:
+            fut.cancel()
+            self._waiters.remove(fut)
+
+    def release(self) -> None:
+        if self._waiters:
+            self._waiters.popleft().set_result(None)    # in_flight unchanged
+        else:
+            self.in_flight -= 1
+
+    def retry_after(self) -> int:
+        """Seconds until the waiting room has likely drained, at least 1."""
+        if not self.service_ms:
+            return 1
+        mean_s = float(np.mean(self.service_ms)) / 1000
+        return max(1, math.ceil(mean_s * (len(self._waiters) + 1) / self.concurrency))
+
+    @staticmethod
+    def _latency(samples: deque) -> Optional[dict]:
+        if not samples:
+            return None
+        arr = np.asarray(samples)
+        return {
+            "p50": round(float(np.percentile(arr, 50)), 3),
+            "p99": round(float(np.percentile(arr, 99)), 3),
+            "max": round(float(arr.max()), 3),
+        }
+
+    def stats(self) -> dict:
+        return {
+            "concurrency": self.concurrency,
+            "queue_depth": self.queue_depth,
+            "in_flight": self.in_flight,
+            "queued": len(self._waiters),
+            "outcomes": dict(self.outcomes),
+            "queue_wait_ms": self._latency(self.queue_ms),
+            "service_ms": self._latency(self.service_ms),
+        }
+
+
+def _deadline(headers: list[tuple[bytes, bytes]], arrived: float) -> Optional[float]:
+    """Deadline as a time.time() value, or None when the caller sent none."""
+    for name, value in headers:
+        try:
+            if name == b"x-request-deadline":
+                return int(value) / 1000
+            if name == b"x-request-timeout-ms":
+                return arrived + int(value) / 1000
+        except ValueError:
+            return None
+    return None
+
+
+class AdmissionControl:
+    """Limits and counters, shared with the stats endpoint."""
+
+    def __init__(self, limits: dict[str, tuple[int, int]], max_wait_ms: float = 1000.0):
+        self.max_wait = max_wait_ms / 1000
+        self.gates = {path: _Gate(c, q) for path, (c, q) in limits.items()}
+
+    def stats(self) -> dict:
+        return {"max_wait_ms": self.max_wait * 1000,
+                "endpoints": {path: gate.stats() for path, gate in self.gates.items()}}
+
+
+class AdmissionMiddleware:
+    """Pure ASGI middleware; paths without a limit pass straight through."""
+
+    def __init__(self, app, control: AdmissionControl):
+        self.app = app
+        self.control = control
+
+    async def __call__(self, scope, receive, send):
+        gate = self.control.gates.get(scope.get("path")) if scope["type"] == "http" else None
+        if gate is None:
+            await self.app(scope, receive, send)
+            return
+
+        arrived = time.time()
+        deadline = _deadline(scope["headers"], arrived)
+        if deadline is not None and deadline <= arrived:
+            await self._reject(receive, send, gate, 503, "deadline", "request deadline already passed")
+            return
+        if gate.in_flight >= gate.concurrency and gate.full:
+            await self._reject(receive, send, gate, 429, "queue_full", "too many requests queued")
+            return
+
+        t0 = time.perf_counter()
+        max_wait = self.control.max_wait
+        budget = max_wait if deadline is None else min(max_wait, deadline - arrived)
+        admitted = await gate.acquire(budget)
+        wait_ms = (time.perf_counter() - t0) * 1000
+        gate.queue_ms.append(wait_ms)
+        current_timings()["queue"] = wait_ms
+
+        expired = deadline is not None and time.time() >= deadline
+        if not admitted or expired:
+            if admitted:
+                gate.release()
+            await self._reject(receive, send, gate, 503, "deadline" if expired else "queue_timeout",
+                               "request deadline passed while queued" if expired else "queue wait limit exceeded")
+            return
+
+        gate.outcomes["admitted"] += 1
+        t1 = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            gate.service_ms.append((time.perf_counter() - t1) * 1000)
+            gate.release()
+
+    @staticmethod
+    async def _reject(receive, send, gate: _Gate, status: int, reason: str, detail: str) -> None:
+        gate.outcomes[reason] += 1
+        # Read (and discard) the body first: closing on an unread body resets the
+        # connection, and the client would see an error instead of the status
+        message = {"more_body": True}
+        while message.get("more_body"):
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+        body = json.dumps({"detail": detail, "reason": reason}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(gate.retry_after()).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,515 @@
+"""
+analytics.py — columnar spending analytics over parsed transactions.
+
+Transactions arrive in the shape of parsed_transactions.csv (amount, merchant,
+date, category, plus an optional user_id) and are folded into three
+aggregates. Strings are dictionary-encoded and each group is one packed int64
+key, kept sorted next to parallel spent/count columns:
+
+  monthly    (user, month, category)  → spent, count
+  daily      (user, day)              → spent, count
+  merchants  (user, month, merchant)  → spent, count   (28-bit merchant codes)
+  categories (user, day, category)    → spent, count   (forecast.py input)
+
+Appending a batch group-bys only the new rows; existing groups are updated in
+place and new ones are inserted at their searchsorted position, so an append
+never re-aggregates history. A user's rows are one contiguous key range, and
+all-user queries are np.bincount over the decoded user codes.
+
+Usage (benchmark):
+  python analytics.py --rows 1000000 --users 10000
+
+Used by: main.py (/analytics/*), forecast.py
+"""
+
+import argparse
+import calendar
+import json
+import threading
+import time
+from datetime import date, datetime
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+BASE_DIR = Path(__file__).parent
+DEFAULT_USER = "default"
+DATE_FORMAT = "%d-%m-%Y"          # what sms_parser.py / _parse_sms emit
+CATEGORY_FIELDS = ("category", "true_category")
+EPOCH = pd.Timestamp("1970-01-01")
+
+
+def month_label(month: int) -> str:
+    return f"{1970 + month // 12}-{month % 12 + 1:02d}"
+
+
+def day_label(day: int) -> str:
+    return str(np.datetime64(int(day), "D"))
+
+
+def _month_of(day: int) -> int:
+    return int(np.datetime64(int(day), "D").astype("datetime64[M]").astype(np.int64))
+
+
+def _month_position(day: int) -> tuple[int, int]:
+    """(day of month, days in month) for a day number."""
+    d = np.datetime64(int(day), "D").astype(date)
+    return d.day, calendar.monthrange(d.year, d.month)[1]
+
+
+class _Dictionary:
+    """Grows a str ↔ int32 code mapping as new values arrive."""
+
+    def __init__(self):
+        self.index: dict[str, int] = {}
+        self.names: list[str] = []
+
+    def encode(self, values: pd.Series) -> np.ndarray:
+        codes, uniques = pd.factorize(values)
+        lookup = np.fromiter((self._code(u) for u in uniques), dtype=np.int32, count=len(uniques))
+        return lookup[codes]
+
+    def _code(self, name: str) -> int:
+        code = self.index.get(name)
+        if code is None:
+            code = self.index[name] = len(self.names)
+            self.names.append(name)
+        return code
+
+    def get(self, name: str) -> Optional[int]:
+        return self.index.get(name)
+
+    def truncate(self, size: int) -> None:
+        """Forget every code from `size` on — undoes the encodes of a failed batch."""
+        for name in self.names[size:]:
+            del self.index[name]
+        del self.names[size:]
+
+
+def _parse_dates(values: pd.Series) -> pd.Series:
+    dates = pd.to_datetime(values, format=DATE_FORMAT, errors="coerce")
+    missing = dates.isna() & values.notna()
+    if missing.any():   # ISO dates from the backend, often UTC ("...Z") or with an offset
+        iso = pd.to_datetime(values[missing], format="ISO8601", errors="coerce", utc=True)
+        dates[missing] = iso.dt.tz_convert(None)
+    return dates
+
+
+# key = user << 40 | period << 20 | item   (period = month or day number)
+_USER_SHIFT = 40
+_PERIOD_SHIFT = 20
+_MASK = (1 << 20) - 1
+_MAX_USERS = 1 << (63 - _USER_SHIFT)
+# The merchant table only holds months, which fit 12 bits (until 2311), so
+# its item field takes the other 28: ~268M merchants rather than ~1M.
+_MERCHANT_BITS = 28
+
+
+def _check_range(name: str, values: np.ndarray, limit: int) -> None:
+    if len(values) and (values.min() < 0 or values.max() >= limit):
+        raise ValueError(f"{name} out of range for the packed key: "
+                         f"[{values.min()}, {values.max()}] not within [0, {limit})")
+
+
+def _pack(user: np.ndarray, period: np.ndarray, item: np.ndarray,
+          item_bits: int = _PERIOD_SHIFT) -> np.ndarray:
+    """Packed keys; raises ValueError rather than let a field bleed into its neighbour."""
+    _check_range("user code", user, _MAX_USERS)
+    _check_range("period", period, 1 << (_USER_SHIFT - item_bits))
+    _check_range("item code", item, 1 << item_bits)
+    return (
+        (user.astype(np.int64) << _USER_SHIFT)
+        | (period.astype(np.int64) << item_bits)
+        | item.astype(np.int64)
+    )
+
+
+class _Aggregate:
+    """Sorted packed keys with parallel spent/count columns."""
+
+    def __init__(self, item_bits: int = _PERIOD_SHIFT):
+        self.item_bits = item_bits
+        self.keys = np.empty(0, dtype=np.int64)
+        self.spent = np.empty(0, dtype=np.float64)
+        self.count = np.empty(0, dtype=np.int64)
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    @property
+    def nbytes(self) -> int:
+        return self.keys.nbytes + self.spent.nbytes + self.count.nbytes
+
+    def add(self, keys: np.ndarray, amounts: np.ndarray) -> None:
+        batch_keys, inverse = np.unique(keys, return_inverse=True)
+        spent = np.bincount(inverse, weights=amounts)
+        count = np.bincount(inverse)
+
+        pos = np.searchsorted(self.keys, batch_keys)
+        hit = pos < len(self.keys)
+        hit[hit] = self.keys[pos[hit]] == batch_keys[hit]
+        self.spent[pos[hit]] += spent[hit]
+        self.count[pos[hit]] += count[hit]
+
+        new = ~hit
+        if new.any():
+            at = pos[new]
+            self.keys = np.insert(self.keys, at, batch_keys[new])
+            self.spent = np.insert(self.spent, at, spent[new])
+            self.count = np.insert(self.count, at, count[new])
+
+    def user_rows(self, user: int) -> slice:
+        lo, hi = np.searchsorted(self.keys, [user << _USER_SHIFT, (user + 1) << _USER_SHIFT])
+        return slice(int(lo), int(hi))
+
+    def users(self) -> np.ndarray:
+        return self.keys >> _USER_SHIFT
+
+    def pack(self, user: np.ndarray, period: np.ndarray, item: np.ndarray) -> np.ndarray:
+        return _pack(user, period, item, self.item_bits)
+
+    def periods(self, rows=slice(None)) -> np.ndarray:
+        return (self.keys[rows] >> self.item_bits) & ((1 << (_USER_SHIFT - self.item_bits)) - 1)
+
+    def items(self, rows=slice(None)) -> np.ndarray:
+        return self.keys[rows] & ((1 << self.item_bits) - 1)
+
+
+class SpendingAnalytics:
+    def __init__(self):
+        self.users = _Dictionary()
+        self.categories = _Dictionary()
+        self.merchants = _Dictionary()
+        self.rows = 0
+        self.last_day: Optional[int] = None
+        self._monthly = _Aggregate()
+        self._daily = _Aggregate()
+        self._merchant_totals = _Aggregate(item_bits=_MERCHANT_BITS)
+        self._daily_categories = _Aggregate()
+        self._lock = threading.Lock()
+
+    # ── Ingest ────────────────────────────────────────────────────────────────
+    def append(self, df: pd.DataFrame) -> tuple[int, int]:
+        """Fold a batch of transactions into the aggregates. Returns (added, rejected)."""
+        category_field = next((c for c in CATEGORY_FIELDS if c in df.columns), None)
+        missing = {"amount", "date"} - set(df.columns)
+        if missing or category_field is None:
+            raise ValueError(f"transactions need amount, date and category columns (missing {sorted(missing) or ['category']})")
+
+        amount = pd.to_numeric(df["amount"], errors="coerce")
+        dates = _parse_dates(df["date"])
+        # periods count from 1970, so earlier dates have no key
+        valid = (amount > 0) & dates.notna() & (dates >= EPOCH)
+        rejected = int((~valid).sum())
+        df, amount, dates = df[valid], amount[valid].to_numpy(np.float64), dates[valid]
+        if not len(df):
+            return 0, rejected
+
+        day = dates.to_numpy().astype("datetime64[D]")
+        month = day.astype("datetime64[M]").astype(np.int64)
+        day = day.astype(np.int64)
+        merchants = df["merchant"].fillna("Unknown").astype(str) if "merchant" in df.columns \
+            else pd.Series("Unknown", index=df.index)
+        users_col = df["user_id"].fillna(DEFAULT_USER).astype(str) if "user_id" in df.columns \
+            else pd.Series(DEFAULT_USER, index=df.index)
+
+        with self._lock:
+            dictionaries = [(d, len(d.names)) for d in (self.users, self.categories, self.merchants)]
+            try:
+                user = self.users.encode(users_col)
+                category = self.categories.encode(df[category_field].fillna("Other").astype(str))
+                merchant = self.merchants.encode(merchants)
+                # pack everything first: a range error must not leave the tables half-updated
+                keys = [
+                    (table, table.pack(user, period, item)) for table, period, item in (
+                        (self._monthly, month, category),
+                        (self._daily, day, np.zeros_like(user)),
+                        (self._merchant_totals, month, merchant),
+                        (self._daily_categories, day, category),
+                    )
+                ]
+            except ValueError:
+                # nor the dictionaries holding codes no key refers to
+                for dictionary, size in dictionaries:
+                    dictionary.truncate(size)
+                raise
+            for table, packed in keys:
+                table.add(packed, amount)
+            self.rows += len(amount)
+            batch_last = int(day.max())
+            self.last_day = batch_last if self.last_day is None else max(self.last_day, batch_last)
+        return len(amount), rejected
+
+    def append_records(self, records: list[dict]) -> tuple[int, int]:
+        return self.append(pd.DataFrame.from_records(records))
+
+    def load_csv(self, path: str, chunksize: int = 250_000) -> int:
+        added = 0
+        for chunk in pd.read_csv(path, chunksize=chunksize):
+            added += self.append(chunk)[0]
+        return added
+
+    # ── Per-user queries ──────────────────────────────────────────────────────
+    def _as_of_day(self, as_of: Optional[date]) -> int:
+        if as_of is not None:
+            return int(np.datetime64(as_of, "D").astype(np.int64))
+        if self.last_day is not None:
+            return self.last_day
+        return int(np.datetime64(date.today(), "D").astype(np.int64))
+
+    def _rows(self, table: _Aggregate, user_id: str) -> slice:
+        code = self.users.get(user_id)
+        return slice(0, 0) if code is None else table.user_rows(code)
+
+    def category_totals(self, user_id: str, months: int = 6) -> dict[str, dict[str, float]]:
+        """{"2026-01": {"Food": 1234.0, ...}, ...} for the latest `months` months."""
+        rows = self._rows(self._monthly, user_id)
+        periods, items = self._monthly.periods(rows), self._monthly.items(rows)
+        spent = self._monthly.spent[rows]
+        recent = np.isin(periods, np.unique(periods)[-months:])
+        out: dict[str, dict[str, float]] = {}
+        for month, category, value in zip(periods[recent].tolist(), items[recent].tolist(), spent[recent].tolist()):
+            out.setdefault(month_label(month), {})[self.categories.names[category]] = round(value, 2)
+        return out
+
+    def rolling_average(self, user_id: str, window: int = 7, days: int = 30,
+                        as_of: Optional[date] = None) -> list[dict]:
+        """Daily spend and its trailing `window`-day mean for the last `days` days."""
+        rows = self._rows(self._daily, user_id)
+        if rows.start == rows.stop:
+            return []
+        end = self._as_of_day(as_of)
+        start = end - days - window + 2
+        periods, spent = self._daily.periods(rows), self._daily.spent[rows]
+        inside = (periods >= start) & (periods <= end)
+        dense = np.zeros(end - start + 1)
+        dense[periods[inside] - start] = spent[inside]
+        avg = pd.Series(dense).rolling(window, min_periods=1).mean().to_numpy()
+        return [
+            {"date": day_label(start + i), "spent": round(float(dense[i]), 2), "avg": round(float(avg[i]), 2)}
+            for i in range(len(dense) - days, len(dense))
+        ]
+
+    def top_merchants(self, user_id: str, k: int = 5, month: Optional[int] = None) -> list[dict]:
+        rows = self._rows(self._merchant_totals, user_id)
+        items = self._merchant_totals.items(rows)
+        spent, count = self._merchant_totals.spent[rows], self._merchant_totals.count[rows]
+        if month is not None:
+            keep = self._merchant_totals.periods(rows) == month
+            items, spent, count = items[keep], spent[keep], count[keep]
+        merchants, inverse = np.unique(items, return_inverse=True)
+        totals = np.bincount(inverse, weights=spent, minlength=len(merchants))
+        counts = np.bincount(inverse, weights=count, minlength=len(merchants))
+        top = np.argsort(-totals, kind="stable")[:k]
+        return [
+            {"merchant": self.merchants.names[merchants[i]], "spent": round(float(totals[i]), 2), "count": int(counts[i])}
+            for i in top
+        ]
+
+    def burn_rate(self, user_id: str, monthly_limit: float = 0.0,
+                  category_budgets: Optional[dict[str, float]] = None,
+                  as_of: Optional[date] = None) -> dict:
+        """Spend so far this month against the budget, and where the current pace ends up."""
+        day = self._as_of_day(as_of)
+        month = _month_of(day)
+        day_of_month, days_in_month = _month_position(day)
+
+        rows = self._rows(self._monthly, user_id)
+        current = self._monthly.periods(rows) == month
+        by_name = {
+            self.categories.names[c]: v
+            for c, v in zip(self._monthly.items(rows)[current].tolist(), self._monthly.spent[rows][current].tolist())
+        }
+
+        def burn(spent: float, limit: float) -> dict:
+            daily = spent / day_of_month
+            projected = daily * days_in_month
+            return {
+                "limit": limit,
+                "spent": round(spent, 2),
+                "daily_burn": round(daily, 2),
+                "projected": round(projected, 2),
+                "percent_used": round(spent / limit * 100, 1) if limit > 0 else 0.0,
+                "days_until_exhausted": round(max(limit - spent, 0.0) / daily, 1) if limit > 0 and daily > 0 else None,
+                "on_track": projected <= limit if limit > 0 else None,
+            }
+
+        return {
+            "month": month_label(month),
+            "as_of": day_label(day),
+            "day_of_month": day_of_month,
+            "days_in_month": days_in_month,
+            "total": burn(float(sum(by_name.values())), monthly_limit),
+            "categories": {
+                name: burn(by_name.get(name, 0.0), float(limit))
+                for name, limit in (category_budgets or {}).items()
+            },
+        }
+
+    def report(self, user_id: str, monthly_limit: float = 0.0,
+               category_budgets: Optional[dict[str, float]] = None, as_of: Optional[date] = None,
+               window: int = 7, days: int = 30, top_k: int = 5, months: int = 6) -> dict:
+        with self._lock:
+            return {
+                "user_id": user_id,
+                "known_user": self.users.get(user_id) is not None,
+                "category_totals": self.category_totals(user_id, months),
+                "rolling_average": self.rolling_average(user_id, window, days, as_of),
+                "top_merchants": self.top_merchants(user_id, top_k, _month_of(self._as_of_day(as_of))),
+                "burn_rate": self.burn_rate(user_id, monthly_limit, category_budgets, as_of),
+            }
+
+    # ── All-user queries (nightly jobs) ───────────────────────────────────────
+    def trailing_average_all(self, window: int = 7, as_of: Optional[date] = None) -> np.ndarray:
+        """Mean daily spend over the trailing window, indexed by user code."""
+        with self._lock:
+            end = self._as_of_day(as_of)
+            days = self._daily.periods()
+            recent = (days > end - window) & (days <= end)
+            totals = np.bincount(self._daily.users()[recent], weights=self._daily.spent[recent],
+                                 minlength=len(self.users.names))
+        return totals / window
+
+    def burn_rate_all(self, monthly_limits: np.ndarray, as_of: Optional[date] = None) -> pd.DataFrame:
+        """Vectorized burn for every user; `monthly_limits` is indexed by user code."""
+        with self._lock:
+            day = self._as_of_day(as_of)
+            current = self._monthly.periods() == _month_of(day)
+            spent = np.bincount(self._monthly.users()[current], weights=self._monthly.spent[current],
+                                minlength=len(self.users.names))
+            user_ids = list(self.users.names)
+        day_of_month, days_in_month = _month_position(day)
+        limits = np.asarray(monthly_limits, dtype=np.float64)
+        projected = spent / day_of_month * days_in_month
+        with np.errstate(divide="ignore", invalid="ignore"):
+            percent = np.where(limits > 0, spent / limits * 100, 0.0)
+        return pd.DataFrame({
+            "user_id": user_ids,
+            "spent": spent,
+            "limit": limits,
+            "daily_burn": spent / day_of_month,
+            "projected": projected,
+            "percent_used": percent,
+            "over_pace": (limits > 0) & (projected > limits),
+        })
+
+    def daily_series(self, days: int, as_of: Optional[date] = None,
+                     user_id: Optional[str] = None) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Dense daily spend for the `days` days ending at `as_of`: one row per
+        (user, category) with spend in the window, for one user or all of them.
+        Returns (user codes, category codes, matrix of shape rows × days).
+        """
+        with self._lock:
+            end = self._as_of_day(as_of)
+            start = end - days + 1
+            table = self._daily_categories
+            rows = slice(None) if user_id is None else self._rows(table, user_id)
+            periods = table.periods(rows)
+            inside = (periods >= start) & (periods <= end)
+            keys, spent = table.keys[rows][inside], table.spent[rows][inside]
+        # drop the day bits: user << 40 | category, still sorted by user
+        series, row = np.unique(keys & ~(_MASK << _PERIOD_SHIFT), return_inverse=True)
+        dense = np.zeros((len(series), days))
+        dense[row, periods[inside] - start] = spent
+        return series >> _USER_SHIFT, series & _MASK, dense
+
+    def stats(self) -> dict:
+        tables = {"monthly": self._monthly, "daily": self._daily, "merchants": self._merchant_totals,
+                  "categories": self._daily_categories}
+        return {
+            "rows": self.rows,
+            "users": len(self.users.names),
+            "categories": len(self.categories.names),
+            "merchants": len(self.merchants.names),
+            "last_day": day_label(self.last_day) if self.last_day is not None else None,
+            "groups": {name: len(t) for name, t in tables.items()},
+            "memory_bytes": sum(t.nbytes for t in tables.values()),
+        }
+
+
+# ── Benchmark ─────────────────────────────────────────────────────────────────
+def synthetic_transactions(rows: int, users: int, seed: int = 42, days: int = 365) -> pd.DataFrame:
+    """Vectorized generator: merchants and categories from generate_data.py."""
+    from generate_data import expand_merchants
+
+    rng = np.random.default_rng(seed)
+    by_category = expand_merchants()
+    merchant_names = np.array([m for names in by_category.values() for m in names])
+    merchant_cats = np.array([c for c, names in by_category.items() for _ in names])
+    user_ids = np.array([f"u{i}" for i in range(users)])
+    date_labels = pd.date_range("2026-01-01", periods=days).strftime(DATE_FORMAT).to_numpy()
+    pick = rng.integers(0, len(merchant_names), rows)
+    return pd.DataFrame({
+        "user_id": user_ids[rng.integers(0, users, rows)],
+        "amount": np.round(rng.lognormal(6.0, 1.0, rows), 2),
+        "merchant": merchant_names[pick],
+        "date": date_labels[rng.integers(0, days, rows)],
+        "category": merchant_cats[pick],
+    })
+
+
+def _timed(fn, *args, **kwargs):
+    t0 = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, (time.perf_counter() - t0) * 1000
+
+
+def benchmark(rows: int, users: int, append_rows: int, queries: int, seed: int) -> dict:
+    df, gen_ms = _timed(synthetic_transactions, rows, users, seed)
+    extra = synthetic_transactions(append_rows, users, seed + 1)
+
+    store = SpendingAnalytics()
+    _, load_ms = _timed(store.append, df)
+    _, append_ms = _timed(store.append, extra)
+
+    rng = np.random.default_rng(seed)
+    sample = [store.users.names[i] for i in rng.integers(0, len(store.users.names), queries)]
+    t0 = time.perf_counter()
+    for user in sample:
+        store.report(user, monthly_limit=20000, category_budgets={"Food": 5000, "Travel": 3000})
+    report_ms = (time.perf_counter() - t0) * 1000 / queries
+
+    _, trailing_ms = _timed(store.trailing_average_all, 7)
+    limits = np.full(len(store.users.names), 20000.0)
+    _, burn_all_ms = _timed(store.burn_rate_all, limits)
+
+    return {
+        "rows": rows,
+        "users": users,
+        "generate_ms": round(gen_ms, 1),
+        "initial_load_ms": round(load_ms, 1),
+        "initial_rows_per_sec": round(rows / load_ms * 1000),
+        "incremental_append_rows": append_rows,
+        "incremental_append_ms": round(append_ms, 1),
+        "report_ms_per_user": round(report_ms, 3),
+        "trailing_average_all_ms": round(trailing_ms, 1),
+        "burn_rate_all_ms": round(burn_all_ms, 1),
+        "store": store.stats(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--append-rows", type=int, default=10_000, help="size of the incremental batch")
+    parser.add_argument("--queries", type=int, default=200, help="per-user reports to time")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", default=None, help="report path (default artifacts/bench/...)")
+    args = parser.parse_args()
+
+    from utils import ensure_dir, save_json
+
+    result = benchmark(args.rows, args.users, args.append_rows, args.queries, args.seed)
+    timestamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
+    out = args.out or str(ensure_dir(BASE_DIR / "artifacts" / "bench") / f"analytics_{timestamp}.json")
+    save_json(result, out)
+    print(json.dumps(result, indent=2))
+    print(f"Report saved: {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""
+batch_planner.py — plan and execute large /predict/batch requests.
+
+A user's history repeats the same merchant many times, so a batch is reduced
+to its unique normalized merchants before anything is scored:
+
+  1. dedupe the raw strings, normalize each distinct one once
+  2. dedupe again on the normalized key ("Swiggy" / "SWIGGY" → "swiggy")
+  3. the caller scores only the keys its cache misses
+  4. results are scattered back to row order through `inverse`
+
+Large miss sets are split into shards and scored in worker processes that
+each hold their own copy of the model (ShardPool).
+
+Used by: main.py
+"""
+
+import math
+import multiprocessing
+import pickle
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+import numpy as np
+
+
+@dataclass
+class BatchPlan:
+    keys: list[str]             # unique normalized merchants
+    raw: list[str]              # one raw spelling per key (for rule fallback)
+    distinct_raw: list[str]     # every distinct raw string, first-seen order
+    raw_inverse: np.ndarray     # row i → index into distinct_raw
+    raw_to_key: np.ndarray      # distinct_raw j → index into keys
+
+    @property
+    def n_unique(self) -> int:
+        return len(self.keys)
+
+    @property
+    def inverse(self) -> np.ndarray:
+        """row i → index into keys"""
+        return self.raw_to_key[self.raw_inverse]
+
+
+def plan_batch(merchants: list[str], normalize: Callable[[str], str]) -> BatchPlan:
+    raw_index: dict[str, int] = {}
+    raw_inverse = np.fromiter(
+        (raw_index.setdefault(m, len(raw_index)) for m in merchants),
+        dtype=np.int64,
+        count=len(merchants),
+    )
+
+    key_index: dict[str, int] = {}
+    keys: list[str] = []
+    raw: list[str] = []
+    raw_to_key = np.empty(len(raw_index), dtype=np.int64)
+    for m, i in raw_index.items():
+        key = normalize(m)
+        k = key_index.get(key)
+        if k is None:
+            k = key_index[key] = len(keys)
+            keys.append(key)
+            raw.append(m)
+        raw_to_key[i] = k
+
+    return BatchPlan(
+        keys=keys,
+        raw=raw,
+        distinct_raw=list(raw_index),
+        raw_inverse=raw_inverse,
+        raw_to_key=raw_to_key,
+    )
+
+
+# ── Worker processes ──────────────────────────────────────────────────────────
+_worker_model = None
+
+
+def _worker_init(model_blob: bytes, ready) -> None:
+    global _worker_model
+    _worker_model = pickle.loads(model_blob)
+    with ready.get_lock():
+        ready.value += 1
+
+
+def _score_shard(keys: list[str]) -> tuple[list[str], np.ndarray]:
+    proba = _worker_model.predict_proba(keys)
+    idx = np.argmax(proba, axis=1)
+    classes = np.asarray(_worker_model.classes_)
+    return classes[idx].tolist(), proba[np.arange(len(keys)), idx]
+
+
+class ShardPool:
+    """
+    Process pool bound to one model version. Workers receive the pickled
+    in-memory model — never the file, which training may have overwritten
+    since that version was loaded — and unpickle it once at start-up; a reload
+    to a different version replaces the pool. Workers are started by a fork
+    server: forking the multi-threaded service directly could copy a lock
+    some other thread holds (logging, sqlite, BLAS) and hang the child.
+    """
+
+    def __init__(self, workers: int, shard_size: int):
+        self.workers = workers
+        self.shard_size = shard_size
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._version: Optional[str] = None
+        self._ready = None          # shared count of workers that have unpickled the model
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.workers > 0
+
+    def _ensure(self, pipeline, version: str) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None or self._version != version:
+                self.shutdown()
+                context = multiprocessing.get_context("forkserver")
+                self._ready = context.Value("i", 0)
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=context,
+                    initializer=_worker_init,
+                    initargs=(pickle.dumps(pipeline), self._ready),
+                )
+                self._version = version
+            return self._pool
+
+    def warm(self, pipeline, version: str, timeout: float = 60.0) -> int:
+        """
+        Start every worker for `version` and wait (up to `timeout`) until each
+        has unpickled it, so the first large batch does not pay for that.
+        Returns the number of workers ready.
+        """
+        pool = self._ensure(pipeline, version)
+        ready = self._ready
+        # Workers are started on demand; tasks submitted together, before any
+        # worker is idle, start one process each
+        list(pool.map(abs, range(self.workers)))
+        deadline = time.monotonic() + timeout
+        while ready.value < self.workers and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return ready.value
+
+    def score(self, keys: list[str], pipeline, version: str) -> tuple[list[str], np.ndarray]:
+        """Score keys with `pipeline`, the in-memory model whose content hash is `version`."""
+        pool = self._ensure(pipeline, version)
+        n_shards = max(self.workers, math.ceil(len(keys) / self.shard_size))
+        step = math.ceil(len(keys) / n_shards)
+        shards = [keys[i:i + step] for i in range(0, len(keys), step)]
+
+        categories: list[str] = []
+        confidences = []
+        for cats, confs in pool.map(_score_shard, shards):
+            categories.extend(cats)
+            confidences.append(confs)
+        return categories, np.concatenate(confidences)
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+        self._pool = None
+        self._version = None
+        self._ready = None
@@ -0,0 +1,130 @@
+"""
+bench_transport.py — HTTP/JSON vs Unix-socket/msgpack for backend → ML calls.
+
+Starts main.py with both transports enabled (or uses a running one) and
+replays SMS from bank_sms_data.csv three ways:
+
+  http        — keep-alive HTTP/1.1 + JSON, one request at a time (what
+                mlFetch does, minus the new-connection cost)
+  uds         — same requests over the socket, one at a time
+  uds_pipe    — over the socket with --window requests in flight
+
+Usage:
+  python bench_transport.py --requests 2000 --window 32
+"""
+
+import argparse
+import http.client
+import json
+import os
+import time
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from load_test import spawn_server
+from uds_server import UdsClient
+from utils import ensure_dir, save_json
+
+BASE_DIR = Path(__file__).parent
+
+
+def _stats(latencies_ms: list[float], elapsed: float, n: int) -> dict:
+    arr = np.asarray(latencies_ms)
+    return {
+        "requests": n,
+        "throughput_rps": round(n / elapsed, 1),
+        "p50_ms": round(float(np.percentile(arr, 50)), 4),
+        "p99_ms": round(float(np.percentile(arr, 99)), 4),
+        "mean_ms": round(float(arr.mean()), 4),
+    }
+
+
+def bench_http(port: int, texts: list[str]) -> dict:
+    conn = http.client.HTTPConnection("127.0.0.1", port)
+    headers = {"Content-Type": "application/json"}
+    latencies = []
+    start = time.perf_counter()
+    for text in texts:
+        t0 = time.perf_counter()
+        conn.request("POST", "/predict/sms", json.dumps({"sms_text": text}), headers)
+        resp = conn.getresponse()
+        json.loads(resp.read())
+        latencies.append((time.perf_counter() - t0) * 1000)
+    elapsed = time.perf_counter() - start
+    conn.close()
+    return _stats(latencies, elapsed, len(texts))
+
+
+def bench_uds(path: str, texts: list[str]) -> dict:
+    client = UdsClient(path)
+    latencies = []
+    start = time.perf_counter()
+    for text in texts:
+        t0 = time.perf_counter()
+        client.call("sms", sms_text=text)
+        latencies.append((time.perf_counter() - t0) * 1000)
+    elapsed = time.perf_counter() - start
+    client.close()
+    return _stats(latencies, elapsed, len(texts))
+
+
+def bench_uds_pipelined(path: str, texts: list[str], window: int) -> dict:
+    client = UdsClient(path)
+    latencies = []
+    start = time.perf_counter()
+    for i in range(0, len(texts), window):
+        chunk = texts[i:i + window]
+        t0 = time.perf_counter()
+        client.pipeline([("sms", {"sms_text": t}) for t in chunk])
+        # Per-request latency inside a window is bounded by the window's time
+        latencies.extend([(time.perf_counter() - t0) * 1000] * len(chunk))
+    elapsed = time.perf_counter() - start
+    client.close()
+    return _stats(latencies, elapsed, len(texts))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8011)
+    parser.add_argument("--uds-path", default="/tmp/expenseiq-ml-bench.sock")
+    parser.add_argument("--no-spawn", action="store_true", help="use an already running service")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--window", type=int, default=32)
+    parser.add_argument("--warmup", type=int, default=200)
+    args = parser.parse_args()
+
+    df = pd.read_csv(BASE_DIR / "bank_sms_data.csv")
+    texts = df["sms_text"].astype(str).tolist()
+    texts = (texts * (args.requests // len(texts) + 1))[:args.requests]
+
+    server = None
+    if not args.no_spawn:
+        os.environ["ML_UDS_PATH"] = args.uds_path
+        server = spawn_server(args.port, workers=1)
+    try:
+        bench_http(args.port, texts[:args.warmup])
+        bench_uds(args.uds_path, texts[:args.warmup])
+        results = {
+            "http": bench_http(args.port, texts),
+            "uds": bench_uds(args.uds_path, texts),
+            "uds_pipe": bench_uds_pipelined(args.uds_path, texts, args.window),
+        }
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=10)
+
+    report = {"settings": vars(args), "results": results}
+    timestamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
+    out = ensure_dir(BASE_DIR / "artifacts" / "bench") / f"transport_{timestamp}.json"
+    save_json(report, str(out))
+    for name, r in results.items():
+        print(f"{name:9}  {r['throughput_rps']:>9.1f} req/s   p50 {r['p50_ms']:.3f}ms   p99 {r['p99_ms']:.3f}ms")
+    print(f"Report saved: {out}")
+
+
+if __name__ == "__main__":
+    main()
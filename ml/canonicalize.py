@@ -0,0 +1,304 @@
+"""
+canonicalize.py — map noisy SMS merchant strings onto known merchants.
+
+Banks decorate merchant names: "SWIGGY*ORDER 8837", "Zomato Ltd Bangalore",
+"AMAZON PAY INDIA". Every spelling is a different cache key, a different
+batch-dedup key and a different TF-IDF vector. This stage runs after
+normalization and rewrites the key to the known merchant it names, so all
+spellings share one cache entry and one model input.
+
+Known merchants are the normalized training merchants (train_model.py
+writes known_merchants.json next to expense_model.pkl). They are indexed by
+padded character trigrams. Multi-word names are also indexed without their
+spaces ("CAFECOFFEEDAY*ORDER"). A query is matched in two steps:
+
+  candidates   every run of up to `max_span` words is scored against the
+               index with the Dice coefficient
+                 2·|shared trigrams| / (|run trigrams| + |merchant trigrams|)
+               and merchants at or above `threshold` are kept
+  verify       the run, spaces removed, must be within a small edit distance
+               of the merchant (none up to 4 letters, 1 up to 9, 2 beyond),
+               so "zomatto" matches but "reliance digital" does not become
+               "reliance fresh"
+
+The words outside the run may only be bank decoration: corporate suffixes,
+payment words, cities and tokens with digits (NOISE_WORDS), and never a word
+of a known merchant. "Zomato Ltd Bangalore" is zomato, while "Uber Eats" and
+"Hotstar Hotel" stay as they are. The closest merchant wins; a tie between
+two merchants is ambiguous and passes through, like anything unmatched.
+
+Results are memoized per normalized string, so repeated spellings cost one
+dict lookup. Only model and cache inputs are canonicalized; per-user overrides
+keep the user's own spelling.
+
+Usage (benchmark on noisy variants of bank_sms_data.csv merchants):
+  python canonicalize.py
+
+Used by: main.py (_merchant_key)
+"""
+
+import json
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Callable, Optional
+
+MAX_POSTINGS = 2000         # trigrams shared by more merchants than this are skipped
+
+# What banks and gateways put around a merchant name. Only these, and tokens
+# containing digits, may be dropped around a match: any other word could be
+# the part that makes it a different merchant ("Uber Eats", "Metro Cash and Carry").
+NOISE_WORDS = frozenset({
+    "ltd", "limited", "pvt", "private", "llp", "inc", "corp", "co", "company",
+    "india", "pay", "payment", "payments", "upi", "pos", "ecom", "online", "order", "orders",
+    "www", "com", "razorpay", "payu", "billdesk", "ccavenue", "cashfree",
+    "bangalore", "bengaluru", "mumbai", "new", "delhi", "pune", "chennai", "hyderabad",
+    "kolkata", "gurgaon", "gurugram", "noida", "ahmedabad", "jaipur",
+})
+
+
+def _trigrams(text: str) -> set[str]:
+    padded = f" {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _edit_budget(name: str) -> int:
+    return 0 if len(name) <= 4 else 1 if len(name) <= 9 else 2
+
+
+def _within(a: str, b: str, k: int) -> Optional[int]:
+    """Levenshtein distance between a and b if it is at most k, else None."""
+    if abs(len(a) - len(b)) > k:
+        return None
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        if min(current) > k:
+            return None
+        previous = current
+    return previous[-1] if previous[-1] <= k else None
+
+
+def _droppable(word: str) -> bool:
+    return word in NOISE_WORDS or any(ch.isdigit() for ch in word)
+
+
+def load_known_merchants(path: str, fallback_csv: str, normalize: Callable[[str], str]) -> list[str]:
+    """known_merchants.json if present, else the true_merchant column of the training CSV."""
+    if Path(path).exists():
+        with open(path) as f:
+            return [m for m in json.load(f) if m]
+    if Path(fallback_csv).exists():
+        import pandas as pd
+
+        merchants = pd.read_csv(fallback_csv, usecols=["true_merchant"])["true_merchant"].dropna()
+        return sorted({normalize(str(m)) for m in merchants} - {""})
+    return []
+
+
+class MerchantCanonicalizer:
+    """Trigram index over normalized known merchants, with a memo in front."""
+
+    def __init__(self, merchants: list[str], threshold: float = 0.5, max_memo: int = 100_000):
+        self.threshold = threshold
+        self.max_memo = max_memo
+        self.names = sorted(set(merchants))
+        # indexed spelling → known merchant: each name, plus multi-word names without spaces
+        self._known = {name: name for name in self.names}
+        self._known.update({name.replace(" ", ""): name for name in self.names if " " in name})
+        self._known_words = {w for spelling in self._known for w in spelling.split()}
+        self._entries = list(self._known.items())
+        self._sizes = []
+        postings: dict[str, list[int]] = {}
+        for i, (spelling, _) in enumerate(self._entries):
+            grams = _trigrams(spelling)
+            self._sizes.append(len(grams))
+            for g in grams:
+                postings.setdefault(g, []).append(i)
+        self._postings = {g: ids for g, ids in postings.items() if len(ids) <= MAX_POSTINGS}
+        self.max_span = max((len(name.split()) for name in self.names), default=1)
+        self._memo: dict[str, str] = {}
+        self.outcomes: Counter = Counter()
+        self._matched: set[str] = set()     # known merchants that queries mapped to
+        self._passthrough = 0               # distinct unmatched queries (memo misses)
+
+    def canonical(self, key: str) -> str:
+        """Known merchant that `key` (already normalized) names, or `key` itself."""
+        hit = self._memo.get(key)
+        if hit is not None:
+            self.outcomes["memo_hit"] += 1
+            return hit
+        result = self._resolve(key)
+        if len(self._memo) >= self.max_memo:
+            self._memo.clear()
+        self._memo[key] = result
+        return result
+
+    def _resolve(self, key: str) -> str:
+        name = self._known.get(key)
+        if name is not None:
+            self.outcomes["exact" if name == key else "matched"] += 1
+            self._matched.add(name)
+            return name
+        words = key.split()
+        best: Optional[tuple[int, str]] = None
+        ambiguous = False
+        for start in range(len(words)):
+            for end in range(start + 1, min(start + self.max_span, len(words)) + 1):
+                outside = words[:start] + words[end:]
+                if not all(_droppable(w) and w not in self._known_words for w in outside):
+                    continue
+                for distance, name in self._candidates(" ".join(words[start:end])):
+                    if best is None or distance < best[0]:
+                        best, ambiguous = (distance, name), False
+                    elif distance == best[0] and name != best[1]:
+                        ambiguous = True
+        if best is None or ambiguous:
+            self.outcomes["ambiguous" if ambiguous else "no_match"] += 1
+            self._passthrough += 1
+            return key
+        self.outcomes["matched"] += 1
+        self._matched.add(best[1])
+        return best[1]
+
+    def _candidates(self, span: str) -> list[tuple[int, str]]:
+        """(edit distance, name) of the known merchants one word run nearly spells."""
+        name = self._known.get(span)
+        if name is not None:
+            return [(0, name)]
+        grams = _trigrams(span)
+        shared: Counter = Counter()
+        for g in grams:
+            ids = self._postings.get(g)
+            if ids is not None:
+                shared.update(ids)
+        compact = span.replace(" ", "")
+        found = []
+        for i, n in shared.items():
+            if 2 * n / (len(grams) + self._sizes[i]) < self.threshold:
+                continue
+            spelling, name = self._entries[i]
+            target = spelling.replace(" ", "")
+            distance = _within(compact, target, _edit_budget(target))
+            if distance is not None:
+                found.append((distance, name))
+        return found
+
+    def stats(self) -> dict:
+        outcomes = dict(self.outcomes)
+        resolved = outcomes.get("exact", 0) + outcomes.get("matched", 0)
+        computed = resolved + outcomes.get("no_match", 0) + outcomes.get("ambiguous", 0)
+        lookups = computed + outcomes.get("memo_hit", 0)
+        # Hit rate an unbounded cache keyed on the raw vs the canonical key
+        # would reach over the same lookups: every distinct key misses once
+        distinct_out = len(self._matched) + self._passthrough
+        return {
+            "known_merchants": len(self.names),
+            "threshold": self.threshold,
+            "memo_entries": len(self._memo),
+            "lookups": lookups,
+            # distinct spellings that resolved to a known merchant
+            "canonical_hit_rate": round(resolved / computed, 4) if computed else 0.0,
+            "rewritten": outcomes.get("matched", 0),
+            "distinct_keys": {"raw": computed, "canonical": distinct_out},
+            "cache_hit_rate_bound": {
+                "raw": round(1 - computed / lookups, 4) if lookups else 0.0,
+                "canonical": round(1 - distinct_out / lookups, 4) if lookups else 0.0,
+            },
+            "outcomes": outcomes,
+        }
+
+
+# Real merchants that are not in the training catalogue; several share a word
+# or most of their letters with one that is. None should be rewritten.
+OUTSIDE_CATALOGUE = [
+    "Reliance Digital", "Reliance Jio", "Uber Eats", "Metro Cash and Carry", "HM Traders",
+    "Spencer Hotel", "Hotstar Hotel", "Amazon Fresh", "Zara Home", "Ola Electric",
+    "Indigo Paints", "Subway Surfers", "Croma Cafe", "Decathlon Sports Club", "Nike Golf Club",
+    "Lenskart", "Nykaa", "Tata Cliq", "Vijay Sales", "Pantaloons", "Westside", "Cult Fit",
+    "Urban Company", "PhonePe", "Dunzo", "Zepto", "Barbeque Nation", "Chaayos", "Big Bazaar",
+    "Bata", "Uniqlo", "Shoppers Stop", "Airtel", "Jio Mart", "Apollo Hospital",
+]
+
+
+def _noisy(name: str, rng) -> str:
+    """One bank-style spelling of a merchant name."""
+    form = rng.integers(7)
+    if form == 0:
+        return name.upper()
+    if form == 1:
+        return f"{name.upper().replace(' ', '')}*ORDER {rng.integers(1000, 9999)}"
+    if form == 2:
+        return f"{name} Ltd {rng.choice(['Bangalore', 'Mumbai', 'Delhi', 'Pune'])}"
+    if form == 3:
+        return f"{name.upper()} PAY INDIA"
+    if form == 4:
+        return f"{name} Pvt Ltd"
+    if form == 5 and len(name) > 4:             # one dropped or doubled letter
+        i = int(rng.integers(1, len(name) - 1))
+        return name[:i] + name[i + 1:] if rng.integers(2) else name[:i] + name[i] + name[i:]
+    return name
+
+
+def main():
+    """
+    Noisy merchant stream: how often known merchants are mapped correctly
+    (recall), how often merchants outside the catalogue are wrongly rewritten
+    (precision), speed, and LRU cache hit rates.
+    """
+    import numpy as np
+    import pandas as pd
+
+    from prediction_cache import LRUCache
+    from utils import normalize_text
+
+    here = Path(__file__).parent
+    truth = pd.read_csv(here / "bank_sms_data.csv")["true_merchant"].dropna().astype(str)
+    known = sorted({normalize_text(m) for m in truth})
+    canon = MerchantCanonicalizer(known)
+
+    rng = np.random.default_rng(0)
+    names = sorted(set(truth))
+    weights = 1 / np.arange(1, len(names) + 1)      # Zipf-ish popularity
+    picks = rng.choice(len(names), size=50_000, p=weights / weights.sum())
+    stream = [(names[i], _noisy(names[i], rng)) for i in picks]
+
+    t0 = time.perf_counter()
+    keys = [canon.canonical(normalize_text(raw)) for _, raw in stream]
+    total_s = time.perf_counter() - t0
+    correct = sum(k == normalize_text(name) for (name, _), k in zip(stream, keys))
+
+    cold = MerchantCanonicalizer(known)
+    distinct = list({normalize_text(raw) for _, raw in stream})
+    t0 = time.perf_counter()
+    for key in distinct:
+        cold.canonical(key)
+    cold_us = (time.perf_counter() - t0) / len(distinct) * 1e6
+
+    def hit_rate(key_fn, size: int = 500) -> float:
+        cache = LRUCache(max_entries=size)
+        for _, raw in stream:
+            key = key_fn(raw)
+            if cache.get("v", key) is None:
+                cache.put("v", key, ("x", 1.0))
+        return cache.stats()["hit_rate"]
+
+    outside = [_noisy(name, rng) for name in OUTSIDE_CATALOGUE for _ in range(20)]
+    rewritten = [raw for raw in outside if canon.canonical(normalize_text(raw)) in set(known)]
+
+    print(f"lookups:              {len(stream):,}  ({len(distinct):,} distinct spellings)")
+    print(f"mapped correctly:     {correct / len(stream):.2%}")
+    print(f"outside catalogue:    {len(outside):,} lookups, {len(rewritten)} rewritten onto a known merchant "
+          f"(precision {1 - len(rewritten) / len(outside):.2%})")
+    for raw in sorted(set(rewritten))[:10]:
+        print(f"  {raw!r} → {canon.canonical(normalize_text(raw))!r}")
+    print(f"uncached lookup:      {cold_us:.1f} µs   all lookups: {total_s / len(stream) * 1e6:.2f} µs avg")
+    print(f"LRU(500) hit rate:    raw {hit_rate(normalize_text):.2%}  →  canonical "
+          f"{hit_rate(lambda raw: canon.canonical(normalize_text(raw))):.2%}")
+    print(canon.stats())
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,7 @@
+import pickle
 import random
 import time
+import tracemalloc
 
 import numpy as np
 import pandas as pd
@@ -10,6 +12,8 @@ from sklearn.metrics import accuracy_score, classification_report
 from sklearn.model_selection import train_test_split
 from sklearn.pipeline import Pipeline
 
+from train_model import build_pipeline
+
 print("\nSIDE-BY-SIDE MODEL COMPARISON (parsed_transactions.csv, merchant)\n")
 
 # -----------------------------
@@ -26,7 +30,14 @@ print(f"Unique merchants: {X.nunique()}")
 # -----------------------------
 # 2) DEFINE MODELS
 # -----------------------------
+HASH_BUCKETS = 2 ** 16
+LATENCY_SAMPLES = 500
+
 models = {
+    "Current Pipeline (TF-IDF Word 1-2)": build_pipeline(),
+    f"Logistic Regression (Hashing {HASH_BUCKETS} buckets)": build_pipeline(
+        {"featurizer": "hashing", "hash_buckets": HASH_BUCKETS}
+    ),
     "Logistic Regression (TF-IDF Char+Word)": Pipeline(
         [
             (
@@ -65,6 +76,28 @@ models = {
 
 results = {}
 
+
+def single_row_latency_ms(model, samples):
+    """Per-request latency the service sees: one predict_proba call per merchant."""
+    timings = []
+    for text in samples:
+        start = time.perf_counter()
+        model.predict_proba([text])
+        timings.append((time.perf_counter() - start) * 1000)
+    return float(np.percentile(timings, 50)), float(np.percentile(timings, 99))
+
+
+def load_footprint(model):
+    """Pickle size, unpickle time and peak Python heap while loading."""
+    blob = pickle.dumps(model)
+    tracemalloc.start()
+    start = time.perf_counter()
+    pickle.loads(blob)
+    load_ms = (time.perf_counter() - start) * 1000
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return len(blob), load_ms, peak
+
 # -----------------------------
 # 3) TRAIN & EVALUATE
 # -----------------------------
@@ -85,16 +118,26 @@ for name, model in models.items():
     inference_time = time.time() - start
 
     accuracy = accuracy_score(y_test, predictions)
+    p50_ms, p99_ms = single_row_latency_ms(model, X_test.iloc[:LATENCY_SAMPLES].tolist())
+    pickle_bytes, load_ms, load_peak = load_footprint(model)
 
     results[name] = {
         "accuracy": float(accuracy),
         "train_time": float(train_time),
         "inference_time": float(inference_time),
+        "p50_ms": p50_ms,
+        "p99_ms": p99_ms,
+        "pickle_bytes": pickle_bytes,
+        "load_ms": load_ms,
+        "load_peak_bytes": load_peak,
     }
 
     print(f"Accuracy: {accuracy * 100:.2f}%")
     print(f"Training Time: {train_time:.2f}s")
     print(f"Inference Time: {inference_time:.4f}s")
+    print(f"Single-row Latency: p50 {p50_ms:.3f}ms | p99 {p99_ms:.3f}ms")
+    print(f"Model Size: {pickle_bytes / 1024:.1f} KB | Load: {load_ms:.1f}ms, "
+          f"peak {load_peak / 1024:.1f} KB")
 
     print("\nClassification Report:")
     print(classification_report(y_test, predictions))
@@ -111,5 +154,8 @@ for name, metrics in results.items():
     print(f"Accuracy        : {metrics['accuracy'] * 100:.2f}%")
     print(f"Training Time   : {metrics['train_time']:.2f}s")
     print(f"Inference Time  : {metrics['inference_time']:.4f}s")
+    print(f"Latency p50/p99 : {metrics['p50_ms']:.3f}ms / {metrics['p99_ms']:.3f}ms")
+    print(f"Model Size      : {metrics['pickle_bytes'] / 1024:.1f} KB")
+    print(f"Load Time/Peak  : {metrics['load_ms']:.1f}ms / {metrics['load_peak_bytes'] / 1024:.1f} KB")
 
 print("\nCOMPARISON COMPLETE\n")
@@ -0,0 +1,144 @@
+"""
+compression.py — post-training compression for TF-IDF / hashing + linear pipelines.
+
+Prunes low-weight n-grams from the vectorizer vocabulary and the classifier
+coefficients (TF-IDF only — a hashing vectorizer has no vocabulary, so its
+models are quantized but never pruned), and optionally stores the coefficients as float16 or int8 with
+per-class scales. The result is still a sklearn Pipeline, so main.py serves it
+exactly like an uncompressed model (this module just has to be importable).
+
+Used by: train_model.py (--compress), main.py (when unpickling)
+"""
+
+import numpy as np
+from sklearn.base import BaseEstimator, ClassifierMixin
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.pipeline import Pipeline
+
+SUPPORTED_DTYPES = ("float32", "float16", "int8")
+
+
+class QuantizedLinearClassifier(ClassifierMixin, BaseEstimator):
+    """
+    Inference-only stand-in for a fitted LogisticRegression.
+
+    Weights are stored transposed, shape (n_features, n_classes), so scoring a
+    sparse row only gathers the weight rows of its non-zero features instead
+    of up-casting the whole matrix on every call.
+    """
+
+    def __init__(self, weights, scales, intercept, classes):
+        self.weights = weights        # (n_features, n_cols) float32 | float16 | int8
+        self.scales = scales          # (n_cols,) float32, or None for float weights
+        self.intercept = intercept    # (n_cols,) float32
+        self.classes = classes
+
+    @property
+    def classes_(self):
+        return self.classes
+
+    def __sklearn_is_fitted__(self):
+        return True
+
+    def fit(self, X, y=None):
+        raise TypeError("QuantizedLinearClassifier is inference-only and cannot be refitted; "
+                        "fit the uncompressed pipeline and run compress_pipeline on it instead")
+
+    def decision_function(self, X):
+        X = X.tocsr()
+        n_rows = X.shape[0]
+        contrib = self.weights[X.indices].astype(np.float32) * X.data[:, None].astype(np.float32)
+        row_ids = np.repeat(np.arange(n_rows), np.diff(X.indptr))
+        scores = np.zeros((n_rows, self.weights.shape[1]), dtype=np.float32)
+        np.add.at(scores, row_ids, contrib)
+        if self.scales is not None:
+            scores *= self.scales
+        scores += self.intercept
+        return scores
+
+    def predict_proba(self, X):
+        scores = self.decision_function(X).astype(np.float64)
+        if scores.shape[1] == 1:
+            # Binary LogisticRegression keeps a single coefficient row
+            pos = 1.0 / (1.0 + np.exp(-scores[:, 0]))
+            return np.column_stack([1.0 - pos, pos])
+        scores -= scores.max(axis=1, keepdims=True)
+        np.exp(scores, out=scores)
+        scores /= scores.sum(axis=1, keepdims=True)
+        return scores
+
+    def predict(self, X):
+        return self.classes[np.argmax(self.predict_proba(X), axis=1)]
+
+
+def quantize(coef: np.ndarray, dtype: str) -> tuple[np.ndarray, np.ndarray | None]:
+    """Quantize a (n_classes, n_features) matrix. Returns transposed weights + scales."""
+    if dtype not in SUPPORTED_DTYPES:
+        raise ValueError(f"dtype must be one of {SUPPORTED_DTYPES}, got {dtype!r}")
+
+    weights = np.ascontiguousarray(coef.T, dtype=np.float32)
+    if dtype != "int8":
+        return weights.astype(dtype), None
+
+    # Symmetric per-class scale: the largest |weight| of each class maps to 127
+    scales = np.abs(weights).max(axis=0) / 127.0
+    scales[scales == 0] = 1.0
+    q = np.clip(np.rint(weights / scales), -127, 127).astype(np.int8)
+    return q, scales.astype(np.float32)
+
+
+def prune_vectorizer(vectorizer: TfidfVectorizer, keep: np.ndarray) -> TfidfVectorizer:
+    """
+    A new TfidfVectorizer with the same settings, restricted to feature
+    indices `keep`. It is built fresh and given only the public fitted
+    attributes (vocabulary_, idf_), so stop_words_, which is only kept for
+    introspection and can be as large as the vocabulary, is not carried over.
+    """
+    remap = {int(old): new for new, old in enumerate(keep)}
+    pruned = TfidfVectorizer(**vectorizer.get_params())
+    pruned.vocabulary_ = {
+        term: remap[idx] for term, idx in vectorizer.vocabulary_.items() if idx in remap
+    }
+    if vectorizer.use_idf:
+        pruned.idf_ = vectorizer.idf_[keep]
+    return pruned
+
+
+def compress_pipeline(model: Pipeline, keep_fraction: float = 1.0,
+                      min_weight: float = 0.0, dtype: str = "int8") -> Pipeline:
+    """
+    Compress a fitted (vectorizer, linear classifier) Pipeline.
+
+    A feature is kept when its largest |coefficient| across classes is at
+    least `min_weight` and it ranks within the top `keep_fraction` of features.
+    """
+    vectorizer = model.steps[0][1]
+    classifier = model.steps[-1][1]
+    coef = np.asarray(classifier.coef_)
+    intercept = np.asarray(classifier.intercept_, dtype=np.float32)
+
+    if hasattr(vectorizer, "vocabulary_"):
+        importance = np.abs(coef).max(axis=0)
+        n_keep = max(1, int(round(len(importance) * keep_fraction)))
+        keep = np.argsort(-importance, kind="stable")[:n_keep]
+        keep = np.sort(keep[importance[keep] >= min_weight])
+        if len(keep) == 0:
+            raise ValueError("Pruning removed every feature — lower min_weight or raise keep_fraction")
+        vectorizer = prune_vectorizer(vectorizer, keep)
+        coef = coef[:, keep]
+
+    weights, scales = quantize(coef, dtype)
+    return Pipeline(
+        steps=[
+            (model.steps[0][0], vectorizer),
+            (
+                model.steps[-1][0],
+                QuantizedLinearClassifier(
+                    weights=weights,
+                    scales=scales,
+                    intercept=intercept,
+                    classes=np.asarray(classifier.classes_),
+                )
+            ),
+        ]
+    )
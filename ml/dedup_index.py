@@ -0,0 +1,209 @@
+"""
+dedup_index.py — recently seen transactions, for dropping double SMS.
+
+One payment often produces two SMS (the UPI app's and the bank's alert).
+Each parsed debit is reduced to fingerprints and looked up in a rotating
+Bloom filter before the model is called. Lookups do not record anything: the
+caller records a debit (record) only after it has stored the expense, so a
+save that fails and is retried is not answered as a duplicate.
+
+  reference key   (user, amount, reference number)   when the SMS has one
+  merchant key    (user, amount, normalized merchant, date)
+
+A message with a reference is a duplicate if that reference was seen, or if
+the same merchant key came from a message *without* one (the other half of
+a pair). A message without a reference is a duplicate if the merchant key
+was seen at all. So two different payments that carry their own references
+are never merged. Two reference-less payments of the same amount, at the same
+merchant, on the same day, inside the window, are — that is the trade-off.
+
+The index is `generations` Bloom filters that together cover `window_s`
+seconds. New keys go into the newest filter; when its slice of the window
+is over, the oldest filter is dropped. Memory is fixed: `memory_bytes` split
+evenly across the generations, with the hash count chosen for
+`expected_per_window` keys.
+
+False-positive rate is reported two ways: estimated from the filters'
+current fill, and measured — keys whose hash falls in a 1/64 sample are also
+kept in an exact dict, and Bloom answers for them are checked against it.
+
+The index lives in one process. With several uvicorn workers each has its
+own, and a duplicate that lands on a different worker than the recorded
+debit is not caught.
+
+Used by: main.py (/predict/sms with user_id, /dedup/record, /admin/dedup)
+"""
+
+import hashlib
+import math
+import re
+import threading
+import time
+from collections import Counter, deque
+from typing import Optional
+
+_REF_RE = re.compile(
+    r"\b(?:ref(?:erence)?|txn|utr|rrn|upi\s*ref)\.?\s*(?:no\.?|id|#)?\s*[:.\-]?\s*([A-Za-z0-9]*\d[A-Za-z0-9]{5,})",
+    re.IGNORECASE,
+)
+SAMPLE_EVERY = 64           # 1 in SAMPLE_EVERY keys is also kept exactly
+
+
+def reference(text: str) -> Optional[str]:
+    """Bank / UPI reference number in the SMS, if any."""
+    m = _REF_RE.search(text)
+    return m.group(1).upper() if m else None
+
+
+def _hashes(key: str) -> tuple[int, int]:
+    digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+    return int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little") | 1
+
+
+class _Bloom:
+    __slots__ = ("bits", "array", "started", "added")
+
+    def __init__(self, nbytes: int, started: float):
+        self.bits = nbytes * 8
+        self.array = bytearray(nbytes)
+        self.started = started
+        self.added = 0
+
+    def __contains__(self, positions: list[int]) -> bool:
+        array = self.array
+        return all(array[p >> 3] & (1 << (p & 7)) for p in positions)
+
+    def add(self, positions: list[int]) -> None:
+        array = self.array
+        for p in positions:
+            array[p >> 3] |= 1 << (p & 7)
+        self.added += 1
+
+    def fill(self) -> float:
+        return int.from_bytes(self.array, "little").bit_count() / self.bits
+
+
+class DedupIndex:
+    def __init__(self, memory_bytes: int = 4 << 20, window_s: float = 6 * 3600,
+                 generations: int = 6, expected_per_window: int = 200_000):
+        self.window_s = window_s
+        self.generations = max(1, generations)
+        self.span_s = window_s / self.generations
+        self.nbytes = max(64, memory_bytes // self.generations)
+        per_generation = max(1, expected_per_window // self.generations)
+        # optimal hash count for the expected load: k = m/n · ln 2
+        self.k = max(1, min(16, round(self.nbytes * 8 / per_generation * math.log(2))))
+        self._filters: deque[_Bloom] = deque([_Bloom(self.nbytes, time.time())])
+        self._exact: dict[str, float] = {}      # sampled keys → time added
+        self._lock = threading.Lock()
+        self.outcomes: Counter = Counter()
+        self.sampled_negatives = 0
+        self.sampled_false_positives = 0
+
+    def _rotate(self, now: float) -> None:
+        if now - self._filters[-1].started < self.span_s:
+            return
+        self._filters.append(_Bloom(self.nbytes, now))
+        # a filter expires once the one after it started (its last key) left the window
+        while len(self._filters) > self.generations or (
+                len(self._filters) > 1 and self._filters[1].started <= now - self.window_s):
+            self._filters.popleft()
+        horizon = self._filters[0].started
+        self._exact = {key: t for key, t in self._exact.items() if t >= horizon}
+
+    def _positions(self, key: str) -> tuple[list[int], bool]:
+        h1, h2 = _hashes(key)
+        bits = self.nbytes * 8
+        return [(h1 + i * h2) % bits for i in range(self.k)], h1 % SAMPLE_EVERY == 0
+
+    def _seen(self, key: str) -> bool:
+        positions, sampled = self._positions(key)
+        hit = any(positions in f for f in self._filters)
+        if sampled:
+            if key not in self._exact:
+                self.sampled_negatives += 1
+                self.sampled_false_positives += hit
+        return hit
+
+    def _add(self, key: str, now: float) -> None:
+        positions, sampled = self._positions(key)
+        self._filters[-1].add(positions)
+        if sampled:
+            self._exact[key] = now
+
+    @staticmethod
+    def _fingerprints(user_id: str, amount: str, merchant: str, sms_date: Optional[str],
+                      ref: Optional[str]) -> Optional[tuple[list[str], list[str]]]:
+        """(keys to check, keys to record) for one debit, or None without a usable amount."""
+        try:
+            value = f"{float(amount):.2f}"
+        except (TypeError, ValueError):
+            return None
+        base = f"{user_id}\x1f{value}"
+        merchant_key = f"{base}\x1f{merchant}\x1f{sms_date or ''}"
+        if ref:
+            return [f"R\x1f{base}\x1f{ref}", f"M0\x1f{merchant_key}"], \
+                   [f"R\x1f{base}\x1f{ref}", f"M1\x1f{merchant_key}"]
+        return [f"M0\x1f{merchant_key}", f"M1\x1f{merchant_key}"], [f"M0\x1f{merchant_key}"]
+
+    def is_duplicate(self, user_id: str, amount: str, merchant: str,
+                     sms_date: Optional[str], ref: Optional[str]) -> bool:
+        """True when this debit was recorded in the window. Does not record it."""
+        keys = self._fingerprints(user_id, amount, merchant, sms_date, ref)
+        if keys is None:
+            return False
+        with self._lock:
+            self._rotate(time.time())
+            self.outcomes["checked"] += 1
+            for key in keys[0]:
+                if self._seen(key):
+                    self.outcomes["duplicate_" + ("reference" if key[0] == "R" else "merchant")] += 1
+                    return True
+        return False
+
+    def record(self, user_id: str, amount: str, merchant: str,
+               sms_date: Optional[str], ref: Optional[str]) -> bool:
+        """
+        Remember a debit once the caller has stored it, so a later SMS for it is
+        a duplicate. Kept apart from is_duplicate: a failed save must not make
+        the retry look like a duplicate.
+        """
+        keys = self._fingerprints(user_id, amount, merchant, sms_date, ref)
+        if keys is None:
+            return False
+        now = time.time()
+        with self._lock:
+            self._rotate(now)
+            self.outcomes["recorded"] += 1
+            for key in keys[1]:
+                self._add(key, now)
+        return True
+
+    def stats(self) -> dict:
+        with self._lock:
+            fills = [f.fill() for f in self._filters]
+            added = sum(f.added for f in self._filters)
+            outcomes = dict(self.outcomes)
+            negatives, false_positives = self.sampled_negatives, self.sampled_false_positives
+            exact = len(self._exact)
+        # a fresh key is a false positive if all k bits are set in any live filter
+        estimated = 1 - math.prod(1 - fill ** self.k for fill in fills)
+        duplicates = outcomes.get("duplicate_reference", 0) + outcomes.get("duplicate_merchant", 0)
+        return {
+            "window_s": self.window_s,
+            "generations": len(fills),
+            "memory_bytes": self.nbytes * len(fills),
+            "hashes": self.k,
+            "keys_in_window": added,
+            "fill": [round(f, 4) for f in fills],
+            "false_positive_rate": {
+                # per key lookup at the current fill
+                "estimated_now": round(estimated, 6),
+                # over every sampled lookup since start-up, as the filters filled
+                "measured": round(false_positives / negatives, 6) if negatives else None,
+                "sampled_lookups": negatives,
+                "sample_keys": exact,
+            },
+            "outcomes": outcomes,
+            "duplicate_rate": round(duplicates / outcomes["checked"], 4) if outcomes.get("checked") else 0.0,
+        }
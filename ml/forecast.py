@@ -0,0 +1,337 @@
+"""
+forecast.py — per-user, per-category spending forecasts, all users at once.
+
+Each (user, category) pair is one row of a dense days matrix taken from the
+analytics store. The same model is fitted to every row in a single pass:
+
+  weekday profile    mean spend per weekday minus the mean spend per day,
+                     shrunk towards 0 for thin histories (additive, so the
+                     many zero-spend days do not break it)
+  level              simple exponential smoothing of the deseasonalized daily
+                     totals; every alpha in ALPHAS runs side by side and each
+                     row keeps the one with the lowest one-step-ahead error
+
+The smoothing loop steps over days, not users: one iteration updates every
+row with one numpy operation, so the cost depends on the history length and
+not on how many users there are.
+
+The month outlook adds this month's spend to the forecast for the days left.
+The first day on which the total passes the limit is the overspend date. The
+limit is the user's budget for the category, or, with no budget, the usual
+month (mean daily spend between the first spend in the window and the start
+of this month, × days in month).
+
+Usage:
+  python forecast.py history.csv --out alerts.csv --workers 4   # nightly bulk run
+  python forecast.py --bench --users 20000 --rows 2000000       # synthetic benchmark
+
+Used by: main.py (/analytics/forecast)
+"""
+
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from datetime import date, datetime
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from analytics import BASE_DIR, SpendingAnalytics, _month_position, _pack, day_label
+
+HISTORY_DAYS = 120                      # covers the current month plus ~3 before it
+ALPHAS = np.array([0.05, 0.1, 0.2, 0.3, 0.5])
+WARMUP_DAYS = 14                        # not scored when choosing alpha
+WEEKDAY_SHRINK = 4.0                    # pseudo-observations per weekday at offset 0
+
+
+@dataclass
+class Outlook:
+    """One row per (user, category) series; arrays share that order."""
+    level: np.ndarray           # smoothed daily spend, weekday profile removed
+    alpha: np.ndarray
+    rmse: np.ndarray            # one-step-ahead error at the chosen alpha
+    spent: np.ndarray           # this month so far
+    projected: np.ndarray       # spent + forecast for the rest of the month
+    usual: np.ndarray           # mean month before this one
+    overspend_day: np.ndarray   # day of month the limit is passed, 0 = not this month
+
+
+def _weekday_offsets(daily: np.ndarray, first_day: int) -> np.ndarray:
+    """(rows, 7) additive weekday profile; day 0 (1970-01-01) was a Thursday."""
+    weekday = (np.arange(first_day, first_day + daily.shape[1]) + 3) % 7
+    onehot = np.zeros((daily.shape[1], 7))
+    onehot[np.arange(daily.shape[1]), weekday] = 1.0
+    sums, n = daily @ onehot, onehot.sum(axis=0)
+    mean = daily.mean(axis=1, keepdims=True)
+    # a weekday's mean minus the overall mean, pulled towards 0 for few observations
+    return (sums - n * mean) / (n + WEEKDAY_SHRINK)
+
+
+def _smooth(adjusted: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Every alpha on every row at once; returns (level, alpha, rmse) of the best alpha per row."""
+    rows, days = adjusted.shape
+    by_day = np.ascontiguousarray(adjusted.T)           # each step reads one contiguous day
+    alphas = ALPHAS[:, None]
+    level = np.repeat(by_day[:1], len(ALPHAS), axis=0)  # (alphas, rows)
+    sse = np.zeros_like(level)
+    error = np.empty_like(level)
+    for t in range(1, days):
+        np.subtract(by_day[t], level, out=error)
+        if t >= WARMUP_DAYS:
+            sse += error * error
+        error *= alphas
+        level += error
+    best = np.argmin(sse, axis=0)
+    pick = np.arange(rows)
+    scored = max(days - WARMUP_DAYS, 1)
+    return level[best, pick], ALPHAS[best], np.sqrt(sse[best, pick] / scored)
+
+
+def outlook(daily: np.ndarray, as_of_day: int, limits: Optional[np.ndarray] = None) -> Outlook:
+    """
+    Fit and project every row of `daily` (rows × days, last column = as_of_day).
+    `limits` holds a budget per row, NaN or 0 where there is none.
+    """
+    rows, days = daily.shape
+    first_day = as_of_day - days + 1
+    day_of_month, days_in_month = _month_position(as_of_day)
+    remaining = days_in_month - day_of_month
+
+    offsets = _weekday_offsets(daily, first_day)
+    weekday = (np.arange(first_day, first_day + days) + 3) % 7
+    level, alpha, rmse = _smooth(daily - offsets[:, weekday])
+
+    future = (np.arange(as_of_day + 1, as_of_day + 1 + remaining) + 3) % 7
+    path = np.maximum(level[:, None] + offsets[:, future], 0.0)
+    spent = daily[:, days - day_of_month:].sum(axis=1)
+    # usual month: daily mean from the series' first spend up to this month
+    n_before = days - day_of_month
+    active = np.maximum(n_before - np.argmax(daily > 0, axis=1), 0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        usual = np.where(active > 0, daily[:, :n_before].sum(axis=1) / active * days_in_month, 0.0)
+
+    if limits is None:
+        limits = np.full(rows, np.nan)
+    limit = np.where(np.nan_to_num(limits) > 0, limits, usual)
+    # running month total for as_of and each day after it
+    running = spent[:, None] + np.cumsum(np.c_[np.zeros(rows), path], axis=1)
+    over = (running > limit[:, None]) & (limit[:, None] > 0)
+    first = np.argmax(over, axis=1)
+    overspend_day = np.where(over.any(axis=1), day_of_month + first, 0)
+
+    return Outlook(level=level, alpha=alpha, rmse=rmse, spent=spent, projected=running[:, -1],
+                   usual=usual, overspend_day=overspend_day)
+
+
+# Set before the pool forks so workers read the matrix without it being pickled
+_shared: Optional[tuple] = None
+
+
+def _outlook_rows(bounds: tuple[int, int]) -> Outlook:
+    daily, as_of_day, limits = _shared
+    a, b = bounds
+    return outlook(daily[a:b], as_of_day, limits[a:b])
+
+
+def outlook_parallel(daily: np.ndarray, as_of_day: int, limits: Optional[np.ndarray] = None,
+                     workers: int = 0, shard_rows: int = 50_000) -> Outlook:
+    """
+    outlook() over row shards in forked worker processes; workers=0 (or a
+    matrix smaller than one shard) runs in-process. Only shard bounds go to
+    the workers and only the per-row results come back.
+    """
+    global _shared
+    if workers <= 0 or len(daily) <= shard_rows:
+        return outlook(daily, as_of_day, limits)
+    if limits is None:
+        limits = np.full(len(daily), np.nan)
+    n_shards = max(workers, math.ceil(len(daily) / shard_rows))
+    bounds = np.linspace(0, len(daily), n_shards + 1).astype(int).tolist()
+    _shared = (daily, as_of_day, limits)
+    try:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("fork")) as pool:
+            parts = list(pool.map(_outlook_rows, zip(bounds[:-1], bounds[1:])))
+    finally:
+        _shared = None
+    return Outlook(**{f: np.concatenate([getattr(p, f) for p in parts]) for f in Outlook.__dataclass_fields__})
+
+
+# ── Store-facing helpers ──────────────────────────────────────────────────────
+def _covering(history_days: int, as_of_day: int) -> int:
+    """At least this month so far plus the warm-up."""
+    return max(history_days, _month_position(as_of_day)[0] + WARMUP_DAYS)
+
+
+def _row(result: Outlook, i: int, category: str, budget: float, as_of_day: int) -> dict:
+    day = int(result.overspend_day[i])
+    month_start = as_of_day - _month_position(as_of_day)[0] + 1
+    return {
+        "category": category,
+        "spent": round(float(result.spent[i]), 2),
+        "projected": round(float(result.projected[i]), 2),
+        "limit": round(budget if budget > 0 else float(result.usual[i]), 2),
+        "limit_source": "budget" if budget > 0 else "usual",
+        "overspend_on": day_label(month_start + day - 1) if day else None,
+        "daily_level": round(float(result.level[i]), 2),
+        "alpha": float(result.alpha[i]),
+        "rmse": round(float(result.rmse[i]), 2),
+    }
+
+
+def forecast_user(store: SpendingAnalytics, user_id: str,
+                  category_budgets: Optional[dict[str, float]] = None,
+                  as_of: Optional[date] = None, history_days: int = HISTORY_DAYS) -> dict:
+    """Month outlook for one user's categories (the /analytics/forecast route)."""
+    budgets = category_budgets or {}
+    as_of_day = store._as_of_day(as_of)
+    history_days = _covering(history_days, as_of_day)
+    _, categories, daily = store.daily_series(history_days, as_of, user_id)
+    names = [store.categories.names[c] for c in categories.tolist()]
+    limits = np.array([budgets.get(name, np.nan) for name in names], dtype=np.float64)
+    result = outlook(daily, as_of_day, limits)
+    rows = [_row(result, i, name, float(budgets.get(name, 0.0)), as_of_day) for i, name in enumerate(names)]
+    return {
+        "user_id": user_id,
+        "as_of": day_label(as_of_day),
+        "categories": rows,
+        "alerts": [r for r in rows if r["overspend_on"] is not None],
+    }
+
+
+def forecast_all(store: SpendingAnalytics, budgets: Optional[pd.DataFrame] = None,
+                 as_of: Optional[date] = None, workers: int = 0,
+                 history_days: int = HISTORY_DAYS) -> pd.DataFrame:
+    """
+    Nightly bulk run: one row per (user, category) with spend in the window.
+    `budgets` has user_id, category, limit columns.
+    """
+    as_of_day = store._as_of_day(as_of)
+    history_days = _covering(history_days, as_of_day)
+    users, categories, daily = store.daily_series(history_days, as_of)
+    limits = np.full(len(users), np.nan)
+    if budgets is not None and len(budgets):
+        # budgets for users/categories the store has never seen cannot match a row
+        user_codes = budgets["user_id"].astype(str).map(store.users.index)
+        cat_codes = budgets["category"].astype(str).map(store.categories.index)
+        known = (user_codes.notna() & cat_codes.notna()).to_numpy()
+        known_users, known_cats = user_codes[known].to_numpy(np.int64), cat_codes[known].to_numpy(np.int64)
+        series = _pack(known_users, np.zeros_like(known_users), known_cats)
+        wanted = pd.Series(budgets["limit"].to_numpy(np.float64)[known], index=series)
+        wanted = wanted[~wanted.index.duplicated(keep="last")]
+        limits = wanted.reindex(_pack(users, np.zeros_like(users), categories)).to_numpy()
+
+    result = outlook_parallel(daily, as_of_day, limits, workers)
+    month_start = as_of_day - _month_position(as_of_day)[0] + 1
+    budgeted = np.nan_to_num(limits) > 0
+    return pd.DataFrame({
+        "user_id": np.asarray(store.users.names, dtype=object)[users],
+        "category": np.asarray(store.categories.names, dtype=object)[categories],
+        "spent": result.spent.round(2),
+        "projected": result.projected.round(2),
+        "limit": np.where(budgeted, limits, result.usual).round(2),
+        "limit_source": np.where(budgeted, "budget", "usual"),
+        "overspend_on": np.where(
+            result.overspend_day > 0,
+            (np.datetime64(day_label(month_start)) + (result.overspend_day - 1).astype("timedelta64[D]")).astype(str),
+            None,
+        ),
+        "alpha": result.alpha,
+        "rmse": result.rmse.round(2),
+    })
+
+
+# ── Benchmark ─────────────────────────────────────────────────────────────────
+def benchmark(rows: int, users: int, workers: int, seed: int) -> dict:
+    from analytics import synthetic_transactions
+
+    store = SpendingAnalytics()
+    t0 = time.perf_counter()
+    store.append(synthetic_transactions(rows, users, seed))
+    load_ms = (time.perf_counter() - t0) * 1000
+
+    t0 = time.perf_counter()
+    _, _, daily = store.daily_series(HISTORY_DAYS)
+    matrix_ms = (time.perf_counter() - t0) * 1000
+    as_of_day = store.last_day
+
+    t0 = time.perf_counter()
+    outlook(daily, as_of_day)
+    serial_ms = (time.perf_counter() - t0) * 1000
+
+    result = {
+        "rows": rows,
+        "users": users,
+        "series": len(daily),
+        "history_days": HISTORY_DAYS,
+        "load_ms": round(load_ms, 1),
+        "matrix_ms": round(matrix_ms, 1),
+        "fit_serial_ms": round(serial_ms, 1),
+        "series_per_sec_serial": round(len(daily) / serial_ms * 1000),
+    }
+    if workers > 0:
+        shard_rows = math.ceil(len(daily) / workers)
+        t0 = time.perf_counter()
+        outlook_parallel(daily, as_of_day, workers=workers, shard_rows=shard_rows)
+        parallel_ms = (time.perf_counter() - t0) * 1000
+        result.update({
+            "workers": workers,
+            "fit_parallel_ms": round(parallel_ms, 1),
+            "series_per_sec_parallel": round(len(daily) / parallel_ms * 1000),
+        })
+
+    t0 = time.perf_counter()
+    frame = forecast_all(store, workers=workers)
+    result["forecast_all_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+    result["alerts"] = int(frame["overspend_on"].notna().sum())
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path", nargs="?", help="parsed_transactions.csv-shaped history (with user_id)")
+    parser.add_argument("--budgets", default=None, help="CSV with user_id, category, limit")
+    parser.add_argument("--as-of", default=None, help="YYYY-MM-DD (default: last day in the data)")
+    parser.add_argument("--workers", type=int, default=max(0, (os.cpu_count() or 1) - 1))
+    parser.add_argument("--out", default=None, help="alerts CSV (default artifacts/forecast/...)")
+    parser.add_argument("--all", action="store_true", help="write every series, not only alerts")
+    parser.add_argument("--bench", action="store_true", help="run the synthetic benchmark instead")
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--users", type=int, default=20_000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    from utils import ensure_dir, save_json
+
+    timestamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
+    if args.bench:
+        result = benchmark(args.rows, args.users, args.workers, args.seed)
+        out = args.out or str(ensure_dir(BASE_DIR / "artifacts" / "bench") / f"forecast_{timestamp}.json")
+        save_json(result, out)
+        print(json.dumps(result, indent=2))
+        print(f"Report saved: {out}")
+        return
+    if not args.path:
+        parser.error("a history CSV is required unless --bench is given")
+
+    store = SpendingAnalytics()
+    t0 = time.perf_counter()
+    store.load_csv(args.path)
+    budgets = pd.read_csv(args.budgets) if args.budgets else None
+    as_of = date.fromisoformat(args.as_of) if args.as_of else None
+    frame = forecast_all(store, budgets, as_of, args.workers)
+    if not args.all:
+        frame = frame[frame["overspend_on"].notna()]
+    out = args.out or str(ensure_dir(BASE_DIR / "artifacts" / "forecast") / f"alerts_{timestamp}.csv")
+    frame.to_csv(out, index=False)
+    print(f"{len(frame)} rows for {store.stats()['users']} users in "
+          f"{(time.perf_counter() - t0) * 1000:.0f}ms → {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+"""
+inbox_import.py — stream a whole SMS inbox dump into candidate expenses.
+
+  prefilter → parse → classify (batched)
+
+The prefilter (prefilter.py) drops OTPs, promotions and credit alerts before
+any extraction regex runs. Survivors are parsed, and their merchants are
+classified batch_size at a time, so the model sees one call per batch instead
+of one per message. Only candidate expenses are emitted; ImportStats keeps
+the reject reasons and per-stage throughput.
+
+Usage:
+  python inbox_import.py inbox.csv --out candidates.jsonl
+  python inbox_import.py inbox.jsonl --batch-size 2000
+
+Input may be .csv (sms_text / body / text column), .jsonl (strings or
+objects with one of those keys) or .txt (one message per line).
+
+Used by: main.py (POST /import/inbox)
+"""
+
+import argparse
+import csv
+import json
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, Optional
+
+from prefilter import classify_sms
+
+TEXT_FIELDS = ("sms_text", "body", "text")
+STAGES = ("prefilter", "parse", "classify")
+
+# merchants → [(category, confidence, used_model)], one per merchant
+Classifier = Callable[[list[str]], list[tuple[str, float, bool]]]
+
+
+# ── Readers ───────────────────────────────────────────────────────────────────
+def _text_field(record: dict) -> str:
+    for name in TEXT_FIELDS:
+        if record.get(name):
+            return str(record[name])
+    return ""
+
+
+def iter_messages(path: str) -> Iterator[str]:
+    """Yield message texts one at a time, without loading the dump into memory."""
+    suffix = Path(path).suffix.lower()
+    with open(path, encoding="utf-8", newline="") as f:
+        if suffix == ".csv":
+            for row in csv.DictReader(f):
+                yield _text_field(row)
+        elif suffix == ".jsonl":
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    yield record if isinstance(record, str) else _text_field(record)
+        else:
+            for line in f:
+                yield line.rstrip("\r\n")
+
+
+# ── Stats ─────────────────────────────────────────────────────────────────────
+class ImportStats:
+    def __init__(self):
+        self.read = 0
+        self.candidates = 0
+        self.rejected: Counter = Counter()
+        self.stage_messages = dict.fromkeys(STAGES, 0)
+        self.stage_seconds = dict.fromkeys(STAGES, 0.0)
+        self._started = time.perf_counter()
+
+    def timed(self, name: str, t0: float, n: int = 1) -> None:
+        self.stage_messages[name] += n
+        self.stage_seconds[name] += time.perf_counter() - t0
+
+    def to_dict(self) -> dict:
+        elapsed = time.perf_counter() - self._started
+        rejected = sum(self.rejected.values())
+        return {
+            "messages": self.read,
+            "candidates": self.candidates,
+            "rejected": rejected,
+            "reject_rate": round(rejected / self.read, 4) if self.read else 0.0,
+            "reject_reasons": dict(self.rejected.most_common()),
+            "stages": {
+                name: {
+                    "messages": self.stage_messages[name],
+                    "seconds": round(self.stage_seconds[name], 4),
+                    "msgs_per_sec": round(self.stage_messages[name] / self.stage_seconds[name], 1)
+                    if self.stage_seconds[name] else None,
+                }
+                for name in STAGES
+            },
+            "elapsed_seconds": round(elapsed, 4),
+            "msgs_per_sec": round(self.read / elapsed, 1) if elapsed else None,
+        }
+
+
+# ── Pipeline ──────────────────────────────────────────────────────────────────
+def _flush(pending: list[tuple[int, dict]], classify: Classifier, stats: ImportStats) -> Iterator[dict]:
+    merchants = [p["merchant"] for _, p in pending if p["merchant"] and not p["is_atm"]]
+    t0 = time.perf_counter()
+    predictions = iter(classify(merchants) if merchants else [])
+    stats.timed("classify", t0, len(merchants))
+
+    for index, parsed in pending:
+        if parsed["is_atm"]:
+            merchant, cat, conf, used_model, kind = "ATM", "Other", 1.0, False, "cash_withdrawal"
+        elif parsed["merchant"]:
+            merchant, kind = parsed["merchant"], "expense"
+            cat, conf, used_model = next(predictions)
+        else:
+            merchant, cat, conf, used_model, kind = "", "Other", 0.0, False, "expense"
+
+        stats.candidates += 1
+        yield {
+            "index": index,
+            "amount": parsed["amount"],
+            "date": parsed["date"],
+            "merchant": merchant,
+            "category": cat if cat != "Uncategorized" else "Other",
+            "confidence": round(conf, 4),
+            "type": kind,
+            "used_model": used_model,
+        }
+
+
+def stream_import(messages: Iterable[str], parse: Callable[[str], dict], classify: Classifier,
+                  batch_size: int = 500, stats: Optional[ImportStats] = None) -> Iterator[dict]:
+    """
+    Yield one candidate expense per debit SMS, in inbox order. `index` is the
+    message's position in the input so callers can join back to the dump.
+    """
+    stats = stats if stats is not None else ImportStats()
+    pending: list[tuple[int, dict]] = []
+
+    for index, text in enumerate(messages):
+        stats.read += 1
+        t0 = time.perf_counter()
+        verdict = classify_sms(text)
+        stats.timed("prefilter", t0)
+        if not verdict.keep:
+            stats.rejected[verdict.reason] += 1
+            continue
+
+        t0 = time.perf_counter()
+        parsed = parse(text)
+        stats.timed("parse", t0)
+        if parsed["amount"] is None:
+            stats.rejected["unparsed_amount"] += 1
+            continue
+
+        pending.append((index, parsed))
+        if len(pending) >= batch_size:
+            yield from _flush(pending, classify, stats)
+            pending = []
+
+    if pending:
+        yield from _flush(pending, classify, stats)
+
+
+# ── CLI ───────────────────────────────────────────────────────────────────────
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path", help="inbox dump (.csv, .jsonl or .txt)")
+    parser.add_argument("--out", default=None, help="candidates JSONL (default stdout)")
+    parser.add_argument("--batch-size", type=int, default=500, help="merchants per model call")
+    args = parser.parse_args()
+
+    # Imported lazily: loading the service module pulls in FastAPI and the model
+    import main as service
+    service.load_model()
+
+    stats = ImportStats()
+    out = open(args.out, "w", encoding="utf-8") if args.out else sys.stdout
+    try:
+        for candidate in stream_import(iter_messages(args.path), service._parse_sms,
+                                       service.classify_merchants, args.batch_size, stats):
+            out.write(json.dumps(candidate) + "\n")
+    finally:
+        if args.out:
+            out.close()
+
+    print(json.dumps(stats.to_dict(), indent=2), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
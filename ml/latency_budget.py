@@ -0,0 +1,188 @@
+"""
+latency_budget.py — per-request latency budgets with a rule-based fallback.
+
+A caller that would rather have a quick rule-based category than a late
+model one sends a budget, in milliseconds from arrival:
+
+  X-Latency-Budget-Ms: 300        header, any route
+  "budget_ms": 300                body field of /predict/*, or UDS arg
+
+The budget starts when the request reaches the service, so time spent in the
+admission queue counts against it. Model scoring is then raced against what
+is left: it runs in a small executor while the request thread waits at most
+the remaining time. If the budget is already gone (queueing, a slow parse) or
+the model does not answer in time (a reload, a cold registry model, a large
+batch), the caller falls back to rules and reports used_model=false.
+
+Scoring that loses the race while still queued is cancelled. Scoring that
+already started keeps running and still fills the prediction cache, so the
+next request for the same merchant is a cache hit. The executor never holds
+more than `workers` tasks, queued or running, and at most `max_abandoned`
+of them are such orphans; admission control cannot see them once their
+request has returned. Past either bound, budgeted requests fall back to rules
+without submitting ("shed"), so the backlog cannot grow under overload.
+
+Requests without a budget call the model directly, as before.
+
+Used by: main.py (_predict_single, batch_prediction, /admin/latency-budget)
+"""
+
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+from typing import Any, Callable, Optional
+
+import numpy as np
+
+_arrival: ContextVar[Optional[float]] = ContextVar("budget_arrival", default=None)
+_deadline: ContextVar[Optional[float]] = ContextVar("budget_deadline", default=None)
+
+
+def _header_budget(headers: list[tuple[bytes, bytes]]) -> Optional[float]:
+    for name, value in headers:
+        if name == b"x-latency-budget-ms":
+            try:
+                return float(value)
+            except ValueError:
+                return None
+    return None
+
+
+class LatencyBudget:
+    """Deadline bookkeeping, the scoring executor, and per-operation outcomes."""
+
+    def __init__(self, workers: int = 8, max_abandoned: Optional[int] = None, window: int = 5000):
+        self.workers = workers
+        self.max_abandoned = max(1, workers // 2) if max_abandoned is None else max_abandoned
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="budget")
+        self._slots = threading.BoundedSemaphore(workers)     # submitted and not yet done
+        self._lock = threading.Lock()
+        self.abandoned = 0                  # started scoring whose caller gave up, still running
+        self.outcomes: defaultdict[str, Counter] = defaultdict(Counter)
+        self.late_completions = 0           # scoring that finished after its caller gave up
+        self.budget_ms: deque = deque(maxlen=window)
+        self.remaining_ms: deque = deque(maxlen=window)     # left when scoring started
+
+    @contextmanager
+    def scope(self, budget_ms: Optional[float]):
+        """
+        Apply a budget, counted from arrival, for the duration of the block.
+        A tighter budget set by the header is kept.
+        """
+        if budget_ms is None:
+            yield
+            return
+        arrival = _arrival.get() or time.perf_counter()
+        deadline = arrival + budget_ms / 1000
+        current = _deadline.get()
+        token = _deadline.set(deadline if current is None else min(current, deadline))
+        self.budget_ms.append(budget_ms)
+        try:
+            yield
+        finally:
+            _deadline.reset(token)
+
+    @staticmethod
+    def remaining() -> Optional[float]:
+        """Seconds left in the current request's budget, or None without one."""
+        deadline = _deadline.get()
+        return None if deadline is None else deadline - time.perf_counter()
+
+    def run(self, op: str, fn: Callable, *args) -> tuple[bool, Any]:
+        """(True, fn(*args)) if it finished within the budget, else (False, None)."""
+        remaining = self.remaining()
+        if remaining is None:
+            return True, fn(*args)
+        outcomes = self.outcomes[op]
+        outcomes["budgeted"] += 1
+        self.remaining_ms.append(remaining * 1000)
+        if remaining <= 0:
+            outcomes["expired_before_scoring"] += 1
+            return False, None
+        if self.abandoned >= self.max_abandoned or not self._slots.acquire(blocking=False):
+            outcomes["shed"] += 1
+            return False, None
+        # copy_context: stage timings and the routed model follow the work
+        future = self._executor.submit(copy_context().run, fn, *args)
+        future.add_done_callback(self._release)
+        try:
+            result = future.result(timeout=remaining)
+        except TimeoutError:
+            outcomes["deadline_miss"] += 1
+            if future.cancel():             # still queued: nobody needs it
+                outcomes["cancelled"] += 1
+            else:
+                with self._lock:
+                    self.abandoned += 1
+                future.add_done_callback(self._late)
+            return False, None
+        outcomes["in_time"] += 1
+        return True, result
+
+    def _release(self, _future) -> None:
+        self._slots.release()
+
+    def _late(self, _future) -> None:
+        with self._lock:
+            self.abandoned -= 1
+            self.late_completions += 1
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    @staticmethod
+    def _percentiles(samples: deque) -> Optional[dict]:
+        if not samples:
+            return None
+        arr = np.asarray(samples)
+        return {
+            "p50": round(float(np.percentile(arr, 50)), 3),
+            "p99": round(float(np.percentile(arr, 99)), 3),
+            "min": round(float(arr.min()), 3),
+        }
+
+    def stats(self) -> dict:
+        ops = {}
+        for op, counts in list(self.outcomes.items()):
+            missed = counts["deadline_miss"] + counts["expired_before_scoring"] + counts["shed"]
+            ops[op] = {
+                **counts,
+                "miss_rate": round(missed / counts["budgeted"], 4) if counts["budgeted"] else 0.0,
+            }
+        return {
+            "workers": self.workers,
+            "operations": ops,
+            "deadline_misses": sum(c["deadline_miss"] + c["expired_before_scoring"] + c["shed"]
+                                   for c in self.outcomes.values()),
+            "abandoned_running": self.abandoned,
+            "max_abandoned": self.max_abandoned,
+            "late_completions": self.late_completions,
+            "budget_ms": self._percentiles(self.budget_ms),
+            "remaining_at_scoring_ms": self._percentiles(self.remaining_ms),
+        }
+
+
+class LatencyBudgetMiddleware:
+    """
+    Pure ASGI middleware: stamps the arrival time and applies an
+    X-Latency-Budget-Ms header. Sits outside admission control so that
+    queueing is charged to the budget.
+    """
+
+    def __init__(self, app, budget: LatencyBudget):
+        self.app = app
+        self.budget = budget
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        token = _arrival.set(time.perf_counter())
+        try:
+            with self.budget.scope(_header_budget(scope["headers"])):
+                await self.app(scope, receive, send)
+        finally:
+            _arrival.reset(token)
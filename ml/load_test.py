@@ -0,0 +1,315 @@
+"""
+load_test.py — replay the SMS corpus against a running ML service.
+
+Drives /predict/sms, /predict/merchant and /predict/batch with keep-alive
+HTTP/1.1 connections (stdlib asyncio only, so nothing extra to install) in
+one of two modes:
+
+  closed  — fixed concurrency: N workers, each sends its next request as soon
+            as the previous one returns (measures capacity)
+  open    — fixed arrival rate: requests are scheduled at --rps whether or not
+            earlier ones finished; latency is measured from the scheduled send
+            time so queueing inside the client is not hidden (measures tail
+            latency at a given load)
+
+Results are written as JSON so runs can be diffed across versions.
+
+Usage:
+  python load_test.py --spawn --mode closed --concurrency 32 --duration 30
+  python load_test.py --url http://127.0.0.1:8001 --mode open --rps 200 --endpoint mix
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import subprocess
+import sys
+import time
+import urllib.request
+from collections import Counter, defaultdict
+from datetime import datetime
+from pathlib import Path
+from urllib.parse import urlsplit
+
+import numpy as np
+import pandas as pd
+
+from utils import ensure_dir, save_json
+
+BASE_DIR = Path(__file__).parent
+ENDPOINTS = ("sms", "merchant", "batch")
+
+
+# ── Corpus ────────────────────────────────────────────────────────────────────
+def load_corpus(path: str | None, generate: int, seed: int) -> tuple[list[str], list[str]]:
+    """Return (sms_texts, merchants) from the CSV or a freshly generated corpus."""
+    if generate:
+        from generate_data import expand_merchants, get_random_date, templates
+
+        rng = random.Random(seed)
+        merchants_by_cat = expand_merchants()
+        all_merchants = [m for names in merchants_by_cat.values() for m in names]
+        merchants = [rng.choice(all_merchants) for _ in range(generate)]
+        sms = [
+            rng.choice(templates).format(
+                amount=rng.randint(50, 5000), merchant=m, date=get_random_date()
+            )
+            for m in merchants
+        ]
+        return sms, merchants
+
+    df = pd.read_csv(path or BASE_DIR / "bank_sms_data.csv")
+    sms = df["sms_text"].dropna().astype(str).tolist()
+    merchants = df["true_merchant"].dropna().astype(str).tolist()
+    return sms, merchants
+
+
+class PayloadSource:
+    """Cycles through the corpus and builds request bodies per endpoint."""
+
+    def __init__(self, sms: list[str], merchants: list[str], endpoint: str,
+                 batch_size: int, seed: int):
+        self.sms = sms
+        self.merchants = merchants
+        self.endpoint = endpoint
+        self.batch_size = batch_size
+        self.rng = random.Random(seed)
+
+    def next(self) -> tuple[str, str, bytes]:
+        kind = self.rng.choice(ENDPOINTS) if self.endpoint == "mix" else self.endpoint
+        if kind == "sms":
+            body = {"sms_text": self.rng.choice(self.sms)}
+        elif kind == "merchant":
+            body = {"merchant": self.rng.choice(self.merchants)}
+        else:
+            body = {"merchants": self.rng.choices(self.merchants, k=self.batch_size)}
+        return kind, f"/predict/{kind}", json.dumps(body).encode()
+
+
+# ── Minimal keep-alive HTTP/1.1 client ────────────────────────────────────────
+class Connection:
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self.reader = None
+        self.writer = None
+
+    async def request(self, path: str, body: bytes, timeout: float) -> int:
+        if self.writer is None or self.writer.is_closing():
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        head = (
+            f"POST {path} HTTP/1.1\r\n"
+            f"Host: {self.host}:{self.port}\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            "Connection: keep-alive\r\n\r\n"
+        ).encode()
+        try:
+            self.writer.write(head + body)
+            await self.writer.drain()
+            return await asyncio.wait_for(self._read_response(), timeout)
+        except BaseException:
+            self.close()
+            raise
+
+    async def _read_response(self) -> int:
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionError("server closed the connection")
+        status = int(status_line.split()[1])
+        length = 0
+        keep_alive = True
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            name = name.strip().lower()
+            if name == "content-length":
+                length = int(value)
+            elif name == "connection" and value.strip().lower() == "close":
+                keep_alive = False
+        await self.reader.readexactly(length)
+        if not keep_alive:
+            self.close()
+        return status
+
+    def close(self) -> None:
+        if self.writer is not None:
+            self.writer.close()
+        self.writer = None
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(Counter)
+
+    def record(self, kind: str, latency_ms: float, status: str) -> None:
+        self.latencies[kind].append(latency_ms)
+        self.statuses[kind][status] += 1
+
+
+# ── Load modes ────────────────────────────────────────────────────────────────
+async def _send(conn: Connection, source: PayloadSource, recorder: Recorder,
+                started: float, timeout: float) -> None:
+    kind, path, body = source.next()
+    try:
+        status = str(await conn.request(path, body, timeout))
+    except asyncio.TimeoutError:
+        status = "timeout"
+    except (OSError, ConnectionError, asyncio.IncompleteReadError, ValueError, IndexError):
+        status = "connection_error"
+    recorder.record(kind, (time.perf_counter() - started) * 1000, status)
+
+
+async def run_closed(host, port, source, recorder, concurrency, duration, timeout):
+    stop_at = time.perf_counter() + duration
+
+    async def worker():
+        conn = Connection(host, port)
+        while time.perf_counter() < stop_at:
+            await _send(conn, source, recorder, time.perf_counter(), timeout)
+        conn.close()
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+
+async def run_open(host, port, source, recorder, rps, duration, timeout, max_connections):
+    pool: asyncio.Queue = asyncio.Queue()
+    for _ in range(max_connections):
+        pool.put_nowait(Connection(host, port))
+
+    async def fire(scheduled: float):
+        conn = await pool.get()
+        try:
+            await _send(conn, source, recorder, scheduled, timeout)
+        finally:
+            pool.put_nowait(conn)
+
+    tasks = []
+    start = time.perf_counter()
+    for i in range(int(rps * duration)):
+        scheduled = start + i / rps
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(fire(scheduled)))
+    await asyncio.gather(*tasks)
+    while not pool.empty():
+        pool.get_nowait().close()
+
+
+# ── Reporting ─────────────────────────────────────────────────────────────────
+def _summary(latencies: list[float], statuses: Counter, elapsed: float) -> dict:
+    total = sum(statuses.values())
+    ok = sum(n for s, n in statuses.items() if s.isdigit() and 200 <= int(s) < 300)
+    arr = np.asarray(latencies) if latencies else np.zeros(1)
+    return {
+        "requests": total,
+        "ok": ok,
+        "errors": total - ok,
+        "error_rate": round((total - ok) / total, 6) if total else 0.0,
+        "status_counts": dict(statuses),
+        "throughput_rps": round(total / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": {
+            "mean": round(float(arr.mean()), 3),
+            "p50": round(float(np.percentile(arr, 50)), 3),
+            "p95": round(float(np.percentile(arr, 95)), 3),
+            "p99": round(float(np.percentile(arr, 99)), 3),
+            "p999": round(float(np.percentile(arr, 99.9)), 3),
+            "max": round(float(arr.max()), 3),
+        },
+    }
+
+
+def build_report(recorder: Recorder, elapsed: float, settings: dict, started_at: str) -> dict:
+    all_latencies = [ms for values in recorder.latencies.values() for ms in values]
+    all_statuses = sum(recorder.statuses.values(), Counter())
+    return {
+        "settings": settings,
+        "started_at": started_at,
+        "elapsed_seconds": round(elapsed, 3),
+        "overall": _summary(all_latencies, all_statuses, elapsed),
+        "endpoints": {
+            kind: _summary(recorder.latencies[kind], recorder.statuses[kind], elapsed)
+            for kind in sorted(recorder.latencies)
+        },
+    }
+
+
+# ── Local server ──────────────────────────────────────────────────────────────
+def spawn_server(port: int, workers: int, ready_timeout: float = 60.0) -> subprocess.Popen:
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1",
+         "--port", str(port), "--workers", str(workers), "--log-level", "warning"],
+        cwd=BASE_DIR,
+    )
+    deadline = time.time() + ready_timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"main.py exited early with code {proc.returncode}")
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=1):
+                return proc
+        except OSError:
+            time.sleep(0.2)
+    proc.terminate()
+    raise RuntimeError("main.py did not become healthy in time")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8001")
+    parser.add_argument("--spawn", action="store_true", help="start main.py locally on the --url port")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers when --spawn")
+    parser.add_argument("--mode", choices=["closed", "open"], default="closed")
+    parser.add_argument("--concurrency", type=int, default=16, help="closed loop: in-flight requests")
+    parser.add_argument("--rps", type=float, default=100.0, help="open loop: arrival rate")
+    parser.add_argument("--max-connections", type=int, default=256, help="open loop: connection cap")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds")
+    parser.add_argument("--timeout", type=float, default=5.0, help="per-request timeout (backend uses 5s)")
+    parser.add_argument("--endpoint", choices=[*ENDPOINTS, "mix"], default="sms")
+    parser.add_argument("--batch-size", type=int, default=50)
+    parser.add_argument("--corpus", default=None, help="CSV with sms_text/true_merchant (default bank_sms_data.csv)")
+    parser.add_argument("--generate", type=int, default=0, help="use N generated SMS instead of the CSV")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--label", default="", help="free-form tag stored in the report, e.g. a git sha")
+    parser.add_argument("--out", default=None, help="report path (default artifacts/loadtest/...)")
+    args = parser.parse_args()
+
+    url = urlsplit(args.url)
+    host, port = url.hostname or "127.0.0.1", url.port or 80
+
+    sms, merchants = load_corpus(args.corpus, args.generate, args.seed)
+    source = PayloadSource(sms, merchants, args.endpoint, args.batch_size, args.seed)
+    recorder = Recorder()
+    settings = {k: v for k, v in vars(args).items() if k != "out"}
+    started_at = datetime.utcnow().isoformat()
+
+    server = spawn_server(port, args.workers) if args.spawn else None
+    try:
+        start = time.perf_counter()
+        if args.mode == "closed":
+            coro = run_closed(host, port, source, recorder, args.concurrency, args.duration, args.timeout)
+        else:
+            coro = run_open(host, port, source, recorder, args.rps, args.duration,
+                            args.timeout, args.max_connections)
+        asyncio.run(coro)
+        elapsed = time.perf_counter() - start
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=10)
+
+    report = build_report(recorder, elapsed, settings, started_at)
+    timestamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
+    out = args.out or str(ensure_dir(BASE_DIR / "artifacts" / "loadtest") / f"loadtest_{timestamp}.json")
+    save_json(report, out)
+    print(json.dumps(report["overall"], indent=2))
+    print(f"Report saved: {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -7,23 +7,95 @@ Endpoints:
   GET  /health                    — liveness check
   POST /predict/merchant          — category from merchant name
   POST /predict/sms               — parse SMS + predict category
+                                    (+ recurring-payment tracking and duplicate-SMS
+                                    detection with user_id)
   POST /predict/batch             — categorize many merchants at once
+                                    (deduped, cached, sharded across processes)
+                                    (all three: the user's own corrections win
+                                    over the model when user_id is given)
+  POST /dedup/record              — remember a stored SMS expense for duplicate detection
+  POST /overrides                 — record per-user merchant → category corrections
+  GET  /overrides/stats           — override index size, memory and hit rate
+  POST /import/inbox              — stream candidate expenses out of an inbox
+                                    dump (NDJSON, prefiltered, batched)
+  POST /analytics/transactions    — append parsed transactions to the analytics store
+  POST /analytics/report          — category totals, rolling averages, top
+                                    merchants and budget burn for one user
+  POST /analytics/forecast        — month-end spend forecast per category and
+                                    the day each budget would be overspent
+  GET  /analytics/stats           — analytics store size
+  GET  /recurring/{user_id}       — detected subscriptions / recurring payments
   GET  /model/info                — model metadata
+  GET  /models                    — registry of loadable model versions + routing
+  POST /models/routing            — send a percentage of traffic to a version
+  GET  /models/shadow             — shadow-model agreement / latency stats
+  POST /models/shadow             — configure the shadow model and sample rate
+  GET  /cache/stats               — prediction / SMS template cache hit rates and
+                                    merchant canonicalization rate
+  GET  /admin/profiling           — sampled-profiling status
+  GET  /admin/admission           — per-endpoint concurrency, queue and rejections
+  GET  /admin/dedup               — duplicate-SMS index size and false-positive rate
+  GET  /admin/latency-budget      — latency-budget deadline misses per operation
+  POST /admin/profiling           — turn sampled profiling on/off
+
+Set ML_UDS_PATH to also serve the /predict/* operations over a Unix domain
+socket with length-prefixed msgpack frames (see uds_server.py).
+
+Requests may pick a model with an X-Model-Version header (a registry name,
+a version hash, or "primary"); the served version is echoed back in the same
+header (see model_registry.py).
+
+Every response carries a Server-Timing header with per-stage durations
+(queue, parse, normalize, vectorize, classify, serialize, total). The
+/predict/* and /import/inbox routes sit behind admission control: fast
+429/503 + Retry-After when full, and requests past their X-Request-Deadline
+are dropped before scoring (see admission.py). A caller may also send a
+latency budget (X-Latency-Budget-Ms or "budget_ms"); model scoring that would
+overrun it is abandoned for the rule-based category (see latency_budget.py).
 """
 
+import hashlib
+import json
 import logging
 import os
 import pickle
 import re
+import sqlite3
 import time
 from contextlib import asynccontextmanager
 from pathlib import Path
+from datetime import date
 from typing import Optional
 
 import numpy as np
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel, Field
+
+from admission import AdmissionControl, AdmissionMiddleware, parse_limits
+from analytics import DEFAULT_USER, SpendingAnalytics
+from batch_planner import ShardPool, plan_batch
+from canonicalize import MerchantCanonicalizer, load_known_merchants
+from dedup_index import DedupIndex, reference
+from forecast import HISTORY_DAYS, forecast_user
+from inbox_import import ImportStats, stream_import
+from latency_budget import LatencyBudget, LatencyBudgetMiddleware
+from overrides import OverrideIndex
+from model_registry import (
+    PRIMARY,
+    ModelRegistry,
+    ModelRouting,
+    ModelRoutingMiddleware,
+    ShadowEvaluator,
+    mark_served,
+    requested_model,
+)
+from prediction_cache import LRUCache, SqliteCache
+from recurring import RecurringDetector, parse_date
+from profiling import ServerTimingMiddleware, profiled, profiler, stage
+from sms_templates import TemplateCache
+from uds_server import UdsServer
 
 # ── Logging ────────────────────────────────────────────────────────────────────
 logging.basicConfig(
@@ -37,6 +109,60 @@ log = logging.getLogger("ml_service")
 MODEL_PATH = os.getenv("MODEL_PATH", "../expense_model.pkl")
 SERVICE_PORT = int(os.getenv("ML_SERVICE_PORT", "8001"))
 ALLOWED_ORIGINS = os.getenv("ML_ALLOWED_ORIGINS", "http://localhost:3000").split(",")
+MAX_BATCH = int(os.getenv("ML_MAX_BATCH", "100000"))
+# Unique cache misses above this are scored in worker processes (0 workers = never),
+# which are started on each model load, not on the first large batch
+BATCH_SHARD_THRESHOLD = int(os.getenv("ML_BATCH_SHARD_THRESHOLD", "20000"))
+BATCH_WORKERS = int(os.getenv("ML_BATCH_WORKERS", str(max(0, (os.cpu_count() or 1) - 1))))
+BATCH_SHARD_SIZE = int(os.getenv("ML_BATCH_SHARD_SIZE", "10000"))
+CACHE_MAX_ENTRIES = int(os.getenv("ML_CACHE_MAX_ENTRIES", "50000"))
+# Optional on-disk cache shared by all workers on the host (unset = disabled)
+CACHE_PATH = os.getenv("ML_CACHE_PATH", "")
+CACHE_DISK_MAX_ENTRIES = int(os.getenv("ML_CACHE_DISK_MAX_ENTRIES", "1000000"))
+# Shared-cache rows of other model versions unused this long are dropped on a model load
+CACHE_VERSION_IDLE_S = float(os.getenv("ML_CACHE_VERSION_IDLE_S", str(24 * 3600)))
+# Optional Unix-socket transport; "{pid}" is replaced so each worker gets its own
+UDS_PATH = os.getenv("ML_UDS_PATH", "")
+UDS_WORKERS = int(os.getenv("ML_UDS_WORKERS", "8"))
+# Optional parsed_transactions.csv-shaped file loaded into the analytics store at startup
+ANALYTICS_SEED = os.getenv("ML_ANALYTICS_SEED", "")
+# Optional history CSV that seeds the recurring-payment detector at startup
+RECURRING_SEED = os.getenv("ML_RECURRING_SEED", "")
+# Model registry: timestamped models, loaded on first use; optional traffic split / shadow
+MODEL_DIR = os.getenv("ML_MODEL_DIR", str(Path(__file__).parent / "artifacts" / "models"))
+MODELS_MAX_LOADED = int(os.getenv("ML_MODELS_MAX_LOADED", "3"))
+ROUTE_MODEL = os.getenv("ML_ROUTE_MODEL", "")
+ROUTE_PERCENT = float(os.getenv("ML_ROUTE_PERCENT", "0"))
+SHADOW_MODEL = os.getenv("ML_SHADOW_MODEL", "")
+SHADOW_SAMPLE_RATE = float(os.getenv("ML_SHADOW_SAMPLE_RATE", "0.1"))
+SHADOW_QUEUE = int(os.getenv("ML_SHADOW_QUEUE", "1000"))
+# Admission control: "path=concurrency:queue_depth,..." (empty = no limits)
+ADMISSION_LIMITS = os.getenv(
+    "ML_ADMISSION_LIMITS",
+    "/predict/merchant=16:64,/predict/sms=16:64,/predict/batch=4:8,/import/inbox=1:2",
+)
+ADMISSION_MAX_WAIT_MS = float(os.getenv("ML_ADMISSION_MAX_WAIT_MS", "1000"))
+# SMS template cache: skeletons kept, and hits cross-checked before a template is trusted
+SMS_TEMPLATES = os.getenv("ML_SMS_TEMPLATES", "1") == "1"
+SMS_TEMPLATE_MAX = int(os.getenv("ML_SMS_TEMPLATE_MAX", "512"))
+SMS_TEMPLATE_VALIDATE = int(os.getenv("ML_SMS_TEMPLATE_VALIDATE", "20"))
+# Duplicate-SMS index for /predict/sms with user_id (ML_DEDUP_MEMORY_BYTES=0 disables)
+DEDUP_MEMORY_BYTES = int(os.getenv("ML_DEDUP_MEMORY_BYTES", str(4 << 20)))
+DEDUP_WINDOW_S = float(os.getenv("ML_DEDUP_WINDOW_S", str(6 * 3600)))
+DEDUP_GENERATIONS = int(os.getenv("ML_DEDUP_GENERATIONS", "6"))
+DEDUP_EXPECTED = int(os.getenv("ML_DEDUP_EXPECTED", "200000"))
+# Per-user merchant corrections, shared by the workers on the host (empty = disabled)
+OVERRIDES_PATH = os.getenv("ML_OVERRIDES_PATH", str(Path(__file__).parent / "artifacts" / "overrides.sqlite"))
+OVERRIDES_MEMORY_BYTES = int(os.getenv("ML_OVERRIDES_MEMORY_BYTES", str(64 << 20)))
+OVERRIDES_SYNC_S = float(os.getenv("ML_OVERRIDES_SYNC_S", "1"))
+# Noisy merchant strings mapped onto known training merchants before scoring
+CANONICALIZE = os.getenv("ML_CANONICALIZE", "1") == "1"
+KNOWN_MERCHANTS_PATH = os.getenv("ML_KNOWN_MERCHANTS", str(Path(__file__).parent / "known_merchants.json"))
+CANONICAL_THRESHOLD = float(os.getenv("ML_CANONICAL_THRESHOLD", "0.5"))
+# Threads that run budgeted model scoring (callers wait on them with a timeout)
+BUDGET_WORKERS = int(os.getenv("ML_BUDGET_WORKERS", "8"))
+# Late scoring left running after its caller fell back; past this, budgeted requests use rules at once
+BUDGET_MAX_ABANDONED = int(os.getenv("ML_BUDGET_MAX_ABANDONED", str(max(1, BUDGET_WORKERS // 2))))
 
 CATEGORIES = [
     "Food", "Shopping", "Travel", "Transport", "Health",
@@ -46,12 +172,12 @@ CATEGORIES = [
 # ── SMS regex patterns (same as your sms_parser.py) ───────────────────────────
 _AMOUNT_RE = re.compile(r"(?:rs\.?|inr|₹)\s*(\d+(?:\.\d{1,2})?)", re.IGNORECASE)
 _DATE_RE   = re.compile(r"(\d{2}[-/]\d{2}[-/]\d{4})")
-_MERCH_RE  = re.compile(
-    r"(?:at|to|for|towards)\s+"
+# Merchant name after the keyword; sms_templates.py reuses it inside learned templates
+_MERCH_NAME = (
     r"((?!rs\.?[\s\d]|inr[\s\d])[A-Za-z0-9][A-Za-z0-9\s\&\.\-]{0,35}?)"
-    r"(?=\s*(?:\.|on\s|\d{2}[-/]\d{2}|using|via\s+upi|via\s+[a-z]+|txn|ref|avl|bal|clear|\Z))",
-    re.IGNORECASE,
+    r"(?=\s*(?:\.|on\s|\d{2}[-/]\d{2}|using|via\s+upi|via\s+[a-z]+|txn|ref|avl|bal|clear|\Z))"
 )
+_MERCH_RE  = re.compile(r"(?:at|to|for|towards)\s+" + _MERCH_NAME, re.IGNORECASE)
 _SKIP_WORDS = re.compile(
     r"^(rs|inr|upi|debit|credit|card|bank|acct|acc|a\/c|hdfc|sbi|icici|kotak|axis)$",
     re.IGNORECASE,
@@ -67,13 +193,77 @@ class ModelStore:
     loaded_at: float = 0
     model_path: str = ""
     load_time_ms: float = 0
+    version: str = ""        # content hash — part of every cache key
+    canonicalizer = None     # MerchantCanonicalizer over the training merchants
 
 
 store = ModelStore()
+cache = LRUCache(max_entries=CACHE_MAX_ENTRIES)
+
+
+def _open_disk_cache() -> Optional[SqliteCache]:
+    """The shared disk cache, or None (memory cache only) if the file cannot be opened."""
+    if not CACHE_PATH:
+        return None
+    try:
+        return SqliteCache(CACHE_PATH, max_entries=CACHE_DISK_MAX_ENTRIES)
+    except (OSError, sqlite3.Error) as exc:
+        log.error(f"❌ Disk cache at {CACHE_PATH} unavailable ({exc}); using the memory cache only")
+        return None
+
+
+disk_cache = _open_disk_cache()
+shard_pool = ShardPool(workers=BATCH_WORKERS, shard_size=BATCH_SHARD_SIZE)
+analytics = SpendingAnalytics()
+recurring = RecurringDetector()
+registry = ModelRegistry(MODEL_DIR, max_loaded=MODELS_MAX_LOADED)
+routing = ModelRouting(ROUTE_MODEL, ROUTE_PERCENT)
+shadow = ShadowEvaluator(registry, SHADOW_MODEL, SHADOW_SAMPLE_RATE, max_queue=SHADOW_QUEUE)
+admission = AdmissionControl(parse_limits(ADMISSION_LIMITS), max_wait_ms=ADMISSION_MAX_WAIT_MS)
+dedup = DedupIndex(DEDUP_MEMORY_BYTES, DEDUP_WINDOW_S, DEDUP_GENERATIONS, DEDUP_EXPECTED) \
+    if DEDUP_MEMORY_BYTES > 0 else None
+latency = LatencyBudget(workers=BUDGET_WORKERS, max_abandoned=BUDGET_MAX_ABANDONED)
+
+
+def _open_overrides() -> Optional[OverrideIndex]:
+    """The override index, or None (predictions skip overrides) if the file cannot be opened."""
+    if not OVERRIDES_PATH:
+        return None
+    try:
+        return OverrideIndex(OVERRIDES_PATH, OVERRIDES_MEMORY_BYTES, OVERRIDES_SYNC_S)
+    except (OSError, sqlite3.Error) as exc:
+        log.error(f"❌ Override index at {OVERRIDES_PATH} unavailable ({exc}); overrides disabled")
+        return None
+
+
+overrides = _open_overrides()
+
+
+def load_canonicalizer() -> None:
+    """(Re)build the merchant canonicalization index from known_merchants.json."""
+    if not CANONICALIZE:
+        return
+    merchants = load_known_merchants(KNOWN_MERCHANTS_PATH, str(Path(__file__).parent / "bank_sms_data.csv"),
+                                     _normalize)
+    store.canonicalizer = MerchantCanonicalizer(merchants, threshold=CANONICAL_THRESHOLD) if merchants else None
+    log.info(f"🔤 Merchant canonicalization over {len(merchants)} known merchants")
+
+
+def _warm_shard_pool() -> None:
+    """Start the batch workers on the new version now rather than on the first large batch."""
+    t0 = time.perf_counter()
+    try:
+        ready = shard_pool.warm(store.pipeline, store.version)
+    except Exception as exc:
+        log.warning(f"Shard pool warm-up failed: {exc} — workers will start on the first large batch")
+        return
+    log.info(f"Shard pool ready: {ready} worker(s) on version {store.version} "
+             f"({(time.perf_counter() - t0) * 1000:.0f} ms)")
 
 
 def load_model() -> None:
     """Load (or reload) the pickle model into memory."""
+    load_canonicalizer()
     paths_to_try = [
         MODEL_PATH,
         Path(__file__).parent / "expense_model.pkl",
@@ -84,11 +274,24 @@ def load_model() -> None:
         if p.exists():
             t0 = time.perf_counter()
             with open(p, "rb") as f:
-                store.pipeline = pickle.load(f)
+                data = f.read()
+            store.pipeline = pickle.loads(data)
+            store.version = hashlib.sha1(data).hexdigest()[:12]
             store.load_time_ms = (time.perf_counter() - t0) * 1000
             store.loaded_at = time.time()
             store.model_path = str(p)
-            log.info(f"✅ Model loaded from {p}  ({store.load_time_ms:.1f} ms)")
+            log.info(f"✅ Model loaded from {p}  ({store.load_time_ms:.1f} ms, version {store.version})")
+            if disk_cache is not None:
+                # other workers, routed and shadow models may still use other versions
+                try:
+                    purged = disk_cache.purge_idle_versions(store.version, CACHE_VERSION_IDLE_S)
+                except sqlite3.Error as exc:
+                    log.warning(f"Disk cache purge failed: {exc}")
+                    purged = 0
+                if purged:
+                    log.info(f"Purged {purged} cached predictions from idle model versions")
+            if shard_pool.enabled:
+                _warm_shard_pool()
             return
     log.error("❌ No model file found — predictions will use rule-based fallback")
 
@@ -100,6 +303,13 @@ def _normalize(text: str) -> str:
     return re.sub(r"\s+", " ", text).strip()
 
 
+def _merchant_key(merchant: str) -> str:
+    """Normalized merchant, mapped onto a known merchant when one matches — the cache/model key."""
+    key = _normalize(merchant)
+    canonicalizer = store.canonicalizer
+    return canonicalizer.canonical(key) if canonicalizer is not None and key else key
+
+
 def _rule_based_category(merchant: str) -> str:
     """Keyword fallback used when model is not loaded."""
     v = merchant.lower()
@@ -120,27 +330,177 @@ def _rule_based_category(merchant: str) -> str:
     return "Other"
 
 
-def _predict_single(merchant: str) -> tuple[str, float]:
-    """Return (category, confidence). Uses ML model or falls back to rules."""
-    if not merchant.strip():
-        return "Other", 0.0
-
-    normalized = _normalize(merchant)
-
-    if store.pipeline is not None:
+def _cache_get_many(version: str, keys: list[str]) -> dict[str, tuple[str, float]]:
+    """Memory cache first, then the shared disk cache (which back-fills memory)."""
+    found: dict[str, tuple[str, float]] = {}
+    missing = []
+    for key in keys:
+        hit = cache.get(version, key)
+        if hit is None:
+            missing.append(key)
+        else:
+            found[key] = hit
+    if missing and disk_cache is not None:
+        for key, hit in disk_cache.get_many(version, missing).items():
+            cache.put(version, key, hit)
+            found[key] = hit
+    return found
+
+
+def _cache_put_many(version: str, items: list[tuple[str, str, float]]) -> None:
+    """items: (normalized merchant, category, confidence)"""
+    for key, cat, conf in items:
+        cache.put(version, key, (cat, conf))
+    if disk_cache is not None:
+        disk_cache.put_many(version, items)
+
+
+def _active_model():
+    """The model for this request: the routed registry version, else the primary store."""
+    model = store
+    name = requested_model()
+    if name is not None:
         try:
-            proba = store.pipeline.predict_proba([normalized])[0]
-            idx   = int(np.argmax(proba))
-            cat   = store.pipeline.classes_[idx]
-            conf  = float(proba[idx])
-            return cat, conf
+            resolved = registry.resolve(name)
+            entry = registry.get(resolved) if resolved else None
         except Exception as exc:
-            log.warning(f"Model predict failed: {exc} — using rule fallback")
-
-    return _rule_based_category(merchant), 0.0
-
-
-def _parse_sms(text: str) -> dict:
+            log.warning(f"Loading model {name!r} failed: {exc} — serving primary")
+            entry = None
+        if entry is None:
+            log.warning(f"Unknown model {name!r} requested — serving primary")
+        else:
+            model = entry
+    mark_served(model.version)
+    return model
+
+
+def _shadow_sampled() -> bool:
+    """Shadow only requests the primary model actually served."""
+    return store.pipeline is not None and requested_model() is None and shadow.should_sample()
+
+
+def _shadow_submit(pipeline, keys: list[str], categories: list[str], ms: Optional[float]) -> None:
+    """
+    Offer one primary scoring to the shadow model. Called only on cache misses
+    with the raw model labels and the primary's own predict time, so both
+    sides of the comparison measure the same work.
+    """
+    if pipeline is store.pipeline and _shadow_sampled():
+        shadow.submit(keys, categories, ms)
+
+
+def _predict_proba(pipeline, texts: list[str]) -> np.ndarray:
+    """predict_proba, timed as separate vectorize / classify stages."""
+    steps = getattr(pipeline, "steps", None)
+    if not steps:
+        with stage("classify"):
+            return pipeline.predict_proba(texts)
+
+    X = texts
+    with stage("vectorize"):
+        for _, step in steps[:-1]:
+            X = step.transform(X)
+    with stage("classify"):
+        return steps[-1][1].predict_proba(X)
+
+
+def _score_single(pipeline, version: str, normalized: str) -> Optional[tuple[str, float]]:
+    """Model (category, confidence) for one normalized merchant; None if the model fails."""
+    try:
+        t0    = time.perf_counter()
+        proba = _predict_proba(pipeline, [normalized])[0]
+        ms    = (time.perf_counter() - t0) * 1000
+        idx   = int(np.argmax(proba))
+        cat   = str(pipeline.classes_[idx])
+        conf  = float(proba[idx])
+        _cache_put_many(version, [(normalized, cat, conf)])
+        _shadow_submit(pipeline, [normalized], [cat], ms)
+        return cat, conf
+    except Exception as exc:
+        log.warning(f"Model predict failed: {exc} — using rule fallback")
+        return None
+
+
+def _predict_single(merchant: str) -> tuple[str, float, bool]:
+    """
+    Return (category, confidence, used_model). Uses the ML model, raced
+    against the request's latency budget, or falls back to rules.
+    """
+    if not merchant.strip():
+        return "Other", 0.0, False
+
+    with stage("normalize"):
+        normalized = _merchant_key(merchant)
+
+    model = _active_model()
+    pipeline, version = model.pipeline, model.version
+    if pipeline is not None:
+        with stage("cache"):
+            hit = _cache_get_many(version, [normalized]).get(normalized)
+        if hit is not None:
+            return (*hit, True)
+        in_time, scored = latency.run("single", _score_single, pipeline, version, normalized)
+        if not in_time:
+            log.info(f"Latency budget exceeded for '{merchant}' — using rule fallback")
+        if scored is not None:
+            return (*scored, True)
+
+    return _rule_based_category(merchant), 0.0, False
+
+
+def _score_unique(keys: list[str], model) -> tuple[list[str], np.ndarray]:
+    """Score unique normalized keys: cache first, then only the misses."""
+    pipeline, version = model.pipeline, model.version
+    categories: list = [None] * len(keys)
+    confidences = np.zeros(len(keys))
+
+    with stage("cache"):
+        found = _cache_get_many(version, keys)
+    misses = []
+    for k, key in enumerate(keys):
+        hit = found.get(key)
+        if hit is None:
+            misses.append(k)
+        else:
+            categories[k], confidences[k] = hit
+    if not misses:
+        return categories, confidences
+
+    miss_keys = [keys[k] for k in misses]
+    # The pool holds one model version at a time, so only the primary is sharded
+    if model is store and shard_pool.enabled and len(miss_keys) >= BATCH_SHARD_THRESHOLD:
+        with stage("classify"):
+            miss_cats, miss_confs = shard_pool.score(miss_keys, pipeline, version)
+        # sharded wall time is not comparable with a single-process predict
+        _shadow_submit(pipeline, miss_keys, miss_cats, None)
+    else:
+        t0 = time.perf_counter()
+        proba = _predict_proba(pipeline, miss_keys)
+        ms = (time.perf_counter() - t0) * 1000
+        idx = np.argmax(proba, axis=1)
+        miss_cats = np.asarray(pipeline.classes_)[idx].tolist()
+        miss_confs = proba[np.arange(len(miss_keys)), idx]
+        _shadow_submit(pipeline, miss_keys, miss_cats, ms)
+
+    for k, cat, conf in zip(misses, miss_cats, miss_confs):
+        categories[k] = cat
+        confidences[k] = conf
+    _cache_put_many(version, [(key, cat, float(conf)) for key, cat, conf in zip(miss_keys, miss_cats, miss_confs)])
+    return categories, confidences
+
+
+def _merchant_ok(candidate: str) -> bool:
+    """Reject generic/currency words, single characters and pure numbers."""
+    if _SKIP_WORDS.match(candidate):
+        return False
+    if len(candidate) < 2:
+        return False
+    if re.match(r"^\d+$", candidate):   # pure number → skip
+        return False
+    return True
+
+
+def _parse_sms_full(text: str) -> dict:
     """Extract amount, date, merchant from raw SMS text."""
     result = {"amount": None, "date": None, "merchant": None, "is_atm": False}
 
@@ -162,11 +522,7 @@ def _parse_sms(text: str) -> dict:
     # Try each keyword match in order; skip generic/currency words
     for m in _MERCH_RE.finditer(text):
         candidate = m.group(1).strip()
-        if _SKIP_WORDS.match(candidate):
-            continue
-        if len(candidate) < 2:
-            continue
-        if re.match(r"^\d+$", candidate):   # pure number → skip
+        if not _merchant_ok(candidate):
             continue
         result["merchant"] = re.sub(r"\s+", " ", candidate).strip()
         break
@@ -174,12 +530,296 @@ def _parse_sms(text: str) -> dict:
     return result
 
 
+sms_templates = TemplateCache(
+    _parse_sms_full, _AMOUNT_RE, _DATE_RE, _MERCH_RE, _MERCH_NAME, _ATM_RE, _merchant_ok,
+    max_skeletons=SMS_TEMPLATE_MAX, validate_first=SMS_TEMPLATE_VALIDATE,
+)
+
+
+def _parse_sms(text: str) -> dict:
+    """Learned per-template regex when the skeleton is known, full cascade otherwise."""
+    if SMS_TEMPLATES:
+        return sms_templates.parse(text)
+    return _parse_sms_full(text)
+
+
+# ── Prediction core (shared by the HTTP routes and the UDS transport) ────────
+class RequestError(ValueError):
+    """Invalid input — HTTP 422, or an error frame on the UDS transport."""
+
+
+def _user_override(user_id: Optional[str], merchant: str) -> Optional[str]:
+    """The category this user corrected the merchant to, if any."""
+    if not user_id or overrides is None or not merchant:
+        return None
+    with stage("override"):
+        return overrides.get(user_id, _normalize(merchant))
+
+
+def merchant_prediction(merchant: str, user_id: Optional[str] = None) -> dict:
+    """Predict expense category from a merchant name."""
+    if not merchant.strip():
+        raise RequestError("merchant must not be empty")
+
+    override = _user_override(user_id, merchant)
+    if override is not None:
+        log.info(f"predict merchant='{merchant}' → {override} (user override)")
+        return {"merchant": merchant, "category": override, "confidence": 1.0,
+                "used_model": False, "override": True}
+
+    t0  = time.perf_counter()
+    cat, conf, used_model = _predict_single(merchant)
+    ms  = (time.perf_counter() - t0) * 1000
+
+    log.info(f"predict merchant='{merchant}' → {cat} ({conf:.2f}) in {ms:.1f}ms")
+    return {
+        "merchant": merchant,
+        "category": cat,
+        "confidence": round(conf, 4),
+        "used_model": used_model,
+    }
+
+
+def _track_recurring(user_id: str, merchant: str, amount: Optional[str],
+                     sms_date: Optional[str], category: str) -> Optional[dict]:
+    """Feed one categorized debit to the detector; returns its series once recurring."""
+    try:
+        value = float(amount) if amount else 0.0
+    except ValueError:
+        return None
+    on = parse_date(sms_date) if sms_date else None
+    if sms_date and on is None:
+        return None
+    with stage("recurring"):
+        series = recurring.observe(user_id, merchant, value, category, on)
+    return series.to_dict() if series is not None and series.is_recurring else None
+
+
+def _dedup_fingerprint(parsed: dict, sms_text: str) -> tuple:
+    """(amount, merchant, date, reference) that identify one debit in the dedup index."""
+    merchant_key = "atm" if parsed["is_atm"] else _normalize(parsed["merchant"] or "")
+    return parsed["amount"], merchant_key, parsed["date"], reference(sms_text)
+
+
+def sms_prediction(sms_text: str, user_id: Optional[str] = None) -> dict:
+    """Parse SMS text, extract merchant, predict category."""
+    if not sms_text.strip():
+        raise RequestError("sms_text must not be empty")
+
+    t0     = time.perf_counter()
+    with stage("parse"):
+        parsed = _parse_sms(sms_text)
+    ms     = (time.perf_counter() - t0) * 1000
+
+    # Second SMS for a payment already stored (POST /dedup/record) — answer before any scoring
+    if user_id and dedup is not None and parsed["amount"] is not None:
+        with stage("dedup"):
+            duplicate = dedup.is_duplicate(user_id, *_dedup_fingerprint(parsed, sms_text))
+        if duplicate:
+            log.info(f"SMS → duplicate of a recent transaction  amount={parsed['amount']} user={user_id}")
+            return {
+                "amount": parsed["amount"],
+                "date": parsed["date"],
+                "merchant": "ATM" if parsed["is_atm"] else parsed["merchant"] or "",
+                "category": "Other",
+                "confidence": 0.0,
+                "type": "cash_withdrawal" if parsed["is_atm"] else "expense",
+                "used_model": False,
+                "duplicate": True,
+            }
+
+    # ATM withdrawal — no category prediction needed
+    if parsed["is_atm"]:
+        log.info(f"SMS → ATM withdrawal  amount={parsed['amount']} in {ms:.1f}ms")
+        return {
+            "amount": parsed["amount"],
+            "date": parsed["date"],
+            "merchant": "ATM",
+            "category": "Other",
+            "confidence": 1.0,
+            "type": "cash_withdrawal",
+            "used_model": False,
+        }
+
+    merchant = parsed["merchant"] or ""
+    override = _user_override(user_id, merchant)
+    if override is not None:
+        log.info(f"SMS → merchant='{merchant}' cat={override} (user override) in {ms:.1f}ms")
+        return {
+            "amount": parsed["amount"],
+            "date": parsed["date"],
+            "merchant": merchant,
+            "category": override,
+            "confidence": 1.0,
+            "type": "expense",
+            "used_model": False,
+            "override": True,
+            "recurring": _track_recurring(user_id, merchant, parsed["amount"], parsed["date"], override),
+        }
+
+    cat, conf, used_model = _predict_single(merchant) if merchant else ("Other", 0.0, False)
+    cat = cat if cat != "Uncategorized" else "Other"
+
+    log.info(f"SMS → merchant='{merchant}' cat={cat} ({conf:.2f}) in {ms:.1f}ms")
+    return {
+        "amount": parsed["amount"],
+        "date": parsed["date"],
+        "merchant": merchant,
+        "category": cat,
+        "confidence": round(conf, 4),
+        "type": "expense",
+        "used_model": used_model,
+        "recurring": _track_recurring(user_id, merchant, parsed["amount"], parsed["date"], cat)
+        if user_id and merchant else None,
+    }
+
+
+def batch_prediction(merchants: list[str], user_id: Optional[str] = None) -> tuple[list[dict], list[int], float]:
+    """
+    Categorize multiple merchants. Returns (one result per distinct raw
+    merchant, row → result index, duration_ms) so transports can share one
+    result object across every row that repeats a merchant. With a user_id,
+    merchants the user has corrected are answered from their overrides and
+    never reach the cache or the model.
+    """
+    if not merchants:
+        raise RequestError("merchants list must not be empty")
+    if len(merchants) > MAX_BATCH:
+        raise RequestError(f"Max {MAX_BATCH} merchants per batch")
+
+    t0 = time.perf_counter()
+    with stage("normalize"):
+        plan = plan_batch(merchants, _merchant_key)
+
+    # overrides are keyed on the user's spelling, not the canonical key:
+    # "Uber Eats" corrected to Food must not move every "Uber" ride
+    found: dict[int, str] = {}          # distinct_raw j → overriding category
+    if user_id and overrides is not None:
+        with stage("override"):
+            names = [_normalize(m) for m in plan.distinct_raw]
+            hits = overrides.get_many(user_id, names)
+            found = {j: hits[name] for j, name in enumerate(names) if name in hits}
+    scored = sorted({k for j, k in enumerate(plan.raw_to_key.tolist()) if j not in found})
+    categories: list = [None] * plan.n_unique
+    confidences = np.zeros(plan.n_unique)
+
+    model = _active_model()
+    used_model = model.pipeline is not None
+    scored_cats = None
+    if used_model and scored:
+        try:
+            in_time, result = latency.run("batch", _score_unique, [plan.keys[k] for k in scored], model)
+            if not in_time:
+                log.info(f"Latency budget exceeded for {len(scored)} merchants — using rule fallback")
+        except Exception as exc:
+            log.warning(f"Batch model failed: {exc} — falling back to rules")
+            result = None
+        if result is None:
+            used_model = False
+        else:
+            scored_cats, scored_confs = result
+    if scored_cats is None:
+        scored_cats = [_rule_based_category(plan.raw[k]) for k in scored]
+        scored_confs = np.zeros(len(scored))
+    for k, cat, conf in zip(scored, scored_cats, scored_confs):
+        categories[k] = cat
+        confidences[k] = conf
+
+    key_confs = np.round(confidences, 4).tolist()
+    distinct = []
+    for j, (merchant, k) in enumerate(zip(plan.distinct_raw, plan.raw_to_key.tolist())):
+        if j in found:
+            distinct.append({
+                "merchant": merchant,
+                "category": found[j],
+                "confidence": 1.0,
+                "used_model": False,
+                "override": True,
+            })
+            continue
+        distinct.append({
+            "merchant": merchant,
+            "category": categories[k],
+            "confidence": key_confs[k],
+            "used_model": used_model,
+        })
+
+    ms = (time.perf_counter() - t0) * 1000
+    log.info(f"Batch {len(merchants)} merchants ({plan.n_unique} unique, "
+             f"{len(found)} overridden) in {ms:.1f}ms")
+    return distinct, plan.raw_inverse.tolist(), ms
+
+
+def classify_merchants(merchants: list[str]) -> list[tuple[str, float, bool]]:
+    """(category, confidence, used_model) per merchant — the inbox import's classifier."""
+    distinct, rows, _ = batch_prediction(merchants)
+    return [
+        (d["category"], d["confidence"], d["used_model"])
+        for d in (distinct[j] for j in rows)
+    ]
+
+
+def _require_str(args: dict, name: str) -> str:
+    value = args.get(name)
+    if not isinstance(value, str):
+        raise RequestError(f"{name} must be a string")
+    return value
+
+
+def _budgeted(handler):
+    """UDS handler that applies the frame's optional "budget_ms" arg."""
+    def run(args: dict):
+        budget_ms = args.get("budget_ms")
+        valid = isinstance(budget_ms, (int, float)) and not isinstance(budget_ms, bool) and budget_ms > 0
+        if budget_ms is not None and not valid:
+            raise RequestError("budget_ms must be a positive number")     # as the HTTP models' gt=0
+        with latency.scope(budget_ms):
+            return handler(args)
+    return run
+
+
+def _uds_batch(args: dict) -> dict:
+    merchants = args.get("merchants")
+    if not isinstance(merchants, list) or not all(isinstance(m, str) for m in merchants):
+        raise RequestError("merchants must be a list of strings")
+    distinct, rows, ms = batch_prediction(merchants, args.get("user_id"))
+    return {"results": [distinct[j] for j in rows], "count": len(rows), "duration_ms": round(ms, 2)}
+
+
+UDS_HANDLERS = {
+    "merchant": _budgeted(lambda args: merchant_prediction(_require_str(args, "merchant"), args.get("user_id"))),
+    "sms": _budgeted(lambda args: sms_prediction(_require_str(args, "sms_text"), args.get("user_id"))),
+    "batch": _budgeted(_uds_batch),
+}
+
+
 # ── Lifespan: load model at startup ───────────────────────────────────────────
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     log.info("🚀 ExpenseIQ ML Service starting...")
     load_model()
+    if ANALYTICS_SEED:
+        t0 = time.perf_counter()
+        rows = analytics.load_csv(ANALYTICS_SEED)
+        log.info(f"📊 Analytics seeded with {rows} transactions in {(time.perf_counter() - t0) * 1000:.0f}ms")
+    if RECURRING_SEED:
+        t0 = time.perf_counter()
+        n = recurring.bootstrap_csv(RECURRING_SEED)
+        log.info(f"🔁 Recurring detector seeded with {n} series in {(time.perf_counter() - t0) * 1000:.0f}ms")
+    uds = None
+    if UDS_PATH:
+        uds = UdsServer(
+            UDS_PATH.replace("{pid}", str(os.getpid())),
+            UDS_HANDLERS,
+            error_types=(RequestError,),
+            workers=UDS_WORKERS,
+        )
+        await uds.start()
     yield
+    if uds is not None:
+        await uds.stop()
+    shard_pool.shutdown()
+    latency.shutdown()
     log.info("💤 ML Service shutting down")
 
 
@@ -196,24 +836,38 @@ app.add_middleware(
     allow_origins=ALLOWED_ORIGINS,
     allow_methods=["GET", "POST"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing", "X-Model-Version"],
 )
+app.add_middleware(ModelRoutingMiddleware, routing=routing)
+app.add_middleware(AdmissionMiddleware, control=admission)
+# Outside admission so that time in the queue is charged to the latency budget
+app.add_middleware(LatencyBudgetMiddleware, budget=latency)
+# Added last so it is outermost and its "total" covers CORS as well
+app.add_middleware(ServerTimingMiddleware)
 
 
 # ── Schemas ────────────────────────────────────────────────────────────────────
 class MerchantRequest(BaseModel):
     merchant: str
+    user_id: Optional[str] = None       # consult this user's corrections first
+    budget_ms: Optional[float] = Field(default=None, gt=0)     # rules instead of a late model answer
 
 class SmsRequest(BaseModel):
     sms_text: str
+    user_id: Optional[str] = None       # enables overrides, recurring-payment tracking and dedup
+    budget_ms: Optional[float] = Field(default=None, gt=0)
 
 class BatchRequest(BaseModel):
     merchants: list[str]
+    user_id: Optional[str] = None       # consult this user's corrections first
+    budget_ms: Optional[float] = Field(default=None, gt=0)
 
 class PredictionResponse(BaseModel):
     merchant: str
     category: str
     confidence: float
     used_model: bool
+    override: bool = False              # the user's own correction, not a prediction
 
 class SmsResponse(BaseModel):
     amount: Optional[str]
@@ -223,12 +877,68 @@ class SmsResponse(BaseModel):
     confidence: float
     type: str           # "expense" | "cash_withdrawal"
     used_model: bool
+    recurring: Optional[dict] = None    # set once this debit belongs to a recurring series
+    duplicate: bool = False             # same payment seen recently for this user; not scored
+    override: bool = False              # the user's own correction, not a prediction
 
 class BatchResponse(BaseModel):
     results: list[PredictionResponse]
     count: int
     duration_ms: float
 
+class InboxRequest(BaseModel):
+    messages: list[str]
+
+class TransactionIn(BaseModel):
+    amount: float
+    merchant: str = ""
+    date: str                           # DD-MM-YYYY (as parsed) or ISO
+    category: str
+    user_id: Optional[str] = None
+
+class AnalyticsAppendRequest(BaseModel):
+    transactions: list[TransactionIn]
+
+class AnalyticsReportRequest(BaseModel):
+    user_id: str = DEFAULT_USER
+    monthly_limit: float = 0.0
+    category_budgets: dict[str, float] = {}
+    as_of: Optional[date] = None        # defaults to the latest transaction
+    window: int = Field(default=7, ge=1, le=90)
+    days: int = Field(default=30, ge=1, le=366)
+    top_k: int = Field(default=5, ge=1, le=50)
+    months: int = Field(default=6, ge=1, le=36)
+
+class ForecastRequest(BaseModel):
+    user_id: str = DEFAULT_USER
+    category_budgets: dict[str, float] = {}     # categories without one use the usual month
+    as_of: Optional[date] = None        # defaults to the latest transaction
+    history_days: int = Field(default=HISTORY_DAYS, ge=14, le=366)
+
+class OverrideIn(BaseModel):
+    user_id: str
+    merchant: str
+    category: Optional[str] = None      # None removes the correction
+
+class OverridesRequest(BaseModel):
+    overrides: list[OverrideIn]
+
+class DedupRecordRequest(BaseModel):
+    sms_text: str
+    user_id: str
+
+class RoutingRequest(BaseModel):
+    model: Optional[str] = None         # registry name; empty/None = primary only
+    percent: float = Field(default=0.0, ge=0.0, le=100.0)
+
+class ShadowRequest(BaseModel):
+    model: Optional[str] = None         # registry name; empty/None = off
+    sample_rate: float = Field(default=0.1, ge=0.0, le=1.0)
+
+class ProfilingRequest(BaseModel):
+    enabled: Optional[bool] = None
+    sample_rate: Optional[float] = Field(default=None, ge=0.0, le=1.0)
+
 
 # ── Routes ─────────────────────────────────────────────────────────────────────
 @app.get("/health")
@@ -241,110 +951,111 @@ def health():
     }
 
 
+@app.exception_handler(RequestError)
+async def request_error_handler(request: Request, exc: RequestError):
+    return JSONResponse(status_code=422, content={"detail": str(exc)})
+
+
 @app.post("/predict/merchant", response_model=PredictionResponse)
+@profiled("predict_merchant")
 def predict_merchant(req: MerchantRequest):
     """Predict expense category from a merchant name."""
-    if not req.merchant.strip():
-        raise HTTPException(status_code=422, detail="merchant must not be empty")
-
-    t0  = time.perf_counter()
-    cat, conf = _predict_single(req.merchant)
-    ms  = (time.perf_counter() - t0) * 1000
-
-    log.info(f"predict merchant='{req.merchant}' → {cat} ({conf:.2f}) in {ms:.1f}ms")
-    return PredictionResponse(
-        merchant=req.merchant,
-        category=cat,
-        confidence=round(conf, 4),
-        used_model=store.pipeline is not None,
-    )
+    with latency.scope(req.budget_ms):
+        result = merchant_prediction(req.merchant, req.user_id)
+    with stage("serialize"):
+        return PredictionResponse(**result)
 
 
 @app.post("/predict/sms", response_model=SmsResponse)
+@profiled("predict_sms")
 def predict_sms(req: SmsRequest):
     """Parse SMS text, extract merchant, predict category."""
-    if not req.sms_text.strip():
-        raise HTTPException(status_code=422, detail="sms_text must not be empty")
+    with latency.scope(req.budget_ms):
+        result = sms_prediction(req.sms_text, req.user_id)
+    with stage("serialize"):
+        return SmsResponse(**result)
 
-    t0     = time.perf_counter()
-    parsed = _parse_sms(req.sms_text)
-    ms     = (time.perf_counter() - t0) * 1000
 
-    # ATM withdrawal — no category prediction needed
-    if parsed["is_atm"]:
-        log.info(f"SMS → ATM withdrawal  amount={parsed['amount']} in {ms:.1f}ms")
-        return SmsResponse(
-            amount=parsed["amount"],
-            date=parsed["date"],
-            merchant="ATM",
-            category="Other",
-            confidence=1.0,
-            type="cash_withdrawal",
-            used_model=False,
-        )
+@app.post("/predict/batch", response_model=BatchResponse)
+@profiled("predict_batch")
+def predict_batch(req: BatchRequest):
+    """Categorize multiple merchants in one request."""
+    with latency.scope(req.budget_ms):
+        distinct, rows, ms = batch_prediction(req.merchants, req.user_id)
+    # One response object per distinct raw merchant, shared by repeated rows
+    with stage("serialize"):
+        by_raw = [PredictionResponse(**d) for d in distinct]
+        results = [by_raw[j] for j in rows]
+    return BatchResponse(results=results, count=len(results), duration_ms=round(ms, 2))
 
-    merchant = parsed["merchant"] or ""
-    cat, conf = _predict_single(merchant) if merchant else ("Other", 0.0)
 
-    log.info(f"SMS → merchant='{merchant}' cat={cat} ({conf:.2f}) in {ms:.1f}ms")
-    return SmsResponse(
-        amount=parsed["amount"],
-        date=parsed["date"],
-        merchant=merchant,
-        category=cat if cat != "Uncategorized" else "Other",
-        confidence=round(conf, 4),
-        type="expense",
-        used_model=store.pipeline is not None,
+@app.post("/import/inbox")
+def import_inbox(req: InboxRequest):
+    """
+    Stream candidate expenses from a whole inbox as NDJSON, one line per debit
+    SMS, followed by a {"summary": ...} line with reject and throughput stats.
+    """
+    if not req.messages:
+        raise RequestError("messages list must not be empty")
+    if len(req.messages) > MAX_BATCH:
+        raise RequestError(f"Max {MAX_BATCH} messages per import")
+
+    def lines():
+        stats = ImportStats()
+        for candidate in stream_import(req.messages, _parse_sms, classify_merchants, stats=stats):
+            yield json.dumps(candidate) + "\n"
+        summary = stats.to_dict()
+        log.info(f"📥 Inbox import: {summary['candidates']}/{summary['messages']} candidates "
+                 f"({summary['reject_rate']:.1%} rejected) in {summary['elapsed_seconds']:.2f}s")
+        yield json.dumps({"summary": summary}) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+@app.post("/analytics/transactions")
+def analytics_append(req: AnalyticsAppendRequest):
+    """Append transactions; only the new rows are aggregated."""
+    if not req.transactions:
+        raise RequestError("transactions list must not be empty")
+    if len(req.transactions) > MAX_BATCH:
+        raise RequestError(f"Max {MAX_BATCH} transactions per request")
+    t0 = time.perf_counter()
+    try:
+        added, rejected = analytics.append_records([t.model_dump() for t in req.transactions])
+    except ValueError as exc:          # a code past the packed-key range
+        raise RequestError(str(exc))
+    return {
+        "added": added,
+        "rejected": rejected,
+        "total_rows": analytics.rows,
+        "duration_ms": round((time.perf_counter() - t0) * 1000, 2),
+    }
+
+
+@app.post("/analytics/report")
+def analytics_report(req: AnalyticsReportRequest):
+    """Spending summary for one user, computed from the aggregates only."""
+    return analytics.report(
+        req.user_id, req.monthly_limit, req.category_budgets, req.as_of,
+        window=req.window, days=req.days, top_k=req.top_k, months=req.months,
     )
 
 
-@app.post("/predict/batch", response_model=BatchResponse)
-def predict_batch(req: BatchRequest):
-    """Categorize multiple merchants in one request."""
-    if not req.merchants:
-        raise HTTPException(status_code=422, detail="merchants list must not be empty")
-    if len(req.merchants) > 500:
-        raise HTTPException(status_code=422, detail="Max 500 merchants per batch")
+@app.post("/analytics/forecast")
+def analytics_forecast(req: ForecastRequest):
+    """Month outlook per category; `alerts` lists the categories on course to overspend."""
+    return forecast_user(analytics, req.user_id, req.category_budgets, req.as_of, req.history_days)
 
-    t0 = time.perf_counter()
-    results = []
 
-    # Batch through model for speed (single predict_proba call)
-    if store.pipeline is not None:
-        try:
-            normalized = [_normalize(m) for m in req.merchants]
-            probas     = store.pipeline.predict_proba(normalized)
-            classes    = store.pipeline.classes_
-
-            for i, merchant in enumerate(req.merchants):
-                idx  = int(np.argmax(probas[i]))
-                cat  = classes[idx]
-                conf = float(probas[i][idx])
-                results.append(PredictionResponse(
-                    merchant=merchant, category=cat,
-                    confidence=round(conf, 4), used_model=True,
-                ))
-        except Exception as exc:
-            log.warning(f"Batch model failed: {exc} — falling back to rules")
-            results = [
-                PredictionResponse(
-                    merchant=m, category=_rule_based_category(m),
-                    confidence=0.0, used_model=False,
-                )
-                for m in req.merchants
-            ]
-    else:
-        results = [
-            PredictionResponse(
-                merchant=m, category=_rule_based_category(m),
-                confidence=0.0, used_model=False,
-            )
-            for m in req.merchants
-        ]
+@app.get("/analytics/stats")
+def analytics_stats():
+    return analytics.stats()
 
-    ms = (time.perf_counter() - t0) * 1000
-    log.info(f"Batch {len(req.merchants)} merchants in {ms:.1f}ms")
-    return BatchResponse(results=results, count=len(results), duration_ms=round(ms, 2))
+
+@app.get("/recurring/{user_id}")
+def recurring_payments(user_id: str, include_all: bool = False):
+    """Recurring series for a user, soonest next_due first."""
+    return {"user_id": user_id, "series": recurring.series(user_id, only_recurring=not include_all)}
 
 
 @app.get("/model/info")
@@ -356,9 +1067,15 @@ def model_info():
     try:
         classes = list(store.pipeline.classes_)
         steps   = [s[0] for s in store.pipeline.steps]
+        vec     = store.pipeline.steps[0][1]
+        featurizer = type(vec).__name__
+        # Hashing models have a fixed width; TF-IDF width = vocabulary size
+        n_features = len(vec.vocabulary_) if hasattr(vec, "vocabulary_") else getattr(vec, "n_features", None)
     except Exception:
         classes = []
         steps   = []
+        featurizer = None
+        n_features = None
 
     return {
         "loaded": True,
@@ -367,9 +1084,143 @@ def model_info():
         "load_time_ms": round(store.load_time_ms, 1),
         "classes": classes,
         "pipeline_steps": steps,
+        "featurizer": featurizer,
+        "n_features": n_features,
+    }
+
+
+@app.get("/models")
+def list_models():
+    """Primary model plus every registry version (rescanned on each call)."""
+    registry.discover()
+    return {
+        "primary": {"name": PRIMARY, "version": store.version, "path": store.model_path},
+        "models": registry.status(),
+        "routing": routing.status(),
+        "shadow": {"model": shadow.model or None, "sample_rate": shadow.sample_rate},
+    }
+
+
+def _require_model(name: Optional[str]) -> str:
+    if not name:
+        return ""
+    registry.discover()
+    try:
+        resolved = registry.resolve(name)
+    except LookupError as exc:
+        raise RequestError(str(exc))
+    if resolved is None:
+        raise RequestError(f"unknown model {name!r}")
+    return resolved
+
+
+@app.post("/models/routing")
+def configure_routing(req: RoutingRequest):
+    """Send `percent`% of requests without an X-Model-Version header to `model`."""
+    routing.model = _require_model(req.model)
+    routing.percent = req.percent if routing.model else 0.0
+    log.info(f"Routing {routing.percent}% of traffic to {routing.model or PRIMARY}")
+    return routing.status()
+
+
+@app.get("/models/shadow")
+def shadow_stats():
+    """Agreement and latency of the shadow model against the primary."""
+    return shadow.stats()
+
+
+@app.post("/models/shadow")
+def configure_shadow(req: ShadowRequest):
+    """Start, retarget or stop shadow evaluation (stats reset on a new model)."""
+    shadow.configure(_require_model(req.model), req.sample_rate)
+    log.info(f"Shadow model={shadow.model or None} sample_rate={shadow.sample_rate}")
+    return shadow.stats()
+
+
+@app.post("/overrides")
+def record_overrides(req: OverridesRequest):
+    """Store user corrections (merchant → category); they win over the model at once."""
+    if overrides is None:
+        raise RequestError("override index is disabled (ML_OVERRIDES_PATH empty or not writable)")
+    rows = [(o.user_id, _normalize(o.merchant), o.category) for o in req.overrides]
+    if not all(user_id and key for user_id, key, _ in rows):
+        raise RequestError("user_id and merchant must not be empty")
+    written = overrides.set_many(rows)
+    log.info(f"Recorded {written} merchant overrides")
+    return {"written": written}
+
+
+@app.get("/overrides/stats")
+def override_stats():
+    """Stored corrections, loaded users, memory per user / override, and hit rate."""
+    return overrides.stats() if overrides is not None else {"enabled": False}
+
+
+@app.get("/cache/stats")
+def cache_stats():
+    """
+    Prediction and SMS template cache hit rates (memory: this worker, disk:
+    shared), and how often merchants were canonicalized.
+    """
+    return {
+        "model_version": store.version,
+        "memory": cache.stats(),
+        "disk": disk_cache.stats() if disk_cache is not None else None,
+        "sms_templates": sms_templates.stats() if SMS_TEMPLATES else None,
+        "canonicalization": store.canonicalizer.stats() if store.canonicalizer is not None else None,
     }
 
 
+@app.get("/admin/profiling")
+def profiling_status():
+    """Sampled-profiling settings and how many profiles were written."""
+    return profiler.status()
+
+
+@app.post("/dedup/record")
+def dedup_record(req: DedupRecordRequest):
+    """Remember an SMS whose expense was stored; later SMS for the same debit are duplicates."""
+    if dedup is None:
+        return {"recorded": False}
+    if not req.user_id or not req.sms_text.strip():
+        raise RequestError("user_id and sms_text must not be empty")
+    parsed = _parse_sms(req.sms_text)
+    if parsed["amount"] is None:
+        return {"recorded": False}
+    return {"recorded": dedup.record(req.user_id, *_dedup_fingerprint(parsed, req.sms_text))}
+
+
+@app.get("/admin/dedup")
+def dedup_status():
+    """Duplicate-SMS index: memory, fill, false-positive rate and duplicates caught."""
+    return dedup.stats() if dedup is not None else {"enabled": False}
+
+
+@app.get("/admin/latency-budget")
+def latency_budget_status():
+    """Budgeted requests, deadline misses (rule fallbacks) and budget left at scoring time."""
+    return latency.stats()
+
+
+@app.get("/admin/admission")
+def admission_status():
+    """Slots in use, queue depth, rejections, and queue wait vs service time."""
+    return admission.stats()
+
+
+@app.post("/admin/profiling")
+def configure_profiling(req: ProfilingRequest):
+    """Switch sampled profiling on/off at runtime (per worker process)."""
+    if req.sample_rate is not None:
+        profiler.sample_rate = req.sample_rate
+    if req.enabled is False:
+        profiler.sample_rate = 0.0
+    elif req.enabled and profiler.sample_rate == 0:
+        profiler.sample_rate = 0.01
+    log.info(f"Profiling sample_rate={profiler.sample_rate}")
+    return profiler.status()
+
+
 @app.post("/model/reload")
 def reload_model():
     """Hot-reload the model without restarting the service."""
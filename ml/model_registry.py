@@ -0,0 +1,321 @@
+"""
+model_registry.py — several model versions side by side, routing and shadowing.
+
+  ModelRegistry     — knows every pickle in artifacts/models/, loads one only
+                      when a request first needs it, and keeps at most
+                      `max_loaded` in memory (least recently used unloaded)
+  ModelRouting      — per-request choice: an X-Model-Version header wins,
+                      otherwise `percent`% of traffic goes to a route model
+  ShadowEvaluator   — a candidate re-scores a sample of live traffic on a
+                      background thread; requests only pay for a random()
+                      and a put_nowait(), and a full queue drops the sample
+
+The primary model stays in main.py's ModelStore; the name "primary" (or an
+empty header) always means that one.
+
+Used by: main.py
+"""
+
+import hashlib
+import logging
+import pickle
+import queue
+import random
+import threading
+import time
+from collections import Counter, OrderedDict, deque
+from contextvars import ContextVar
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+log = logging.getLogger("ml_service")
+
+PRIMARY = "primary"
+MIN_VERSION_PREFIX = 8      # of the 12-hex-char version; shorter prefixes match too much
+HEADER = b"x-model-version"
+# Timestamped copies only; latest_*.pkl duplicate one of them
+MODEL_PATTERNS = ("expense_model_*.pkl", "compressed_model_*.pkl")
+
+
+@dataclass
+class LoadedModel:
+    """Same fields main.py reads from its ModelStore."""
+    pipeline: object
+    version: str
+    model_path: str
+    load_time_ms: float
+    loaded_at: float
+
+
+class ModelRegistry:
+    def __init__(self, model_dir: str, max_loaded: int = 3):
+        self.model_dir = Path(model_dir)
+        self.max_loaded = max_loaded
+        self.paths: dict[str, Path] = {}
+        self._loaded: OrderedDict[str, LoadedModel] = OrderedDict()
+        self._lock = threading.Lock()
+        self._load_locks: dict[str, threading.Lock] = {}
+        self.discover()
+
+    def discover(self) -> list[str]:
+        """Pick up models written since start-up."""
+        found = {}
+        if self.model_dir.is_dir():
+            for pattern in MODEL_PATTERNS:
+                for path in self.model_dir.glob(pattern):
+                    found[path.stem] = path
+        with self._lock:
+            self.paths.update(found)
+            return sorted(self.paths)
+
+    def resolve(self, name: str) -> Optional[str]:
+        """
+        Registry name, or the version hash (at least MIN_VERSION_PREFIX hex
+        characters of it) of an already loaded model. Raises LookupError when
+        the prefix matches more than one loaded model.
+        """
+        if name in self.paths:
+            return name
+        if len(name) < MIN_VERSION_PREFIX:
+            return None
+        with self._lock:
+            matches = [loaded_name for loaded_name, model in self._loaded.items()
+                       if model.version.startswith(name)]
+        if len(matches) > 1:
+            raise LookupError(f"version prefix {name!r} matches {', '.join(sorted(matches))}")
+        return matches[0] if matches else None
+
+    def get(self, name: str) -> Optional[LoadedModel]:
+        with self._lock:
+            model = self._loaded.get(name)
+            if model is not None:
+                self._loaded.move_to_end(name)
+                return model
+            path = self.paths.get(name)
+            if path is None:
+                return None
+            load_lock = self._load_locks.setdefault(name, threading.Lock())
+
+        # One loader per name; other requests for it wait instead of loading twice
+        with load_lock:
+            with self._lock:
+                if name in self._loaded:
+                    return self._loaded[name]
+            t0 = time.perf_counter()
+            data = path.read_bytes()
+            model = LoadedModel(
+                pipeline=pickle.loads(data),
+                version=hashlib.sha1(data).hexdigest()[:12],
+                model_path=str(path),
+                load_time_ms=(time.perf_counter() - t0) * 1000,
+                loaded_at=time.time(),
+            )
+            with self._lock:
+                self._loaded[name] = model
+                while len(self._loaded) > self.max_loaded:
+                    evicted, _ = self._loaded.popitem(last=False)
+                    log.info(f"Registry unloaded {evicted}")
+            log.info(f"📦 Registry loaded {name} ({model.load_time_ms:.1f} ms, version {model.version})")
+            return model
+
+    def status(self) -> list[dict]:
+        with self._lock:
+            return [
+                {
+                    "name": name,
+                    "path": str(path),
+                    "loaded": name in self._loaded,
+                    "version": self._loaded[name].version if name in self._loaded else None,
+                }
+                for name, path in sorted(self.paths.items())
+            ]
+
+
+# ── Per-request routing ───────────────────────────────────────────────────────
+# {"requested": name or None, "served": version} for the current request
+_route: ContextVar[Optional[dict]] = ContextVar("model_route", default=None)
+
+
+class ModelRouting:
+    def __init__(self, model: str = "", percent: float = 0.0):
+        self.model = model
+        self.percent = percent
+
+    def choose(self, header: Optional[str]) -> Optional[str]:
+        if header:
+            return None if header == PRIMARY else header
+        if self.model and self.percent > 0 and random.random() * 100 < self.percent:
+            return self.model
+        return None
+
+    def status(self) -> dict:
+        return {"model": self.model or None, "percent": self.percent}
+
+
+def requested_model() -> Optional[str]:
+    route = _route.get()
+    return route["requested"] if route else None
+
+
+def mark_served(version: str) -> None:
+    route = _route.get()
+    if route is not None:
+        route["served"] = version
+
+
+class ModelRoutingMiddleware:
+    """Pure ASGI: picks the model for the request and echoes the served version."""
+
+    def __init__(self, app, routing: ModelRouting):
+        self.app = app
+        self.routing = routing
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        header = next((v.decode("latin-1") for k, v in scope["headers"] if k == HEADER), None)
+        route = {"requested": self.routing.choose(header), "served": None}
+        token = _route.set(route)
+
+        async def send_with_version(message):
+            if message["type"] == "http.response.start" and route["served"]:
+                headers = list(message.get("headers", []))
+                headers.append((HEADER, route["served"].encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_version)
+        finally:
+            _route.reset(token)
+
+
+# ── Shadow evaluation ─────────────────────────────────────────────────────────
+class ShadowEvaluator:
+    """
+    Scores sampled primary predictions with a candidate on one daemon thread.
+    `submit` never blocks: when the queue is full the sample is counted as
+    dropped. Latency windows keep the last `window` samples.
+    """
+
+    def __init__(self, registry: ModelRegistry, model: str = "", sample_rate: float = 0.0,
+                 max_queue: int = 1000, window: int = 5000):
+        self.registry = registry
+        self.model = model
+        self.sample_rate = sample_rate
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._window = window
+        self._reset()
+        self._thread = threading.Thread(target=self._run, name="shadow-eval", daemon=True)
+        self._thread.start()
+
+    def _reset(self) -> None:
+        self.submitted = 0
+        self.dropped = 0
+        self.scored = 0
+        self.errors = 0
+        self.rows = 0
+        self.agreed = 0
+        self.disagreements: Counter = Counter()
+        self.primary_ms: deque = deque(maxlen=self._window)
+        self.candidate_ms: deque = deque(maxlen=self._window)
+
+    def configure(self, model: str, sample_rate: float) -> None:
+        with self._lock:
+            if model != self.model:
+                self._reset()
+            self.model = model
+            self.sample_rate = sample_rate
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.model) and self.sample_rate > 0
+
+    def should_sample(self) -> bool:
+        return self.enabled and random.random() < self.sample_rate
+
+    def submit(self, keys: list[str], categories: list[str], primary_ms: Optional[float]) -> None:
+        """
+        Called on the request path after should_sample() — never blocks.
+        `primary_ms` is the primary's predict time for the same keys, or None
+        when it isn't comparable (agreement is still counted).
+        """
+        try:
+            self._queue.put_nowait((self.model, keys, categories, primary_ms))
+            queued = True
+        except queue.Full:
+            queued = False
+        with self._lock:
+            if queued:
+                self.submitted += 1
+            else:
+                self.dropped += 1
+
+    def _run(self) -> None:
+        while True:
+            model_name, keys, categories, primary_ms = self._queue.get()
+            try:
+                model = self.registry.get(model_name)
+                if model is None:
+                    raise LookupError(f"unknown shadow model {model_name!r}")
+                t0 = time.perf_counter()
+                proba = model.pipeline.predict_proba(keys)
+                shadow_categories = np.asarray(model.pipeline.classes_)[np.argmax(proba, axis=1)].tolist()
+                ms = (time.perf_counter() - t0) * 1000
+            except Exception as exc:
+                log.warning(f"Shadow scoring failed: {exc}")
+                with self._lock:
+                    self.errors += 1
+                continue
+
+            with self._lock:
+                if model_name != self.model:      # reconfigured while queued
+                    continue
+                self.scored += 1
+                self.rows += len(keys)
+                for primary, shadow in zip(categories, shadow_categories):
+                    if primary == shadow:
+                        self.agreed += 1
+                    else:
+                        self.disagreements[(primary, shadow)] += 1
+                if primary_ms is not None:
+                    self.primary_ms.append(primary_ms)
+                    self.candidate_ms.append(ms)
+
+    @staticmethod
+    def _latency(samples: deque) -> Optional[dict]:
+        if not samples:
+            return None
+        arr = np.asarray(samples)
+        return {
+            "p50": round(float(np.percentile(arr, 50)), 3),
+            "p99": round(float(np.percentile(arr, 99)), 3),
+            "mean": round(float(arr.mean()), 3),
+        }
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "model": self.model or None,
+                "sample_rate": self.sample_rate,
+                "queued": self._queue.qsize(),
+                "submitted": self.submitted,
+                "dropped": self.dropped,
+                "scored": self.scored,
+                "errors": self.errors,
+                "rows_compared": self.rows,
+                "agreement": round(self.agreed / self.rows, 4) if self.rows else None,
+                "top_disagreements": [
+                    {"primary": p, "candidate": c, "count": n}
+                    for (p, c), n in self.disagreements.most_common(10)
+                ],
+                # both sides time predict_proba on the same cache-missed keys
+                "primary_latency_ms": self._latency(self.primary_ms),
+                "candidate_latency_ms": self._latency(self.candidate_ms),
+            }
@@ -0,0 +1,353 @@
+"""
+overrides.py — per-user merchant → category corrections, consulted before the model.
+
+When a user re-categorizes a merchant, the correction is stored here and every
+later prediction for that user and merchant returns it directly: one hash and
+one dict lookup, no cache or model call.
+
+Storage is one SQLite file in WAL mode shared by every worker on the host:
+
+  overrides   (user_id, merchant_hash, category_code)   WITHOUT ROWID
+  categories  (code, name)                              category names, once
+  changes     (seq, user_id)                            write log for other workers
+                                                        (NULL user: everyone, after a bulk import)
+
+Merchants are stored as a 64-bit hash of the normalized name and categories
+as small integer codes, so a row costs a few dozen bytes on disk whatever the
+merchant's length. A user's overrides are read into memory on their first
+request and kept in an LRU bounded by `memory_bytes`; users without any
+overrides share one empty entry, so the common case costs only the LRU slot.
+Every `sync_interval` seconds a worker reads the change log and drops the
+users another worker wrote to, so they are reloaded on their next request.
+
+Usage (bulk import of existing corrections):
+  python overrides.py corrections.csv [--db artifacts/overrides.sqlite]
+
+  The CSV needs user_id, merchant and category columns; merchants are
+  normalized the same way as at prediction time.
+
+Used by: main.py (/predict/*, /overrides)
+"""
+
+import csv
+import hashlib
+import logging
+import sqlite3
+import sys
+import threading
+import time
+from collections import Counter, OrderedDict
+from pathlib import Path
+from typing import Callable, Iterable, Optional
+
+log = logging.getLogger("ml_service")
+
+_EMPTY: dict[int, int] = {}     # shared by every loaded user without overrides
+# OrderedDict node + entry, and the per-user bookkeeping around the dict itself
+_SLOT_BYTES = 120
+
+
+def merchant_hash(key: str) -> int:
+    """Signed 64-bit hash of a normalized merchant (fits an SQLite INTEGER)."""
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "little", signed=True)
+
+
+def _user_bytes(user_id: str, entries: dict[int, int]) -> int:
+    if entries is _EMPTY:
+        return _SLOT_BYTES + sys.getsizeof(user_id)
+    # category codes are small ints, which CPython shares — only the keys count
+    return (_SLOT_BYTES + sys.getsizeof(user_id) + sys.getsizeof(entries)
+            + sum(sys.getsizeof(h) for h in entries))
+
+
+class OverrideIndex:
+    """
+    Any SQLite error on the read path is logged and treated as "no override"
+    — a broken file must never fail a prediction. Writes raise.
+    """
+
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS overrides (
+            user_id       TEXT    NOT NULL,
+            merchant_hash INTEGER NOT NULL,
+            category_code INTEGER NOT NULL,
+            PRIMARY KEY (user_id, merchant_hash)
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS categories (
+            code INTEGER PRIMARY KEY,
+            name TEXT    NOT NULL UNIQUE
+        );
+        CREATE TABLE IF NOT EXISTS changes (
+            seq     INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id TEXT
+        );
+    """
+    _CHUNK = 10_000             # rows per executemany during imports
+    _CHANGES_KEEP = 100_000     # change-log rows kept; a worker further behind reloads everyone
+    _WIDE_WRITE = 1_000         # users in one chunk above which every loaded user is dropped
+
+    def __init__(self, path: str, memory_bytes: int = 64 << 20, sync_interval: float = 1.0):
+        self.path = path
+        self.memory_budget = memory_bytes
+        self.sync_interval = sync_interval
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._users: OrderedDict[str, dict[int, int]] = OrderedDict()
+        self._sizes: dict[str, int] = {}
+        self.memory_bytes = 0
+        self._names: list[Optional[str]] = []   # code → category name
+        self._codes: dict[str, int] = {}
+        self._next_sync = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.outcomes: Counter = Counter()
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        conn = self._conn()
+        conn.executescript(self._SCHEMA)
+        self._last_seq = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM changes").fetchone()[0]
+        self._load_categories(conn)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=2.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _error(self, exc: Exception) -> None:
+        self.outcomes["errors"] += 1
+        log.warning(f"Override index error: {exc}")
+
+    def _load_categories(self, conn: sqlite3.Connection) -> None:
+        rows = conn.execute("SELECT code, name FROM categories").fetchall()
+        names: list[Optional[str]] = [None] * (max((c for c, _ in rows), default=-1) + 1)
+        for code, name in rows:
+            names[code] = name
+        self._names = names
+        self._codes = {name: code for code, name in rows}
+
+    # ── Reads ─────────────────────────────────────────────────────────────────
+    def _entries(self, user_id: str) -> dict[int, int]:
+        now = time.monotonic()
+        if now >= self._next_sync:
+            self._sync(now)
+        entries = self._users.get(user_id)
+        if entries is not None:
+            try:
+                self._users.move_to_end(user_id)
+            except KeyError:            # evicted by another thread just now
+                pass
+            return entries
+
+        self.outcomes["loads"] += 1
+        seq = self._last_seq
+        try:
+            rows = self._conn().execute(
+                "SELECT merchant_hash, category_code FROM overrides WHERE user_id = ?", (user_id,)
+            ).fetchall()
+        except sqlite3.Error as exc:
+            self._error(exc)
+            return _EMPTY
+        entries = dict(rows) if rows else _EMPTY
+        size = _user_bytes(user_id, entries)
+        with self._lock:
+            if self._last_seq != seq:   # a sync ran meanwhile; the rows may predate it
+                return entries
+            old = self._sizes.pop(user_id, None)
+            if old is not None:
+                self.memory_bytes -= old
+            self._users[user_id] = entries
+            self._sizes[user_id] = size
+            self.memory_bytes += size
+            while self.memory_bytes > self.memory_budget and len(self._users) > 1:
+                evicted, _ = self._users.popitem(last=False)
+                self.memory_bytes -= self._sizes.pop(evicted)
+                self.outcomes["evictions"] += 1
+        return entries
+
+    def _name(self, code: int) -> Optional[str]:
+        if code >= len(self._names) or self._names[code] is None:
+            try:
+                self._load_categories(self._conn())     # added by another worker
+            except sqlite3.Error as exc:
+                self._error(exc)
+                return None
+        return self._names[code] if code < len(self._names) else None
+
+    def get(self, user_id: str, key: str) -> Optional[str]:
+        """Category this user chose for the normalized merchant `key`, if any."""
+        entries = self._entries(user_id)
+        code = entries.get(merchant_hash(key)) if entries else None
+        if code is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return self._name(code)
+
+    def get_many(self, user_id: str, keys: list[str]) -> dict[str, str]:
+        entries = self._entries(user_id)
+        if not entries:
+            self.misses += len(keys)
+            return {}
+        found = {}
+        for key in keys:
+            code = entries.get(merchant_hash(key))
+            if code is not None:
+                name = self._name(code)
+                if name is not None:
+                    found[key] = name
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return found
+
+    def _sync(self, now: float) -> None:
+        """Drop local copies of users that any worker has written to since the last sync."""
+        with self._lock:
+            if now < self._next_sync:
+                return
+            self._next_sync = now + self.sync_interval
+            try:
+                rows = self._conn().execute(
+                    "SELECT seq, user_id FROM changes WHERE seq > ? ORDER BY seq", (self._last_seq,)
+                ).fetchall()
+            except sqlite3.Error as exc:
+                self._error(exc)
+                return
+            if not rows:
+                return
+            if rows[0][0] > self._last_seq + 1 or any(user_id is None for _, user_id in rows):
+                # the log was pruned past our position, or a bulk import: reload everyone
+                self.outcomes["invalidations"] += len(self._users)
+                self._users.clear()
+                self._sizes.clear()
+                self.memory_bytes = 0
+            else:
+                for _, user_id in rows:
+                    if self._users.pop(user_id, None) is not None:
+                        self.memory_bytes -= self._sizes.pop(user_id)
+                        self.outcomes["invalidations"] += 1
+            self._last_seq = rows[-1][0]
+
+    # ── Writes ────────────────────────────────────────────────────────────────
+    def _code(self, conn: sqlite3.Connection, name: str) -> int:
+        code = self._codes.get(name)
+        if code is None:
+            conn.execute("INSERT OR IGNORE INTO categories (name) VALUES (?)", (name,))
+            self._load_categories(conn)
+            code = self._codes[name]
+        return code
+
+    def set_many(self, rows: Iterable[tuple[str, str, Optional[str]]]) -> int:
+        """
+        Upsert (user_id, normalized merchant, category) rows; a None category
+        removes the override. Returns the number of rows written.
+        """
+        conn = self._conn()
+        written = 0
+        chunk: list[tuple[str, str, Optional[str]]] = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) >= self._CHUNK:
+                written += self._write(conn, chunk)
+                chunk = []
+        if chunk:
+            written += self._write(conn, chunk)
+        # Apply our own writes here at once rather than on the next sync
+        self._next_sync = 0.0
+        return written
+
+    def _write(self, conn: sqlite3.Connection, chunk: list[tuple[str, str, Optional[str]]]) -> int:
+        upserts, deletes = [], []
+        for user_id, key, category in chunk:
+            if category is None:
+                deletes.append((user_id, merchant_hash(key)))
+            else:
+                upserts.append((user_id, merchant_hash(key), self._code(conn, category)))
+        users = sorted({row[0] for row in chunk})
+        if len(users) > self._WIDE_WRITE:
+            users = [None]
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "INSERT INTO overrides (user_id, merchant_hash, category_code) VALUES (?, ?, ?) "
+                "ON CONFLICT (user_id, merchant_hash) DO UPDATE SET category_code = excluded.category_code",
+                upserts,
+            )
+            conn.executemany("DELETE FROM overrides WHERE user_id = ? AND merchant_hash = ?", deletes)
+            seq = 0
+            for user_id in users:
+                seq = conn.execute("INSERT INTO changes (user_id) VALUES (?)", (user_id,)).lastrowid
+            conn.execute("DELETE FROM changes WHERE seq <= ?", (seq - self._CHANGES_KEEP,))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        self.outcomes["written"] += len(chunk)
+        return len(chunk)
+
+    def set(self, user_id: str, key: str, category: Optional[str]) -> None:
+        self.set_many([(user_id, key, category)])
+
+    def import_csv(self, path: str, normalize: Callable[[str], str]) -> int:
+        """Bulk-load user_id,merchant,category rows (later rows win)."""
+        with open(path, newline="", encoding="utf-8") as f:
+            rows = ((r["user_id"], normalize(r["merchant"]), r["category"].strip() or None)
+                    for r in csv.DictReader(f))
+            return self.set_many(row for row in rows if row[0] and row[1])
+
+    # ── Stats ─────────────────────────────────────────────────────────────────
+    def stats(self) -> dict:
+        with self._lock:
+            loaded = len(self._users)
+            with_overrides = [u for u, e in self._users.items() if e is not _EMPTY]
+            entries = sum(len(self._users[u]) for u in with_overrides)
+            override_bytes = sum(self._sizes[u] for u in with_overrides)
+            memory = self.memory_bytes
+        try:
+            conn = self._conn()
+            stored = conn.execute("SELECT COUNT(*) FROM overrides").fetchone()[0]
+            file_bytes = sum(p.stat().st_size for p in Path(self.path).parent.glob(Path(self.path).name + "*"))
+        except (sqlite3.Error, OSError) as exc:
+            self._error(exc)
+            stored, file_bytes = None, None
+        lookups = self.hits + self.misses
+        per_user = memory / loaded if loaded else None
+        return {
+            "stored_overrides": stored,
+            "file_bytes": file_bytes,
+            "loaded_users": loaded,
+            "loaded_users_with_overrides": len(with_overrides),
+            "loaded_overrides": entries,
+            "memory_bytes": memory,
+            "memory_budget": self.memory_budget,
+            # at the current mix of users with / without overrides
+            "bytes_per_user": round(per_user, 1) if per_user else None,
+            "users_in_budget": int(self.memory_budget / per_user) if per_user else None,
+            "bytes_per_override": round(override_bytes / entries, 1) if entries else None,
+            "lookups": lookups,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "outcomes": dict(self.outcomes),
+        }
+
+
+def main():
+    import argparse
+
+    from main import _normalize
+
+    parser = argparse.ArgumentParser(description="Bulk-import merchant category corrections")
+    parser.add_argument("csv", help="CSV with user_id, merchant, category columns")
+    parser.add_argument("--db", default=str(Path(__file__).parent / "artifacts" / "overrides.sqlite"))
+    args = parser.parse_args()
+
+    index = OverrideIndex(args.db)
+    t0 = time.perf_counter()
+    n = index.import_csv(args.csv, _normalize)
+    print(f"imported {n:,} corrections in {time.perf_counter() - t0:.1f}s → {args.db}")
+    print(index.stats())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+"""
+prediction_cache.py — caches of (category, confidence) per normalized merchant.
+
+  LRUCache     — per-process, in memory, lost on restart
+  SqliteCache  — on-disk SQLite in WAL mode, shared by every worker on the
+                 host and still warm after a deploy or restart
+
+Keys always include the model version (a hash of the model file), so a reload
+can never serve a prediction made by a different model, and entries written
+by older versions are simply never read again until they are purged (once
+idle for a grace period) or evicted by the size cap.
+
+Used by: main.py
+"""
+
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+
+log = logging.getLogger("ml_service")
+
+
+class LRUCache:
+    """Thread-safe in-process LRU keyed by (model_version, normalized merchant)."""
+
+    def __init__(self, max_entries: int = 50_000):
+        self.max_entries = max_entries
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, version: str, key: str) -> Optional[tuple[str, float]]:
+        with self._lock:
+            value = self._data.get((version, key))
+            if value is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end((version, key))
+            self.hits += 1
+            return value
+
+    def put(self, version: str, key: str, value: tuple[str, float]) -> None:
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._data[(version, key)] = value
+            self._data.move_to_end((version, key))
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._data),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+class SqliteCache:
+    """
+    Persistent cache shared across worker processes.
+
+    Eviction is approximate LRU: `last_used` is refreshed on a hit only when it
+    is older than `touch_interval`, so hot reads don't turn into writes, and
+    every `evict_every` inserts the oldest rows above `max_entries` are
+    deleted. Any SQLite error is logged and treated as a miss — the cache must
+    never fail a prediction.
+    """
+
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS predictions (
+            version    TEXT    NOT NULL,
+            merchant   TEXT    NOT NULL,
+            category   TEXT    NOT NULL,
+            confidence REAL    NOT NULL,
+            last_used  INTEGER NOT NULL,
+            PRIMARY KEY (version, merchant)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS idx_predictions_last_used ON predictions (last_used);
+    """
+    _MAX_VARS = 500   # stay well below SQLite's bound-parameter limit
+
+    def __init__(self, path: str, max_entries: int = 1_000_000,
+                 touch_interval: int = 3600, evict_every: int = 1000):
+        self.path = path
+        self.max_entries = max_entries
+        self.touch_interval = touch_interval
+        self.evict_every = evict_every
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._puts = 0
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn().executescript(self._SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=2.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _error(self, exc: Exception) -> None:
+        self.errors += 1
+        log.warning(f"Prediction cache error: {exc}")
+
+    def get_many(self, version: str, keys: list[str]) -> dict[str, tuple[str, float]]:
+        found: dict[str, tuple[str, float]] = {}
+        stale: list[str] = []
+        cutoff = int(time.time()) - self.touch_interval
+        try:
+            conn = self._conn()
+            for i in range(0, len(keys), self._MAX_VARS):
+                chunk = keys[i:i + self._MAX_VARS]
+                rows = conn.execute(
+                    "SELECT merchant, category, confidence, last_used FROM predictions "
+                    f"WHERE version = ? AND merchant IN ({','.join('?' * len(chunk))})",
+                    (version, *chunk),
+                ).fetchall()
+                for merchant, category, confidence, last_used in rows:
+                    found[merchant] = (category, confidence)
+                    if last_used < cutoff:
+                        stale.append(merchant)
+            if stale:
+                now = int(time.time())
+                conn.executemany(
+                    "UPDATE predictions SET last_used = ? WHERE version = ? AND merchant = ?",
+                    [(now, version, m) for m in stale],
+                )
+        except sqlite3.Error as exc:
+            self._error(exc)
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return found
+
+    def get(self, version: str, key: str) -> Optional[tuple[str, float]]:
+        return self.get_many(version, [key]).get(key)
+
+    def put_many(self, version: str, items: list[tuple[str, str, float]]) -> None:
+        """items: (merchant, category, confidence)"""
+        if not items:
+            return
+        now = int(time.time())
+        try:
+            conn = self._conn()
+            with conn:
+                conn.execute("BEGIN")
+                conn.executemany(
+                    "INSERT OR REPLACE INTO predictions VALUES (?, ?, ?, ?, ?)",
+                    [(version, m, c, float(conf), now) for m, c, conf in items],
+                )
+        except sqlite3.Error as exc:
+            self._error(exc)
+            return
+
+        with self._lock:
+            self._puts += len(items)
+            due = self._puts >= self.evict_every
+            if due:
+                self._puts = 0
+        if due:
+            self.evict()
+
+    def put(self, version: str, key: str, value: tuple[str, float]) -> None:
+        self.put_many(version, [(key, value[0], value[1])])
+
+    def evict(self) -> int:
+        try:
+            conn = self._conn()
+            excess = conn.execute("SELECT COUNT(*) FROM predictions").fetchone()[0] - self.max_entries
+            if excess <= 0:
+                return 0
+            conn.execute(
+                "DELETE FROM predictions WHERE (version, merchant) IN ("
+                "SELECT version, merchant FROM predictions ORDER BY last_used LIMIT ?)",
+                (excess,),
+            )
+            return excess
+        except sqlite3.Error as exc:
+            self._error(exc)
+            return 0
+
+    def purge_idle_versions(self, current: str, idle_s: float) -> int:
+        """
+        Drop the rows of model versions other than `current` that no worker has
+        read or written for `idle_s` seconds. Versions still served by another
+        worker mid-rollout, a routed registry model or the shadow keep their
+        rows; `idle_s` should exceed `touch_interval`, the granularity of
+        last_used.
+        """
+        try:
+            return self._conn().execute(
+                "DELETE FROM predictions WHERE version IN ("
+                "SELECT version FROM predictions WHERE version != ? "
+                "GROUP BY version HAVING MAX(last_used) < ?)",
+                (current, int(time.time() - idle_s)),
+            ).rowcount
+        except sqlite3.Error as exc:
+            self._error(exc)
+            return 0
+
+    def stats(self) -> dict:
+        try:
+            entries = self._conn().execute("SELECT COUNT(*) FROM predictions").fetchone()[0]
+        except sqlite3.Error:
+            entries = None
+        total = self.hits + self.misses
+        return {
+            "path": self.path,
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "errors": self.errors,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
@@ -0,0 +1,65 @@
+"""
+prefilter.py — cheap "is this SMS a debit?" check that runs before parsing.
+
+Most of an inbox is OTPs, promotions and credit alerts. One compiled
+alternation is scanned over the lowercased text in a single pass; every hit
+says which kind of keyword it was (debit verb, credit word, OTP, promo or a
+currency amount), and the verdict is made from those flags alone — no
+amount/date/merchant extraction happens for rejected messages.
+
+Mirrors hasClearDebitPattern in the backend's sms.auto.controller.ts, plus
+OTP and promotion rejection.
+
+Used by: inbox_import.py
+"""
+
+import re
+from typing import NamedTuple, Optional
+
+_SCAN_RE = re.compile(
+    r"(?P<otp>\b(?:otp|one[\s-]?time[\s-]?password|verification code)\b)"
+    r"|(?P<debit>\b(?:debited|debit|spent|paid|purchase|txn|transaction|withdrawn|charged|sent|dr\.?)(?!\w))"
+    r"|(?P<credit>\b(?:credited|salary|refund|refunded|cashback|interest|received)\b)"
+    r"|(?P<promo>\b(?:offer|offers|discount|coupon|voucher|win|won|congratulations|"
+    r"pre-?approved|apply now|click|hurry|sale)\b)"
+    # \b only before the words: "hours 500" / "offers 20" are not amounts, "₹500" has no boundary
+    r"|(?P<amount>(?:₹|\b(?:rs\.?|inr))\s*[\d,]+(?:\.\d{1,2})?)"
+)
+
+# Verbs that only appear when money actually left the account
+_STRONG_DEBIT = frozenset({"debited", "spent", "paid", "withdrawn", "charged"})
+
+
+class Verdict(NamedTuple):
+    keep: bool
+    reason: Optional[str]    # why it was rejected, None when kept
+
+
+def classify_sms(text: str) -> Verdict:
+    if not text:
+        return Verdict(False, "empty")
+
+    kinds = set()
+    strong_debit = False
+    for m in _SCAN_RE.finditer(text.lower()):
+        kind = m.lastgroup
+        kinds.add(kind)
+        if kind == "debit" and m.group(kind) in _STRONG_DEBIT:
+            strong_debit = True
+
+    if "otp" in kinds:
+        return Verdict(False, "otp")
+    if "amount" not in kinds:
+        return Verdict(False, "no_amount")
+    if "debit" not in kinds:
+        return Verdict(False, "credit_only" if "credit" in kinds else "no_debit_keyword")
+    # "INR 500 credited ... Txn ID 42": a weak debit word next to a credit word
+    if "credit" in kinds and not strong_debit:
+        return Verdict(False, "credit_only")
+    if "promo" in kinds and not strong_debit:
+        return Verdict(False, "promotion")
+    return Verdict(True, None)
+
+
+def is_candidate_debit(text: str) -> bool:
+    return classify_sms(text).keep
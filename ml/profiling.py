@@ -0,0 +1,160 @@
+"""
+profiling.py — per-request stage timings and sampled profiling for main.py.
+
+Every request gets a timings dict (held in a ContextVar, so it follows the
+request into the threadpool) that code fills with `with stage("parse"):`
+blocks. ServerTimingMiddleware turns it into a `Server-Timing` header.
+
+Profiling is opt-in: a configurable fraction of requests is run under cProfile
+and the stats are dumped to artifacts/profiles/ for `python -m pstats` or
+snakeviz. Unsampled requests only pay for one random() call.
+
+Used by: main.py
+"""
+
+import cProfile
+import functools
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+log = logging.getLogger("ml_service")
+
+_timings: ContextVar[Optional[dict]] = ContextVar("stage_timings", default=None)
+_sampled: ContextVar[bool] = ContextVar("profile_sampled", default=False)
+
+
+@contextmanager
+def stage(name: str):
+    """Accumulate the duration of the block into the current request's timings."""
+    timings = _timings.get()
+    if timings is None:
+        yield
+        return
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = timings.get(name, 0.0) + (time.perf_counter() - t0) * 1000
+
+
+def current_timings() -> dict:
+    timings = _timings.get()
+    return timings if timings is not None else {}
+
+
+def format_server_timing(timings: dict) -> str:
+    return ", ".join(f"{name};dur={ms:.3f}" for name, ms in timings.items())
+
+
+class Profiler:
+    """Decides which requests to profile and where their stats go."""
+
+    def __init__(self, sample_rate: float = 0.0, out_dir: str = "artifacts/profiles",
+                 max_files: int = 1000):
+        self.sample_rate = sample_rate
+        self.out_dir = Path(out_dir)
+        self.max_files = max_files
+        self.written = 0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.sample_rate > 0 and self.written < self.max_files
+
+    def should_sample(self) -> bool:
+        return self.enabled and random.random() < self.sample_rate
+
+    def dump(self, prof: cProfile.Profile, label: str) -> None:
+        with self._lock:
+            if self.written >= self.max_files:
+                return
+            self.written += 1
+            seq = self.written
+        stamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
+        try:
+            self.out_dir.mkdir(parents=True, exist_ok=True)
+            prof.dump_stats(self.out_dir / f"{stamp}_{os.getpid()}_{seq:05d}_{label}.prof")
+        except OSError as exc:
+            # runs in the handler's finally: a profile must never fail the request
+            with self._lock:
+                if self.sample_rate > 0:
+                    log.warning(f"Cannot write profiles to {self.out_dir} ({exc}); sampling turned off")
+                self.sample_rate = 0.0
+                self.written -= 1
+
+    def status(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "sample_rate": self.sample_rate,
+            "out_dir": str(self.out_dir),
+            "profiles_written": self.written,
+            "max_files": self.max_files,
+        }
+
+
+profiler = Profiler(
+    sample_rate=float(os.getenv("ML_PROFILE_SAMPLE_RATE", "0")),
+    out_dir=os.getenv("ML_PROFILE_DIR", str(Path(__file__).parent / "artifacts" / "profiles")),
+    max_files=int(os.getenv("ML_PROFILE_MAX_FILES", "1000")),
+)
+
+
+def profiled(label: str):
+    """
+    Run a sync endpoint under cProfile when the middleware sampled its request.
+    cProfile is per-thread, so this has to wrap the handler where it executes
+    (the threadpool), not the async middleware.
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _sampled.get():
+                return fn(*args, **kwargs)
+            prof = cProfile.Profile()
+            prof.enable()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                prof.disable()
+                profiler.dump(prof, label)
+        return wrapper
+    return decorator
+
+
+class ServerTimingMiddleware:
+    """Pure ASGI middleware: opens the timings dict and adds Server-Timing."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings: dict = {}
+        timings_token = _timings.set(timings)
+        sampled_token = _sampled.set(profiler.should_sample())
+        t0 = time.perf_counter()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                timings["total"] = (time.perf_counter() - t0) * 1000
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", format_server_timing(timings).encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _timings.reset(timings_token)
+            _sampled.reset(sampled_token)
@@ -0,0 +1,213 @@
+"""
+promotion.py — serving-cost gate between training and the served model.
+
+A freshly trained model only replaces latest_model.pkl / expense_model.pkl
+when it is cheap enough to serve. The candidate and the currently promoted
+model (the incumbent) are benchmarked the same way, on the same rows:
+
+  p50 / p99 ms    one predict_proba call per merchant, as /predict/merchant does
+  rows per s      predict_proba over `batch_rows` merchants, as /predict/batch does
+  load ms         unpickling, as the service's startup / reload does
+  memory bytes    heap retained by the loaded model: the larger of what
+                  tracemalloc sees and the pickle size (tree ensembles keep
+                  their nodes in C buffers that tracemalloc does not count)
+
+plus test accuracy. The candidate is promoted only if it stays inside the
+absolute `budgets` and does not regress against the incumbent by more than
+`max_slowdown` (latency, load time, memory, inverse throughput) or
+`max_accuracy_drop`. A regression smaller than `min_regression` is treated
+as noise, so two fast models are not told apart by jitter. The decision, with
+every number and each failed check, goes into the metrics JSON under
+"promotion".
+
+Budgets come from config.json → promotion (defaults below).
+
+Usage (check a model file without training):
+  python promotion.py artifacts/models/expense_model_<ts>.pkl
+
+Used by: train_model.py (save_artifacts)
+"""
+
+import pickle
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+from sklearn.metrics import accuracy_score
+
+DEFAULT_PROMOTION = {
+    "latency_samples": 500,
+    "batch_rows": 5000,
+    "budgets": {
+        "p99_ms": 10.0,
+        "min_batch_rows_per_s": 10000,
+        "load_ms": 1000.0,
+        "memory_bytes": 256 * 1024 * 1024,
+    },
+    # candidate / incumbent ratios allowed; timings on a shared host are noisy
+    "max_slowdown": 1.5,
+    # ...and only once the absolute difference is at least this large
+    "min_regression": {
+        "p99_ms": 0.5,
+        "load_ms": 5.0,
+        "memory_bytes": 1024 * 1024,
+        "batch_rows_per_s": 20000,
+    },
+    "max_accuracy_drop": 0.01,
+}
+
+
+def _latency_ms(model, texts: list[str]) -> tuple[float, float]:
+    for text in texts[:20]:             # warm-up: first calls pay for lazy setup
+        model.predict_proba([text])
+    timings = []
+    for text in texts:
+        t0 = time.perf_counter()
+        model.predict_proba([text])
+        timings.append((time.perf_counter() - t0) * 1000)
+    return float(np.percentile(timings, 50)), float(np.percentile(timings, 99))
+
+
+def _rows_per_s(model, texts: list[str], repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        model.predict_proba(texts)
+        best = min(best, time.perf_counter() - t0)
+    return len(texts) / best
+
+
+def _load(blob: bytes, repeat: int = 3) -> tuple[float, int]:
+    """Best unpickle time, and heap the loaded model keeps."""
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        pickle.loads(blob)
+        best = min(best, time.perf_counter() - t0)
+    tracemalloc.start()
+    model = pickle.loads(blob)
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del model
+    return best * 1000, retained
+
+
+def benchmark(model, X_test, y_test, samples: int = 500, batch_rows: int = 5000) -> dict:
+    """Serving cost and test accuracy of one model."""
+    texts = [str(t) for t in X_test]
+    batch = (texts * (batch_rows // max(len(texts), 1) + 1))[:batch_rows]
+    blob = pickle.dumps(model)
+    p50, p99 = _latency_ms(model, texts[:samples])
+    load_ms, memory = _load(blob)
+    return {
+        "test_accuracy": float(accuracy_score(y_test, model.predict(texts))),
+        "p50_ms": round(p50, 4),
+        "p99_ms": round(p99, 4),
+        "batch_rows_per_s": round(_rows_per_s(model, batch), 1),
+        "load_ms": round(load_ms, 2),
+        "memory_bytes": max(memory, len(blob)),
+        "traced_bytes": memory,
+        "pickle_bytes": len(blob),
+    }
+
+
+def load_incumbent(paths: list[Path]):
+    """The currently promoted model, or (None, None) if there is none yet."""
+    for path in paths:
+        if path.exists():
+            try:
+                with open(path, "rb") as f:
+                    return pickle.load(f), str(path)
+            except Exception as exc:
+                print(f"Incumbent {path} could not be loaded ({exc}); ignoring it")
+    return None, None
+
+
+def _check(failures: list[str], ok: bool, message: str) -> None:
+    if not ok:
+        failures.append(message)
+
+
+def evaluate(candidate, incumbent, X_test, y_test, settings: Optional[dict] = None,
+             incumbent_path: Optional[str] = None) -> dict:
+    """Benchmark both models and decide; returns the record for the metrics JSON."""
+    settings = {**DEFAULT_PROMOTION, **(settings or {})}
+    budgets = {**DEFAULT_PROMOTION["budgets"], **settings.get("budgets", {})}
+    slowdown = settings["max_slowdown"]
+    floors = {**DEFAULT_PROMOTION["min_regression"], **settings.get("min_regression", {})}
+    samples, batch_rows = settings["latency_samples"], settings["batch_rows"]
+
+    cand = benchmark(candidate, X_test, y_test, samples, batch_rows)
+    inc = None
+    if incumbent is not None:
+        try:
+            inc = benchmark(incumbent, X_test, y_test, samples, batch_rows)
+        except Exception as exc:        # e.g. trained on a label set it cannot score
+            print(f"Incumbent benchmark failed ({exc}); judging on budgets only")
+
+    failures: list[str] = []
+    _check(failures, cand["p99_ms"] <= budgets["p99_ms"],
+           f"p99 {cand['p99_ms']:.3f}ms over budget {budgets['p99_ms']}ms")
+    _check(failures, cand["batch_rows_per_s"] >= budgets["min_batch_rows_per_s"],
+           f"batch {cand['batch_rows_per_s']:.0f} rows/s under budget {budgets['min_batch_rows_per_s']}")
+    _check(failures, cand["load_ms"] <= budgets["load_ms"],
+           f"load {cand['load_ms']:.1f}ms over budget {budgets['load_ms']}ms")
+    _check(failures, cand["memory_bytes"] <= budgets["memory_bytes"],
+           f"memory {cand['memory_bytes']} bytes over budget {budgets['memory_bytes']}")
+    if inc is not None:
+        for key, label in (("p99_ms", "p99"), ("load_ms", "load"), ("memory_bytes", "memory")):
+            _check(failures, cand[key] <= inc[key] * slowdown or cand[key] - inc[key] < floors[key],
+                   f"{label} {cand[key]} vs the incumbent's {inc[key]} (max {slowdown}x)")
+        _check(failures, cand["batch_rows_per_s"] * slowdown >= inc["batch_rows_per_s"]
+               or inc["batch_rows_per_s"] - cand["batch_rows_per_s"] < floors["batch_rows_per_s"],
+               f"batch throughput {cand['batch_rows_per_s'] / inc['batch_rows_per_s']:.2f}x "
+               f"the incumbent's (min {1 / slowdown:.2f}x)")
+        drop = inc["test_accuracy"] - cand["test_accuracy"]
+        _check(failures, drop <= settings["max_accuracy_drop"],
+               f"test accuracy {drop:.4f} below the incumbent's (max drop {settings['max_accuracy_drop']})")
+
+    return {
+        "promoted": not failures,
+        "failed_checks": failures,
+        "candidate": cand,
+        "incumbent": inc,
+        "incumbent_path": incumbent_path,
+        "budgets": budgets,
+        "max_slowdown": slowdown,
+        "min_regression": floors,
+        "max_accuracy_drop": settings["max_accuracy_drop"],
+    }
+
+
+def main():
+    import argparse
+
+    from train_model import load_splits
+    from utils import load_config
+
+    parser = argparse.ArgumentParser(description="Run the promotion gate on a saved model")
+    parser.add_argument("candidate", help="pickled candidate model")
+    parser.add_argument("--incumbent", help="defaults to <model_dir>/latest_model.pkl")
+    args = parser.parse_args()
+
+    config = load_config()
+    splits = load_splits(config)
+    with open(args.candidate, "rb") as f:
+        candidate = pickle.load(f)
+    paths = [Path(args.incumbent)] if args.incumbent else [Path(config["model_dir"]) / "latest_model.pkl"]
+    incumbent, incumbent_path = load_incumbent(paths)
+    decision = evaluate(candidate, incumbent, splits["X_test"], splits["y_test"],
+                        config.get("promotion"), incumbent_path)
+
+    for name in ("candidate", "incumbent"):
+        if decision[name] is not None:
+            print(f"{name:10s} {decision[name]}")
+    print("PROMOTE" if decision["promoted"] else "REJECT")
+    for failure in decision["failed_checks"]:
+        print(f"  - {failure}")
+
+
+if __name__ == "__main__":
+    main()
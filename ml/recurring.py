@@ -0,0 +1,297 @@
+"""
+recurring.py — incremental recurring-payment / subscription detector.
+
+Each user has a small table of series keyed by (normalized merchant, amount
+bucket). A series holds a handful of running numbers (last date, occurrence
+count, EWMA of the interval and of its deviation, EWMA amount), so observing
+one more debit is a dict lookup and a few multiplications — history is never
+rescanned. A series is flagged recurring once it has MIN_OCCURRENCES distinct
+days with a steady interval; its next due date is last date + interval.
+
+Amounts are bucketed on a log scale (~10% wide) and the neighbouring buckets
+are checked too, so ₹199 → ₹209 stays one series while ₹199 and ₹649 at the
+same merchant do not.
+
+bootstrap() seeds the state from a historical CSV (parsed_transactions.csv
+shape plus an optional user_id) with grouped, vectorized interval analysis;
+for series whose amounts stay in one bucket it yields the same state as
+replaying the rows through observe() one by one.
+
+Usage:
+  python recurring.py history.csv --user default
+
+Used by: main.py (/predict/sms with user_id, /recurring/{user_id})
+"""
+
+import argparse
+import json
+import math
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta, timezone
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from analytics import _parse_dates
+from utils import normalize_text
+
+ALPHA = 0.5                 # EWMA weight of the newest interval / amount
+BUCKET_RATIO = 1.10         # amount bucket width
+MIN_OCCURRENCES = 3
+MIN_PERIOD_DAYS = 6
+MAX_PERIOD_DAYS = 400
+MAX_JITTER = 0.25           # allowed interval deviation, as a fraction of the interval
+MAX_SERIES_PER_USER = 256
+DATE_FORMAT = "%d-%m-%Y"
+
+_EPOCH = date(1970, 1, 1)
+_LOG_BUCKET = math.log(BUCKET_RATIO)
+
+
+def parse_date(text: str) -> Optional[date]:
+    """DD-MM-YYYY (sms_parser.py) or ISO, a zoned ISO time taken in UTC as analytics does; None if neither."""
+    try:
+        return datetime.strptime(text, DATE_FORMAT).date()
+    except ValueError:
+        pass
+    try:
+        parsed = datetime.fromisoformat(text)
+    except ValueError:
+        return None
+    return parsed.astimezone(timezone.utc).date() if parsed.tzinfo else parsed.date()
+
+
+def amount_bucket(amount: float) -> int:
+    return int(round(math.log(max(amount, 1.0)) / _LOG_BUCKET))
+
+
+def _day(d: date) -> int:
+    return (d - _EPOCH).days
+
+
+def _period_label(days: float) -> str:
+    for label, centre in (("weekly", 7), ("monthly", 30.4), ("quarterly", 91.3), ("yearly", 365.25)):
+        if abs(days - centre) <= centre * 0.15:
+            return label
+    return f"every {round(days)} days"
+
+
+def _ewm_path(values: np.ndarray, occurrence: np.ndarray) -> np.ndarray:
+    """
+    observe()'s EWMA along every series at once: seeded by the first non-NaN
+    value, NaNs carry the previous value. Rows of a series are contiguous, so
+    step k updates all k-th rows from the rows just before them — one numpy
+    operation per position, not per series.
+    """
+    out = np.full(len(values), np.nan)
+    by_position = np.argsort(occurrence, kind="stable")
+    bounds = np.searchsorted(occurrence[by_position], np.arange(occurrence.max() + 2))
+    out[by_position[:bounds[1]]] = values[by_position[:bounds[1]]]
+    for k in range(1, len(bounds) - 1):
+        rows = by_position[bounds[k]:bounds[k + 1]]
+        cur, prev = values[rows], out[rows - 1]
+        out[rows] = np.where(np.isnan(prev), cur,
+                             np.where(np.isnan(cur), prev, ALPHA * cur + (1 - ALPHA) * prev))
+    return out
+
+
+@dataclass(slots=True)
+class Series:
+    merchant: str               # display name (latest raw spelling)
+    category: str
+    last_day: int
+    count: int = 1              # distinct days seen
+    interval: float = 0.0       # EWMA interval in days (0 until the 2nd occurrence)
+    jitter: float = 0.0         # EWMA |interval - expected|
+    amount: float = 0.0         # EWMA amount
+
+    def observe(self, day: int, amount: float, merchant: str, category: str) -> None:
+        gap = day - self.last_day
+        if gap <= 0:                        # same day or out of order
+            return
+        if self.count == 1:
+            self.interval = float(gap)
+        else:
+            self.jitter = ALPHA * abs(gap - self.interval) + (1 - ALPHA) * self.jitter
+            self.interval = ALPHA * gap + (1 - ALPHA) * self.interval
+        self.amount = ALPHA * amount + (1 - ALPHA) * self.amount
+        self.count += 1
+        self.last_day = day
+        self.merchant = merchant
+        self.category = category
+
+    @property
+    def is_recurring(self) -> bool:
+        return (
+            self.count >= MIN_OCCURRENCES
+            and MIN_PERIOD_DAYS <= self.interval <= MAX_PERIOD_DAYS
+            and self.jitter <= MAX_JITTER * self.interval
+        )
+
+    def to_dict(self) -> dict:
+        last = _EPOCH + timedelta(days=self.last_day)
+        return {
+            "merchant": self.merchant,
+            "category": self.category,
+            "recurring": self.is_recurring,
+            "occurrences": self.count,
+            "period": _period_label(self.interval) if self.count > 1 else None,
+            "interval_days": round(self.interval, 1),
+            "last_date": last.isoformat(),
+            "next_due": (last + timedelta(days=round(self.interval))).isoformat() if self.count > 1 else None,
+            "expected_amount": round(self.amount, 2),
+        }
+
+
+class RecurringDetector:
+    def __init__(self, max_series_per_user: int = MAX_SERIES_PER_USER):
+        self.max_series_per_user = max_series_per_user
+        # user → (merchant key, bucket) → Series, least recently seen first
+        self._users: dict[str, OrderedDict[tuple[str, int], Series]] = {}
+        self._lock = threading.Lock()
+        self.observed = 0
+
+    def _find(self, series: OrderedDict, key: str, bucket: int, amount: float) -> Optional[tuple]:
+        for b in (bucket, bucket - 1, bucket + 1):
+            s = series.get((key, b))
+            if s is not None and abs(s.amount - amount) <= s.amount * (BUCKET_RATIO - 1):
+                return key, b
+        return None
+
+    def observe(self, user_id: str, merchant: str, amount: float, category: str,
+                on: Optional[date] = None) -> Optional[Series]:
+        """Fold one debit into the user's state; returns its series."""
+        key = normalize_text(merchant)
+        if not key or amount <= 0:
+            return None
+        day = _day(on or date.today())
+        bucket = amount_bucket(amount)
+
+        with self._lock:
+            self.observed += 1
+            series = self._users.setdefault(user_id, OrderedDict())
+            found = self._find(series, key, bucket, amount)
+            if found is None:
+                s = series[(key, bucket)] = Series(merchant, category, day, amount=amount)
+                if len(series) > self.max_series_per_user:
+                    series.popitem(last=False)
+                return s
+            s = series[found]
+            s.observe(day, amount, merchant, category)
+            series.move_to_end(found)
+            return s
+
+    def series(self, user_id: str, only_recurring: bool = True) -> list[dict]:
+        with self._lock:
+            rows = [s.to_dict() for s in self._users.get(user_id, {}).values()
+                    if s.is_recurring or not only_recurring]
+        return sorted(rows, key=lambda r: r["next_due"] or "")
+
+    def stats(self) -> dict:
+        with self._lock:
+            n_series = sum(len(s) for s in self._users.values())
+            n_recurring = sum(s.is_recurring for series in self._users.values() for s in series.values())
+        return {"users": len(self._users), "series": n_series, "recurring": n_recurring,
+                "observed": self.observed}
+
+    # ── Bulk bootstrap ────────────────────────────────────────────────────────
+    def bootstrap(self, df: pd.DataFrame, default_user: str = "default") -> int:
+        """
+        Replace the state of every user in `df` with the state built from its
+        rows. Intervals, EWMAs and jitter are computed per series with grouped
+        vectorized operations; only the final per-series rows are turned into
+        Python objects. Returns the number of series kept.
+        """
+        category_field = "category" if "category" in df.columns else "true_category"
+        amount = pd.to_numeric(df["amount"], errors="coerce")
+        dates = _parse_dates(df["date"])     # DD-MM-YYYY or ISO, like analytics
+        frame = pd.DataFrame({
+            "user": df["user_id"].fillna(default_user).astype(str) if "user_id" in df.columns else default_user,
+            "merchant": df["merchant"].fillna("").astype(str),
+            "category": df[category_field].fillna("Other").astype(str),
+            "amount": amount,
+            "day": (dates - pd.Timestamp(_EPOCH)).dt.days,
+        })
+        # normalize each distinct spelling once (same rules as utils.normalize_text)
+        codes, spellings = pd.factorize(frame["merchant"])
+        keys = (
+            pd.Series(spellings).str.lower().str.strip()
+            .str.replace(r"[^a-z0-9\s]", " ", regex=True)
+            .str.replace(r"\s+", " ", regex=True).str.strip()
+        )
+        frame["key"] = keys.to_numpy()[codes]
+        frame = frame[(frame["amount"] > 0) & frame["day"].notna() & (frame["key"] != "")]
+        frame["bucket"] = np.rint(np.log(np.maximum(frame["amount"].to_numpy(), 1.0)) / _LOG_BUCKET).astype(np.int64)
+        frame = (
+            frame.sort_values(["user", "key", "bucket", "day"], kind="stable")
+            .drop_duplicates(["user", "key", "bucket", "day"])
+            .reset_index(drop=True)
+        )
+
+        # rows are contiguous per series; `occurrence` is the position within it
+        series_cols = frame[["user", "key", "bucket"]]
+        starts = np.r_[True, (series_cols.iloc[1:].to_numpy() != series_cols.iloc[:-1].to_numpy()).any(axis=1)]
+        first_row = np.flatnonzero(starts)
+        occurrence = np.arange(len(frame)) - np.repeat(first_row, np.diff(np.r_[first_row, len(frame)]))
+        last = np.r_[first_row[1:] - 1, len(frame) - 1]
+
+        day = frame["day"].to_numpy(np.float64)
+        gap = np.where(starts, np.nan, day - np.r_[np.nan, day[:-1]])
+        interval = _ewm_path(gap, occurrence)
+        deviation = np.abs(gap - np.r_[np.nan, interval[:-1]])
+        deviation[occurrence == 1] = 0.0                  # 2nd occurrence only seeds the interval
+        jitter = _ewm_path(deviation, occurrence)
+        ewm_amount = _ewm_path(frame["amount"].to_numpy(np.float64), occurrence)
+
+        state = pd.DataFrame({
+            "user": frame["user"].to_numpy()[last],
+            "key": frame["key"].to_numpy()[last],
+            "bucket": frame["bucket"].to_numpy()[last],
+            "merchant": frame["merchant"].to_numpy()[last],
+            "category": frame["category"].to_numpy()[last],
+            "last_day": day[last].astype(np.int64),
+            "count": occurrence[last] + 1,
+            "interval": np.nan_to_num(interval[last]),
+            "jitter": np.nan_to_num(jitter[last]),
+            "amount": ewm_amount[last],
+        }).sort_values("last_day", kind="stable")
+
+        users: dict[str, OrderedDict] = {}
+        for row in state.itertuples(index=False):
+            users.setdefault(row.user, OrderedDict())[(row.key, int(row.bucket))] = Series(
+                row.merchant, row.category, int(row.last_day), int(row.count),
+                float(row.interval), float(row.jitter), float(row.amount),
+            )
+        with self._lock:
+            for user, series in users.items():
+                while len(series) > self.max_series_per_user:
+                    series.popitem(last=False)
+                self._users[user] = series
+        return sum(len(series) for series in users.values())
+
+    def bootstrap_csv(self, path: str) -> int:
+        return self.bootstrap(pd.read_csv(path))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path", help="CSV with amount, merchant, date, category[, user_id]")
+    parser.add_argument("--user", default=None, help="print this user's series (default: first user)")
+    parser.add_argument("--all", action="store_true", help="include series not (yet) recurring")
+    args = parser.parse_args()
+
+    detector = RecurringDetector()
+    t0 = time.perf_counter()
+    n = detector.bootstrap_csv(args.path)
+    print(f"Bootstrapped {n} series in {(time.perf_counter() - t0) * 1000:.0f}ms: {detector.stats()}")
+    user = args.user or next(iter(detector._users), None)
+    if user is not None:
+        print(json.dumps(detector.series(user, only_recurring=not args.all), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,286 @@
+"""
+sms_templates.py — template-skeleton cache in front of the SMS regex cascade.
+
+Bank SMS come from a few fixed templates; only the amount, date, merchant
+and reference numbers change. Each message is reduced to a skeleton — its
+first three and last two words with digits masked:
+
+  "Paid Rs 1055 to 1mg via UPI on 23-01-2026. Txn ID: 998877."
+      → "Paid Rs # | ID: #."
+
+The first time a skeleton is seen, the full parser runs and a regex is
+learned from where it found the fields: literal text is kept, digit runs
+become \\d+, and the amount / date / merchant spans become named groups. Later
+messages with that skeleton are parsed with one fullmatch of the learned
+regex instead of the _MERCH_RE keyword scan. The merchant group is main's
+_MERCH_NAME wrapped in an atomic group, so it stops at the first place the
+full parser would stop ("Amazon on" → "Amaz" included) and the rest of the
+template cannot stretch it.
+
+A new template is checked against the full parser for its first
+`validate_first` hits and dropped for good on any disagreement. A skeleton can
+hold a few variants (templates that share their first and last words);
+anything that matches none of them goes to the full parser, which may then
+add a variant.
+
+Usage (benchmark):
+  python sms_templates.py
+
+Used by: main.py (_parse_sms)
+"""
+
+import re
+import threading
+import time
+from collections import Counter, OrderedDict
+from typing import Callable, Optional
+
+_DIGITS = re.compile(r"\d+")
+_PIECES = re.compile(r"\d+|\s+|[^\d\s]+")
+_GROUPS = {
+    "amount": r"(?P<amount>\d+(?:\.\d{1,2})?)",
+    "date": r"(?P<date>\d{2}[-/]\d{2}[-/]\d{4})",
+}
+HEAD_WORDS = 3
+TAIL_WORDS = 2
+MAX_VARIANTS = 4
+ATM_MARGIN = 8              # chars either side of the merchant searched for ATM words
+MAX_MERCHANTS = 4096        # checked merchant spellings remembered per template
+
+
+def skeleton(text: str) -> str:
+    head = text.split(None, HEAD_WORDS)[:HEAD_WORDS]
+    tail = text.rsplit(None, TAIL_WORDS)[-TAIL_WORDS:]
+    return _DIGITS.sub("#", " ".join(head) + " | " + " ".join(tail))
+
+
+def _literal(segment: str) -> str:
+    out = []
+    for piece in _PIECES.findall(segment):
+        if piece[0].isdigit():
+            out.append(r"\d+")
+        elif piece[0].isspace():
+            out.append(r"\s+")
+        else:
+            out.append(re.escape(piece))
+    return "".join(out)
+
+
+class _Template:
+    __slots__ = ("regex", "fields", "pending", "merchants")
+
+    def __init__(self, regex: re.Pattern, validate_first: int):
+        self.regex = regex
+        self.fields = frozenset(regex.groupindex)     # Pattern.groupindex copies on every access
+        self.pending = validate_first     # hits still to be checked against the full parser
+        # raw merchant group → (cleaned merchant, None) or (None, miss reason)
+        self.merchants: dict[str, tuple[Optional[str], Optional[str]]] = {}
+
+
+class TemplateCache:
+    """
+    `full_parse` and the regexes are main.py's, passed in so this module does
+    not import the service. `merchant_name` is the capture-group pattern that
+    follows the keyword in `merch_re`; `merchant_ok` is the full parser's
+    candidate filter.
+    """
+
+    def __init__(self, full_parse: Callable[[str], dict], amount_re: re.Pattern,
+                 date_re: re.Pattern, merch_re: re.Pattern, merchant_name: str,
+                 atm_re: re.Pattern, merchant_ok: Callable[[str], bool],
+                 max_skeletons: int = 512, validate_first: int = 20):
+        self.full_parse = full_parse
+        self.amount_re = amount_re
+        self.date_re = date_re
+        self.merch_re = merch_re
+        # "(name)(?=end)" → "(?i:(?>(?P<merchant>name)(?=end)))"
+        self.merchant_group = "(?i:(?>(?P<merchant>" + merchant_name[1:] + "))"
+        self.atm_re = atm_re
+        self.merchant_ok = merchant_ok
+        self.max_skeletons = max_skeletons
+        self.validate_first = validate_first
+        self._templates: OrderedDict[str, list[_Template]] = OrderedDict()
+        self._rejected: set[str] = set()          # patterns that disagreed once
+        self._lock = threading.Lock()
+        self.outcomes: Counter = Counter()
+        self.hits = 0
+
+    # ── Parsing ───────────────────────────────────────────────────────────────
+    def parse(self, text: str) -> dict:
+        if not text:
+            return self.full_parse(text)
+        key = skeleton(text)
+        # Lock-free read: get/move_to_end are atomic under the GIL, and the
+        # variant lists are only appended to / removed from under the lock
+        variants = self._templates.get(key)
+        if variants is None:
+            return self._miss(text, key, "new_skeleton")
+        try:
+            self._templates.move_to_end(key)
+        except KeyError:                # evicted by another thread just now
+            pass
+
+        for template in variants:
+            m = template.regex.fullmatch(text)
+            if m is not None:
+                break
+        else:
+            return self._miss(text, key, "no_variant_matched")
+
+        fields = template.fields
+        merchant = None
+        if "merchant" in fields:
+            raw = m.group("merchant")
+            checked = template.merchants.get(raw)
+            if checked is None:
+                checked = self._check_merchant(template, text, m)
+            merchant, reason = checked
+            if reason is not None:
+                return self._miss(text, key, reason, learn=False)
+
+        result = {"amount": m.group("amount") if "amount" in fields else None,
+                  "date": m.group("date") if "date" in fields else None,
+                  "merchant": merchant, "is_atm": False}
+        if template.pending > 0:
+            return self._validate(text, key, template, result)
+        self.hits += 1                  # plain int: this is the hot path
+        return result
+
+    def _check_merchant(self, template: _Template, text: str,
+                        m: re.Match) -> tuple[Optional[str], Optional[str]]:
+        """
+        The full parser's ATM and candidate checks for one merchant spelling.
+        Literal text never holds ATM words (such messages are not learned) and
+        the other fields are digits, so the merchant and its edges decide both
+        checks and the result can be remembered per template.
+        """
+        start, end = m.span("merchant")
+        merchant = " ".join(m.group("merchant").split())
+        if self.atm_re.search(text, max(start - ATM_MARGIN, 0), end + ATM_MARGIN):
+            checked = (None, "atm")
+        elif not self.merchant_ok(merchant):
+            checked = (None, "rejected_merchant")
+        else:
+            checked = (merchant, None)
+        if len(template.merchants) >= MAX_MERCHANTS:
+            template.merchants.clear()
+        template.merchants[m.group("merchant")] = checked
+        return checked
+
+    def _validate(self, text: str, key: str, template: _Template, result: dict) -> dict:
+        expected = self.full_parse(text)
+        if expected == result:
+            template.pending -= 1
+            self.outcomes["validated_hit"] += 1
+            return result
+        with self._lock:
+            self._rejected.add(template.regex.pattern)
+            variants = self._templates.get(key)
+            if variants is not None and template in variants:
+                variants.remove(template)
+        self.outcomes["invalidated"] += 1
+        return expected
+
+    def _miss(self, text: str, key: str, reason: str, learn: bool = True) -> dict:
+        self.outcomes[f"miss_{reason}"] += 1
+        parsed = self.full_parse(text)
+        if learn and not parsed["is_atm"]:
+            self._learn(text, key, parsed)
+        return parsed
+
+    # ── Learning ──────────────────────────────────────────────────────────────
+    def _spans(self, text: str, parsed: dict) -> Optional[list[tuple[int, int, str]]]:
+        spans = []
+        if parsed["amount"] is not None:
+            m = self.amount_re.search(text)
+            spans.append((m.start(1), m.end(1), "amount"))
+        if parsed["date"] is not None:
+            m = self.date_re.search(text)
+            spans.append((m.start(1), m.end(1), "date"))
+        if parsed["merchant"] is not None:
+            m = next(m for m in self.merch_re.finditer(text) if self.merchant_ok(m.group(1).strip()))
+            spans.append((m.start(1), m.end(1), "merchant"))
+        spans.sort()
+        if any(a[1] > b[0] for a, b in zip(spans, spans[1:])):
+            return None                 # overlapping fields — not a clean template
+        return spans
+
+    def _learn(self, text: str, key: str, parsed: dict) -> None:
+        if len(self._templates.get(key, ())) >= MAX_VARIANTS:
+            return
+        spans = self._spans(text, parsed)
+        if spans is None:
+            return
+        parts, pos = [], 0
+        for start, end, name in spans:
+            parts.append(_literal(text[pos:start]))
+            parts.append(self.merchant_group if name == "merchant" else _GROUPS[name])
+            pos = end
+        parts.append(_literal(text[pos:]))
+        pattern = "".join(parts)
+
+        with self._lock:
+            if pattern in self._rejected:
+                return
+            variants = self._templates.setdefault(key, [])
+            if len(variants) >= MAX_VARIANTS or any(t.regex.pattern == pattern for t in variants):
+                return
+            variants.append(_Template(re.compile(pattern), self.validate_first))
+            self._templates.move_to_end(key)
+            while len(self._templates) > self.max_skeletons:
+                self._templates.popitem(last=False)
+        self.outcomes["learned"] += 1
+
+    def stats(self) -> dict:
+        served = self.hits + self.outcomes["validated_hit"]
+        misses = sum(n for k, n in self.outcomes.items() if k.startswith("miss_"))
+        lookups = served + misses + self.outcomes["invalidated"]
+        with self._lock:
+            n_templates = sum(len(v) for v in self._templates.values())
+            n_skeletons = len(self._templates)
+        return {
+            "skeletons": n_skeletons,
+            "templates": n_templates,
+            "rejected_templates": len(self._rejected),
+            "lookups": lookups,
+            "hit_rate": round(served / lookups, 4) if lookups else 0.0,
+            # served from a template without running the full parser at all
+            "fast_path_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "outcomes": {"hit": self.hits, **self.outcomes},
+        }
+
+
+def main():
+    """Full parser vs template cache over bank_sms_data.csv (best of 3 passes)."""
+    import pandas as pd
+
+    import main as service
+
+    texts = pd.read_csv(service.Path(__file__).parent / "bank_sms_data.csv")["sms_text"].astype(str).tolist()
+    cache = TemplateCache(service._parse_sms_full, service._AMOUNT_RE, service._DATE_RE,
+                          service._MERCH_RE, service._MERCH_NAME, service._ATM_RE,
+                          service._merchant_ok)
+
+    def best_of(parse) -> tuple[float, list]:
+        best = float("inf")
+        for _ in range(3):
+            t0 = time.perf_counter()
+            out = [parse(t) for t in texts]
+            best = min(best, time.perf_counter() - t0)
+        return best, out
+
+    full_s, expected = best_of(service._parse_sms_full)
+    for t in texts:                     # warm-up pass learns and validates templates
+        cache.parse(t)
+    cached_s, got = best_of(cache.parse)
+
+    agree = sum(a == b for a, b in zip(expected, got))
+    print(f"messages:        {len(texts)}")
+    print(f"full parser:     {len(texts) / full_s:,.0f} msg/s")
+    print(f"template cache:  {len(texts) / cached_s:,.0f} msg/s  ({full_s / cached_s:.2f}x)")
+    print(f"agreement:       {agree / len(texts):.2%}")
+    print(cache.stats())
+
+
+if __name__ == "__main__":
+    main()
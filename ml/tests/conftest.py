@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# the service modules import each other as top-level modules (see Dockerfile)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
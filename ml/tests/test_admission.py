@@ -0,0 +1,99 @@
+import asyncio
+
+import httpx
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+from admission import AdmissionControl, AdmissionMiddleware, parse_limits
+
+
+def _app(limits: str, max_wait_ms: float = 1000.0):
+    """A limited /slow that holds its slot until `release` is set, and an unlimited /free."""
+    release = asyncio.Event()
+
+    async def slow(request):
+        await release.wait()
+        return JSONResponse({"ok": True})
+
+    async def free(request):
+        return JSONResponse({"ok": True})
+
+    control = AdmissionControl(parse_limits(limits), max_wait_ms=max_wait_ms)
+    app = Starlette(routes=[Route("/slow", slow, methods=["POST"]), Route("/free", free, methods=["POST"])])
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(AdmissionMiddleware(app, control=control)),
+                               base_url="http://test")
+    return client, control, release
+
+
+async def _hold_slot(client: httpx.AsyncClient) -> asyncio.Task:
+    task = asyncio.create_task(client.post("/slow"))
+    await asyncio.sleep(0.05)           # let it take the slot
+    return task
+
+
+def test_parse_limits():
+    assert parse_limits("/predict/sms=32:64, /predict/batch=4") == {
+        "/predict/sms": (32, 64), "/predict/batch": (4, 0)}
+    assert parse_limits("") == {}
+
+
+def test_full_waiting_room_answers_429():
+    async def run():
+        client, control, release = _app("/slow=1:0")
+        held = await _hold_slot(client)
+        rejected = await client.post("/slow", json={"x": 1})
+        free = await client.post("/free")
+        release.set()
+        return (await held), rejected, free, control.stats()
+
+    held, rejected, free, stats = asyncio.run(run())
+    assert held.status_code == 200 and free.status_code == 200
+    assert rejected.status_code == 429
+    assert rejected.json()["reason"] == "queue_full"
+    assert int(rejected.headers["retry-after"]) >= 1
+    assert stats["endpoints"]["/slow"]["outcomes"] == {"admitted": 1, "queue_full": 1}
+
+
+def test_queue_wait_limit_answers_503():
+    async def run():
+        client, control, release = _app("/slow=1:4", max_wait_ms=50)
+        held = await _hold_slot(client)
+        timed_out = await client.post("/slow")
+        release.set()
+        return (await held), timed_out, control.stats()
+
+    held, timed_out, stats = asyncio.run(run())
+    assert held.status_code == 200
+    assert timed_out.status_code == 503
+    assert timed_out.json()["reason"] == "queue_timeout"
+    assert int(timed_out.headers["retry-after"]) >= 1
+    gate = stats["endpoints"]["/slow"]
+    assert (gate["in_flight"], gate["queued"]) == (0, 0)
+
+
+def test_queued_request_gets_the_freed_slot():
+    async def run():
+        client, control, release = _app("/slow=1:4")
+        held = await _hold_slot(client)
+        queued = asyncio.create_task(client.post("/slow"))
+        await asyncio.sleep(0.05)
+        waiting = control.stats()["endpoints"]["/slow"]["queued"]
+        release.set()
+        return waiting, (await held), (await queued)
+
+    waiting, held, queued = asyncio.run(run())
+    assert waiting == 1
+    assert held.status_code == 200 and queued.status_code == 200
+
+
+def test_expired_deadline_answers_503():
+    async def run():
+        client, control, release = _app("/slow=1:4")
+        release.set()
+        return await client.post("/slow", headers={"X-Request-Timeout-Ms": "0"})
+
+    response = asyncio.run(run())
+    assert response.status_code == 503
+    assert response.json()["reason"] == "deadline"
+    assert "retry-after" in response.headers
@@ -0,0 +1,53 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from analytics import _MASK, SpendingAnalytics, _pack, _parse_dates
+
+
+def test_parse_dates_mixed_formats():
+    dates = _parse_dates(pd.Series([
+        "16-01-2026",                   # sms_parser.py
+        "2026-01-16",                   # naive ISO
+        "2026-01-16T10:00:00",
+        "2026-01-16T10:00:00.000Z",     # JSON / Prisma
+        "2026-01-16T23:30:00+05:30",    # offset, converted to UTC
+        "not a date",
+    ]))
+    assert dates.dt.tz is None
+    assert dates[:5].dt.strftime("%Y-%m-%d").tolist() == ["2026-01-16"] * 5
+    assert dates[3] == pd.Timestamp("2026-01-16 10:00")
+    assert dates[4] == pd.Timestamp("2026-01-16 18:00")
+    assert pd.isna(dates[5])
+
+
+def test_append_accepts_utc_iso_dates():
+    store = SpendingAnalytics()
+    added, rejected = store.append_records([
+        {"amount": 250.0, "merchant": "Swiggy", "date": "2026-01-16T10:00:00.000Z", "category": "Food"},
+        {"amount": 120.0, "merchant": "Uber", "date": "16-01-2026", "category": "Travel"},
+        {"amount": 80.0, "merchant": "Zepto", "date": "1969-12-31", "category": "Groceries"},
+    ])
+    assert (added, rejected) == (2, 1)
+    assert store.category_totals("default") == {"2026-01": {"Food": 250.0, "Travel": 120.0}}
+
+
+def test_pack_rejects_out_of_range_fields():
+    ones = np.ones(1, dtype=np.int64)
+    with pytest.raises(ValueError):
+        _pack(ones, ones, ones * (_MASK + 1))
+    with pytest.raises(ValueError):
+        _pack(ones, -ones, ones)
+
+
+def test_rejected_batch_leaves_dictionaries_untouched():
+    store = SpendingAnalytics()
+    store._merchant_totals.item_bits = 1            # room for two merchant codes
+    row = {"amount": 10.0, "date": "16-01-2026", "category": "Food"}
+    with pytest.raises(ValueError):
+        store.append_records([{**row, "merchant": m} for m in ("A", "B", "C")])
+    assert (store.merchants.names, store.users.names, store.categories.names) == ([], [], [])
+    assert store.rows == 0
+
+    assert store.append_records([{**row, "merchant": m} for m in ("A", "B")]) == (2, 0)
+    assert [m["merchant"] for m in store.top_merchants("default")] == ["A", "B"]
@@ -0,0 +1,119 @@
+import pickle
+import queue
+import time
+
+import pytest
+from sklearn.dummy import DummyClassifier
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from model_registry import (LoadedModel, ModelRegistry, ModelRouting, ModelRoutingMiddleware,
+                            ShadowEvaluator, mark_served, requested_model)
+
+
+def _model(category: str) -> DummyClassifier:
+    return DummyClassifier(strategy="most_frequent").fit([[0], [0]], [category, category])
+
+
+@pytest.fixture
+def registry(tmp_path):
+    for name, category in (("expense_model_20260101_000000", "Food"),
+                           ("expense_model_20260201_000000", "Travel")):
+        (tmp_path / f"{name}.pkl").write_bytes(pickle.dumps(_model(category)))
+    return ModelRegistry(str(tmp_path), max_loaded=2)
+
+
+def _loaded(version: str) -> LoadedModel:
+    return LoadedModel(pipeline=None, version=version, model_path="", load_time_ms=0.0, loaded_at=0.0)
+
+
+def test_resolve_by_name_and_version_prefix(registry):
+    name = "expense_model_20260101_000000"
+    assert registry.resolve(name) == name
+    version = registry.get(name).version
+    assert registry.resolve(version[:8]) == name
+    assert registry.resolve(version) == name
+    assert registry.resolve(version[:7]) is None          # below MIN_VERSION_PREFIX
+    assert registry.resolve("expense_model_19990101_000000") is None
+
+
+def test_resolve_rejects_ambiguous_prefix(registry):
+    registry._loaded["a"] = _loaded("abcdef123456")
+    registry._loaded["b"] = _loaded("abcdef12ffff")
+    with pytest.raises(LookupError):
+        registry.resolve("abcdef12")
+    assert registry.resolve("abcdef123") == "a"
+
+
+def test_get_unloads_least_recently_used(tmp_path, registry):
+    (tmp_path / "compressed_model_20260301_000000.pkl").write_bytes(pickle.dumps(_model("Bills")))
+    registry.discover()
+    for name in sorted(registry.paths):
+        registry.get(name)
+    assert [m["name"] for m in registry.status() if m["loaded"]] == [
+        "expense_model_20260101_000000", "expense_model_20260201_000000"]
+
+
+def _routed_app(routing: ModelRouting) -> TestClient:
+    def endpoint(request):
+        requested = requested_model()
+        if requested:
+            mark_served(f"v-{requested}")
+        return JSONResponse({"requested": requested})
+
+    app = Starlette(routes=[Route("/predict", endpoint, methods=["POST"])])
+    return TestClient(ModelRoutingMiddleware(app, routing=routing))
+
+
+def test_routing_header_wins_and_is_echoed():
+    client = _routed_app(ModelRouting("candidate", percent=100))
+    r = client.post("/predict", headers={"X-Model-Version": "other"})
+    assert r.json() == {"requested": "other"}
+    assert r.headers["x-model-version"] == "v-other"
+
+    r = client.post("/predict", headers={"X-Model-Version": "primary"})
+    assert r.json() == {"requested": None}
+    assert "x-model-version" not in r.headers
+
+
+def test_routing_percent_split():
+    assert _routed_app(ModelRouting("candidate", percent=100)).post("/predict").json() == {"requested": "candidate"}
+    assert _routed_app(ModelRouting("candidate", percent=0)).post("/predict").json() == {"requested": None}
+    assert _routed_app(ModelRouting("", percent=100)).post("/predict").json() == {"requested": None}
+
+
+def _drain(shadow: ShadowEvaluator, scored: int) -> dict:
+    deadline = time.time() + 5
+    while shadow.stats()["scored"] + shadow.stats()["errors"] < scored and time.time() < deadline:
+        time.sleep(0.01)
+    return shadow.stats()
+
+
+def test_shadow_agreement_and_latency(registry):
+    shadow = ShadowEvaluator(registry, "expense_model_20260201_000000", sample_rate=1.0)
+    shadow.submit([[0], [0]], ["Travel", "Food"], 1.5)
+    shadow.submit([[0]], ["Food"], None)            # agreement only, no latency pair
+    stats = _drain(shadow, 2)
+
+    assert (stats["submitted"], stats["scored"], stats["dropped"]) == (2, 2, 0)
+    assert stats["rows_compared"] == 3
+    assert stats["agreement"] == round(1 / 3, 4)
+    assert stats["top_disagreements"] == [{"primary": "Food", "candidate": "Travel", "count": 2}]
+    assert stats["primary_latency_ms"]["p50"] == 1.5
+    assert stats["candidate_latency_ms"] is not None
+
+
+def test_shadow_counts_drops_and_resets_on_new_model(registry):
+    shadow = ShadowEvaluator(registry, "expense_model_20260201_000000", sample_rate=1.0)
+    # the worker stays blocked on the old queue, so this one only fills up
+    shadow._queue = queue.Queue(maxsize=2)
+    for _ in range(5):
+        shadow.submit([[0]], ["Food"], 1.0)
+    stats = shadow.stats()
+    assert (stats["submitted"], stats["dropped"], stats["queued"]) == (2, 3, 2)
+
+    shadow.configure("expense_model_20260101_000000", 0.5)
+    stats = shadow.stats()
+    assert (stats["submitted"], stats["dropped"], stats["sample_rate"]) == (0, 0, 0.5)
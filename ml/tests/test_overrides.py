@@ -0,0 +1,87 @@
+import pytest
+
+from overrides import OverrideIndex
+
+
+@pytest.fixture
+def db(tmp_path):
+    return str(tmp_path / "overrides.sqlite")
+
+
+def test_set_get_and_delete(db):
+    index = OverrideIndex(db)
+    index.set_many([("u1", "swiggy", "Food"), ("u1", "uber", "Travel"), ("u2", "swiggy", "Shopping")])
+    assert index.get("u1", "swiggy") == "Food"
+    assert index.get("u2", "swiggy") == "Shopping"
+    assert index.get("u3", "swiggy") is None
+    assert index.get_many("u1", ["swiggy", "uber", "zomato"]) == {"swiggy": "Food", "uber": "Travel"}
+
+    index.set("u1", "swiggy", None)
+    assert index.get("u1", "swiggy") is None
+    assert index.stats()["stored_overrides"] == 2
+
+
+def test_other_worker_writes_apply_after_sync(db):
+    reader = OverrideIndex(db, sync_interval=3600)
+    writer = OverrideIndex(db, sync_interval=3600)
+    assert reader.get("u1", "swiggy") is None           # u1 is now loaded, without overrides
+
+    writer.set("u1", "swiggy", "Food")
+    assert reader.get("u1", "swiggy") is None           # stale until the next sync
+    reader._next_sync = 0.0
+    assert reader.get("u1", "swiggy") == "Food"
+    assert reader.outcomes["invalidations"] == 1
+
+
+def test_wide_write_reloads_every_user(db):
+    reader = OverrideIndex(db, sync_interval=0)
+    writer = OverrideIndex(db)
+    writer._WIDE_WRITE = 1
+    for user in ("u1", "u2", "u3"):
+        reader.get(user, "swiggy")
+    writer.set_many([("u1", "swiggy", "Food"), ("u2", "swiggy", "Travel")])
+    assert reader.get("u2", "swiggy") == "Travel"
+    assert reader.stats()["loaded_users"] == 1          # everyone dropped, u2 reloaded
+
+
+def test_pruned_change_log_reloads_every_user(db):
+    reader = OverrideIndex(db, sync_interval=3600)
+    writer = OverrideIndex(db)
+    writer._CHANGES_KEEP = 1
+    reader.get("u1", "swiggy")
+    reader.get("u9", "swiggy")
+    for category in ("Food", "Travel", "Bills"):
+        writer.set("u2", "swiggy", category)
+    reader._next_sync = 0.0
+    assert reader.get("u2", "swiggy") == "Bills"
+    assert reader.outcomes["invalidations"] == 2
+
+
+def test_memory_budget_evicts_least_recent_users(db):
+    index = OverrideIndex(db, memory_bytes=1)
+    index.set_many([("u1", "swiggy", "Food"), ("u2", "swiggy", "Travel")])
+    assert index.get("u1", "swiggy") == "Food"
+    assert index.get("u2", "swiggy") == "Travel"
+    stats = index.stats()
+    assert stats["loaded_users"] == 1                   # never fewer than the current user
+    assert stats["outcomes"]["evictions"] == 1
+
+
+def test_import_csv_normalizes_and_removes(db, tmp_path):
+    csv_path = tmp_path / "corrections.csv"
+    csv_path.write_text("user_id,merchant,category\n"
+                        "u1,  SWIGGY ,Food\n"
+                        "u1,Uber,Travel\n"
+                        "u1,uber,\n"
+                        ",Zomato,Food\n")
+    index = OverrideIndex(db)
+    assert index.import_csv(str(csv_path), lambda m: m.strip().lower()) == 3
+    assert index.get_many("u1", ["swiggy", "uber"]) == {"swiggy": "Food"}
+
+
+def test_read_errors_mean_no_override(db):
+    index = OverrideIndex(db)
+    index.set("u1", "swiggy", "Food")
+    index._conn().execute("DROP TABLE overrides")
+    assert index.get("u2", "swiggy") is None
+    assert index.outcomes["errors"] == 1
@@ -0,0 +1,25 @@
+from datetime import date
+
+import pandas as pd
+
+from recurring import RecurringDetector, parse_date
+
+
+def test_parse_date_formats():
+    assert parse_date("16-01-2026") == date(2026, 1, 16)
+    assert parse_date("2026-01-16") == date(2026, 1, 16)
+    assert parse_date("2026-01-16T23:30:00+05:30") == date(2026, 1, 16)
+    assert parse_date("2026-01-16T20:00:00-05:00") == date(2026, 1, 17)    # UTC, as analytics
+    assert parse_date("16/01/2026") is None
+
+
+def test_bootstrap_accepts_both_date_formats():
+    dates = ["05-01-2026", "2026-02-05", "05-03-2026", "2026-04-05T09:00:00.000Z"]
+    detector = RecurringDetector()
+    kept = detector.bootstrap(pd.DataFrame({
+        "user_id": "u1", "merchant": "Netflix", "amount": 649.0, "category": "Entertainment",
+        "date": dates,
+    }))
+    assert kept == 1
+    [series] = detector.series("u1")
+    assert series["occurrences"] == 4
@@ -1,17 +1,57 @@
+import argparse
+import itertools
+import math
+import multiprocessing
+import os
 import pickle
+import queue
+import time
 from datetime import datetime
 from pathlib import Path
 
+import numpy as np
 import pandas as pd
-from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.feature_extraction.text import HashingVectorizer, TfidfVectorizer
 from sklearn.linear_model import LogisticRegression
 from sklearn.metrics import accuracy_score, classification_report, confusion_matrix
 from sklearn.model_selection import train_test_split
 from sklearn.pipeline import Pipeline
 
+from compression import compress_pipeline
 from data_pipeline import build_training_dataset
+from promotion import evaluate as evaluate_promotion, load_incumbent
 from utils import ensure_dir, load_config, save_json
 
+DEFAULT_PARAMS = {
+    "featurizer": "tfidf",
+    "hash_buckets": 2 ** 16,
+    "ngram_range": (1, 2),
+    "analyzer": "word",
+    "C": 1.0,
+    "max_features": None,
+    "sublinear_tf": False,
+}
+
+DEFAULT_SEARCH = {
+    "budget_seconds": 300,
+    "n_jobs": -1,
+    "eta": 3,
+    "min_fraction": 0.1,
+    "space": {
+        "ngram_range": [[1, 1], [1, 2], [1, 3]],
+        "analyzer": ["word", "char_wb"],
+        "C": [0.5, 1.0, 2.0, 4.0],
+        "max_features": [None, 5000, 20000],
+        "sublinear_tf": [False, True],
+    },
+}
+
+DEFAULT_COMPRESSION = {
+    "keep_fraction": 1.0,
+    "min_weight": 0.05,
+    "dtype": "int8",
+}
+
 
 def filter_rare_classes(df: pd.DataFrame, min_rows: int) -> pd.DataFrame:
     counts = df["category"].value_counts()
@@ -19,16 +59,13 @@ def filter_rare_classes(df: pd.DataFrame, min_rows: int) -> pd.DataFrame:
     return df[df["category"].isin(keep)].reset_index(drop=True)
 
 
-def train() -> None:
-    config = load_config()
-    data_path = config["data_path"]
+def load_splits(config: dict) -> dict:
     random_state = config["random_state"]
     test_size = config["test_size"]
     val_size = config["val_size"]
-    min_rows = config["min_rows_per_class"]
 
-    data, y = build_training_dataset(data_path)
-    data = filter_rare_classes(data, min_rows)
+    data, y = build_training_dataset(config["data_path"])
+    data = filter_rare_classes(data, config["min_rows_per_class"])
     X = data["merchant"]
     y = data["category"]
 
@@ -49,12 +86,42 @@ def train() -> None:
         stratify=y_temp
     )
 
-    model = Pipeline(
+    return {
+        "X_train": X_train, "y_train": y_train,
+        "X_val": X_val, "y_val": y_val,
+        "X_test": X_test, "y_test": y_test,
+    }
+
+
+def build_vectorizer(params: dict):
+    if params["featurizer"] == "hashing":
+        # Stateless: no vocabulary to grow or look up, and the classifier is
+        # always (n_classes x hash_buckets) no matter how much data we add.
+        return HashingVectorizer(
+            n_features=int(params["hash_buckets"]),
+            ngram_range=tuple(params["ngram_range"]),
+            analyzer=params["analyzer"],
+            alternate_sign=False,
+        )
+    if params["featurizer"] != "tfidf":
+        raise ValueError(f"Unknown featurizer: {params['featurizer']!r}")
+    return TfidfVectorizer(
+        ngram_range=tuple(params["ngram_range"]),
+        analyzer=params["analyzer"],
+        max_features=params["max_features"],
+        sublinear_tf=params["sublinear_tf"],
+    )
+
+
+def build_pipeline(params: dict | None = None) -> Pipeline:
+    params = {**DEFAULT_PARAMS, **(params or {})}
+    return Pipeline(
         steps=[
-            ("vectorizer", TfidfVectorizer(ngram_range=(1, 2))),
+            ("vectorizer", build_vectorizer(params)),
             (
                 "classifier",
                 LogisticRegression(
+                    C=params["C"],
                     max_iter=2000,
                     class_weight="balanced"
                 )
@@ -62,16 +129,17 @@ def train() -> None:
         ]
     )
 
-    model.fit(X_train, y_train)
 
-    val_preds = model.predict(X_val)
-    test_preds = model.predict(X_test)
+def evaluate_model(model: Pipeline, splits: dict) -> dict:
+    val_preds = model.predict(splits["X_val"])
+    test_preds = model.predict(splits["X_test"])
+    y_test = splits["y_test"]
 
-    metrics = {
-        "train_size": len(X_train),
-        "val_size": len(X_val),
-        "test_size": len(X_test),
-        "val_accuracy": accuracy_score(y_val, val_preds),
+    return {
+        "train_size": len(splits["X_train"]),
+        "val_size": len(splits["X_val"]),
+        "test_size": len(splits["X_test"]),
+        "val_accuracy": accuracy_score(splits["y_val"], val_preds),
         "test_accuracy": accuracy_score(y_test, test_preds),
         "classification_report": classification_report(
             y_test,
@@ -81,29 +149,343 @@ def train() -> None:
         "confusion_matrix": confusion_matrix(y_test, test_preds).tolist()
     }
 
-    timestamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
+
+def promotion_gate(model: Pipeline, splits: dict, config: dict, force: bool = False) -> dict:
+    """Benchmark `model` against the promoted one; see promotion.py."""
+    model_dir = Path(config["model_dir"])
+    incumbent, incumbent_path = load_incumbent([model_dir / "latest_model.pkl", Path("expense_model.pkl")])
+    decision = evaluate_promotion(model, incumbent, splits["X_test"], splits["y_test"],
+                                  config.get("promotion"), incumbent_path)
+    decision["forced"] = force and not decision["promoted"]
+    decision["promoted"] = decision["promoted"] or force
+
+    cand = decision["candidate"]
+    print(f"Candidate: p99 {cand['p99_ms']:.3f}ms, {cand['batch_rows_per_s']:.0f} rows/s, "
+          f"load {cand['load_ms']:.1f}ms, {cand['memory_bytes'] / 1024:.0f} KB, "
+          f"test_acc {cand['test_accuracy']:.4f}")
+    if decision["incumbent"] is not None:
+        inc = decision["incumbent"]
+        print(f"Incumbent: p99 {inc['p99_ms']:.3f}ms, {inc['batch_rows_per_s']:.0f} rows/s, "
+              f"load {inc['load_ms']:.1f}ms, {inc['memory_bytes'] / 1024:.0f} KB, "
+              f"test_acc {inc['test_accuracy']:.4f}")
+    for failure in decision["failed_checks"]:
+        print(f"  - {failure}")
+    print("Promotion: " + ("forced" if decision["forced"] else "yes" if decision["promoted"] else "rejected"))
+    return decision
+
+
+def known_merchants(splits: dict) -> list[str]:
+    """Every normalized training merchant — the service's canonicalization targets."""
+    return sorted(set(splits["X_train"]) | set(splits["X_val"]) | set(splits["X_test"]))
+
+
+def save_artifacts(model: Pipeline, metrics: dict, config: dict,
+                   leaderboard: list | None = None, timestamp: str | None = None,
+                   merchants: list | None = None) -> None:
+    timestamp = timestamp or datetime.utcnow().strftime("%Y%m%d_%H%M%S")
     model_dir = ensure_dir(config["model_dir"])
     metrics_dir = ensure_dir(config["metrics_dir"])
 
+    # Every candidate stays loadable from the registry; only a promoted one is served by default
     model_path = model_dir / f"expense_model_{timestamp}.pkl"
     with open(model_path, "wb") as f:
         pickle.dump(model, f)
+    print(f"Model saved: {model_path}")
 
     latest_path = model_dir / "latest_model.pkl"
-    with open(latest_path, "wb") as f:
-        pickle.dump(model, f)
+    if metrics.get("promotion", {}).get("promoted", True):
+        with open(latest_path, "wb") as f:
+            pickle.dump(model, f)
 
-    with open("expense_model.pkl", "wb") as f:
-        pickle.dump(model, f)
+        with open("expense_model.pkl", "wb") as f:
+            pickle.dump(model, f)
+
+        print(f"Latest model: {latest_path}")
+        print("Compatibility model: expense_model.pkl")
+        if merchants is not None:
+            save_json(merchants, "known_merchants.json")
+            print(f"Known merchants: known_merchants.json ({len(merchants)})")
+    else:
+        print(f"Not promoted: {latest_path} and expense_model.pkl left unchanged")
 
     metrics_path = Path(metrics_dir) / f"metrics_{timestamp}.json"
     save_json(metrics, str(metrics_path))
-
-    print(f"Model saved: {model_path}")
-    print(f"Latest model: {latest_path}")
-    print("Compatibility model: expense_model.pkl")
     print(f"Metrics saved: {metrics_path}")
 
+    if leaderboard is not None:
+        leaderboard_path = Path(metrics_dir) / f"leaderboard_{timestamp}.json"
+        save_json(leaderboard, str(leaderboard_path))
+        print(f"Leaderboard saved: {leaderboard_path}")
+
+
+def compress(model: Pipeline, splits: dict, config: dict, timestamp: str,
+             promoted: bool = True) -> None:
+    """Write a pruned/quantized copy of `model` next to the regular artifacts."""
+    settings = {**DEFAULT_COMPRESSION, **config.get("compression", {})}
+    compressed = compress_pipeline(
+        model,
+        keep_fraction=settings["keep_fraction"],
+        min_weight=settings["min_weight"],
+        dtype=settings["dtype"],
+    )
+
+    X_test, y_test = splits["X_test"], splits["y_test"]
+    base_acc = accuracy_score(y_test, model.predict(X_test))
+    comp_acc = accuracy_score(y_test, compressed.predict(X_test))
+    base_bytes = len(pickle.dumps(model))
+    comp_bytes = len(pickle.dumps(compressed))
+
+    report = {
+        "settings": settings,
+        "n_features": model.steps[-1][1].coef_.shape[1],
+        "compressed_n_features": compressed.steps[-1][1].weights.shape[0],
+        "pickle_bytes": base_bytes,
+        "compressed_pickle_bytes": comp_bytes,
+        "test_accuracy": base_acc,
+        "compressed_test_accuracy": comp_acc,
+        "accuracy_delta": comp_acc - base_acc,
+    }
+
+    model_dir = ensure_dir(config["model_dir"])
+    compressed_path = model_dir / f"compressed_model_{timestamp}.pkl"
+    with open(compressed_path, "wb") as f:
+        pickle.dump(compressed, f)
+    latest_path = model_dir / "latest_compressed_model.pkl"
+    if promoted:
+        with open(latest_path, "wb") as f:
+            pickle.dump(compressed, f)
+
+    report_path = Path(config["metrics_dir"]) / f"compression_{timestamp}.json"
+    save_json(report, str(report_path))
+
+    print(f"Compressed model saved: {compressed_path}  "
+          f"({base_bytes / 1024:.1f} KB -> {comp_bytes / 1024:.1f} KB, "
+          f"accuracy delta {report['accuracy_delta']:+.4f})")
+    if promoted:
+        print(f"Latest compressed model: {latest_path}")
+    print(f"Compression report: {report_path}")
+
+
+def train(with_compression: bool = False, params: dict | None = None,
+          force_promote: bool = False) -> None:
+    config = load_config()
+    splits = load_splits(config)
+
+    model = build_pipeline(params)
+    model.fit(splits["X_train"], splits["y_train"])
+
+    metrics = evaluate_model(model, splits)
+    metrics["params"] = {**DEFAULT_PARAMS, **(params or {})}
+    metrics["promotion"] = promotion_gate(model, splits, config, force=force_promote)
+    timestamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
+    save_artifacts(model, metrics, config, timestamp=timestamp, merchants=known_merchants(splits))
+    if with_compression:
+        compress(model, splits, config, timestamp, promoted=metrics["promotion"]["promoted"])
+
+
+# ── Hyperparameter search ─────────────────────────────────────────────────────
+def expand_space(space: dict) -> list[dict]:
+    """Cartesian product of the search space, one dict per candidate."""
+    keys = list(space)
+    return [dict(zip(keys, values)) for values in itertools.product(*space.values())]
+
+
+def _run_trial(trial_id: int, params: dict, X_train: list, y_train: list,
+               X_val: list, y_val: list) -> dict:
+    """Fit one candidate on a training subset and score it on validation.
+
+    Runs inside a worker process, so it only takes picklable plain lists.
+    """
+    t0 = time.perf_counter()
+    try:
+        model = build_pipeline(params)
+        model.fit(X_train, y_train)
+        score = float(accuracy_score(y_val, model.predict(X_val)))
+        error = None
+    except Exception as exc:
+        score = None                    # not NaN: the leaderboard is strict JSON
+        error = str(exc)
+    return {
+        "trial_id": trial_id,
+        "params": params,
+        "train_rows": len(X_train),
+        "val_accuracy": score,
+        "fit_seconds": round(time.perf_counter() - t0, 3),
+        "error": error,
+    }
+
+
+def successive_halving(candidates: list[dict], splits: dict, search: dict,
+                       random_state: int) -> tuple[list[dict], bool]:
+    """
+    Successive halving over `candidates` with the training rows as the
+    budgeted resource. Every rung trains the survivors on `eta` times more
+    rows and keeps the top 1/eta. Stops early once the wall-clock budget
+    runs out; pending trials are cancelled and the finished ones still count.
+
+    Returns (trials, budget_exhausted). Trials that failed have
+    val_accuracy None and an `error`.
+    """
+    eta = max(2, int(search["eta"]))
+    n_jobs = search["n_jobs"]
+    if n_jobs in (None, -1):
+        workers = os.cpu_count() or 1
+    else:
+        workers = max(1, int(n_jobs))
+    deadline = time.monotonic() + float(search["budget_seconds"])
+
+    # 1 + floor(log_eta(candidates)), in integers: math.log(243, 3) is 4.999...
+    n_rungs = 1
+    while eta ** n_rungs <= len(candidates):
+        n_rungs += 1
+    fraction = max(float(search["min_fraction"]), eta ** -(n_rungs - 1))
+
+    # Nested subsets: every rung's rows are a superset of the previous rung's
+    order = np.random.RandomState(random_state).permutation(len(splits["X_train"]))
+    X_all = splits["X_train"].iloc[order].tolist()
+    y_all = splits["y_train"].iloc[order].tolist()
+    X_val = splits["X_val"].tolist()
+    y_val = splits["y_val"].tolist()
+
+    trials: list[dict] = []
+    survivors = list(enumerate(candidates))
+    exhausted = False
+    rung = 0
+
+    # multiprocessing.Pool rather than ProcessPoolExecutor: it can terminate
+    # workers still fitting when the budget runs out
+    pool = multiprocessing.Pool(processes=workers)
+    try:
+        while survivors:
+            n_rows = max(1, int(round(len(X_all) * min(fraction, 1.0))))
+            print(f"Rung {rung}: {len(survivors)} candidates on {n_rows} rows")
+            finished: queue.SimpleQueue = queue.SimpleQueue()
+            for tid, params in survivors:
+                pool.apply_async(_run_trial, (tid, params, X_all[:n_rows], y_all[:n_rows], X_val, y_val),
+                                 callback=finished.put, error_callback=finished.put)
+            rung_results = []
+            for _ in survivors:
+                remaining = deadline - time.monotonic()
+                try:
+                    if remaining <= 0:
+                        raise queue.Empty
+                    result = finished.get(timeout=remaining)
+                except queue.Empty:
+                    exhausted = True
+                    break
+                if isinstance(result, BaseException):
+                    raise result
+                result["rung"] = rung
+                rung_results.append(result)
+
+            trials.extend(rung_results)
+            if exhausted or fraction >= 1.0:
+                break
+
+            scored = sorted(
+                (r for r in rung_results if r["val_accuracy"] is not None),
+                key=lambda r: r["val_accuracy"],
+                reverse=True,
+            )
+            keep = max(1, math.ceil(len(scored) / eta))
+            survivors = [(r["trial_id"], r["params"]) for r in scored[:keep]]
+            fraction *= eta
+            rung += 1
+    finally:
+        # Trials still running past the budget are killed, not waited for
+        if exhausted:
+            pool.terminate()
+        else:
+            pool.close()
+        pool.join()
+
+    return trials, exhausted
+
+
+# Parameters only TfidfVectorizer reads; a hashing search would repeat each candidate
+TFIDF_ONLY = ("max_features", "sublinear_tf")
+
+
+def search(with_compression: bool = False, force_promote: bool = False,
+           fixed: dict | None = None) -> None:
+    """Search the config.json space; `fixed` params (e.g. the featurizer) hold for every candidate."""
+    config = load_config()
+    search_config = {**DEFAULT_SEARCH, **config.get("search", {})}
+    splits = load_splits(config)
+
+    fixed = fixed or {}
+    space = {k: v for k, v in search_config["space"].items() if k not in fixed}
+    if fixed.get("featurizer") == "hashing":
+        space = {k: v for k, v in space.items() if k not in TFIDF_ONLY}
+    candidates = [{**params, **fixed} for params in expand_space(space)]
+    print(f"Searching {len(candidates)} candidates "
+          f"(budget {search_config['budget_seconds']}s, eta={search_config['eta']})")
+
+    t0 = time.perf_counter()
+    trials, exhausted = successive_halving(
+        candidates, splits, search_config, config["random_state"]
+    )
+    scored = [t for t in trials if t["val_accuracy"] is not None]
+    if not scored:
+        raise RuntimeError("Search finished without a successful trial")
+
+    # Rank by the deepest rung reached first, so that a lucky score on a tiny
+    # subset never beats a candidate that survived to more data.
+    leaderboard = sorted(
+        trials,
+        key=lambda t: (t["rung"], -1.0 if t["val_accuracy"] is None else t["val_accuracy"]),
+        reverse=True,
+    )
+    best = next(t for t in leaderboard if t["val_accuracy"] is not None)
+    print(f"Best trial {best['trial_id']}: {best['params']}  val_acc={best['val_accuracy']:.4f}")
+
+    model = build_pipeline(best["params"])
+    model.fit(splits["X_train"], splits["y_train"])
+
+    metrics = evaluate_model(model, splits)
+    metrics["search"] = {
+        "best_params": best["params"],
+        "best_trial_id": best["trial_id"],
+        "candidates": len(candidates),
+        "fixed_params": fixed,
+        "trials": len(trials),
+        "budget_seconds": search_config["budget_seconds"],
+        "budget_exhausted": exhausted,
+        "elapsed_seconds": round(time.perf_counter() - t0, 2),
+    }
+    metrics["promotion"] = promotion_gate(model, splits, config, force=force_promote)
+    timestamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
+    save_artifacts(model, metrics, config, leaderboard=leaderboard, timestamp=timestamp,
+                   merchants=known_merchants(splits))
+    if with_compression:
+        compress(model, splits, config, timestamp, promoted=metrics["promotion"]["promoted"])
+
 
 if __name__ == "__main__":
-    train()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--search", action="store_true",
+                        help="run a parallel hyperparameter search instead of the fixed config")
+    parser.add_argument("--compress", action="store_true",
+                        help="also write a pruned/quantized model (config.json -> compression)")
+    parser.add_argument("--featurizer", choices=["tfidf", "hashing"], default=None,
+                        help="tfidf (vocabulary grows with data, default) or hashing (fixed size); "
+                             "with --search, every candidate uses it")
+    parser.add_argument("--hash-buckets", type=int, default=None,
+                        help=f"number of hashing buckets when --featurizer hashing "
+                             f"(default {DEFAULT_PARAMS['hash_buckets']})")
+    parser.add_argument("--force-promote", action="store_true",
+                        help="promote even if the serving-cost gate rejects the model (recorded in metrics)")
+    args = parser.parse_args()
+    if args.hash_buckets is not None and args.featurizer != "hashing":
+        parser.error("--hash-buckets needs --featurizer hashing")
+    featurizer = {k: v for k, v in (("featurizer", args.featurizer), ("hash_buckets", args.hash_buckets))
+                  if v is not None}
+
+    if args.search:
+        search(with_compression=args.compress, force_promote=args.force_promote, fixed=featurizer)
+    else:
+        train(
+            with_compression=args.compress,
+            params=featurizer,
+            force_promote=args.force_promote,
+        )
@@ -0,0 +1,184 @@
+"""
+uds_server.py — Unix-domain-socket transport for co-located callers.
+
+Skips TCP, HTTP parsing and JSON: every frame is a 4-byte big-endian length
+followed by a msgpack map.
+
+  request:   {"id": 7, "op": "sms", "args": {"sms_text": "..."}}
+  response:  {"id": 7, "ok": true,  "result": {...}}
+             {"id": 7, "ok": false, "error": "sms_text must not be empty"}
+
+Ops mirror the HTTP routes: "merchant" (/predict/merchant), "sms"
+(/predict/sms) and "batch" (/predict/batch); results have the same fields as
+the JSON responses. Requests on one connection are pipelined — a client may
+send many frames without waiting, and responses come back as they finish,
+matched by "id" (so possibly out of order).
+
+UDS requests bypass the HTTP middleware. That means no admission control
+(admission.py): the only bounds are the worker pool and `max_in_flight` per
+connection. It also means no percentage routing or X-Model-Version: every
+frame is served by the primary model. The "budget_ms" arg is the one HTTP
+control that carries over.
+
+Used by: main.py (started in the lifespan when ML_UDS_PATH is set),
+         bench_transport.py (UdsClient)
+"""
+
+import asyncio
+import itertools
+import logging
+import os
+import socket
+import struct
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+import msgpack
+
+log = logging.getLogger("ml_service")
+
+_HEADER = struct.Struct(">I")
+MAX_FRAME_BYTES = 16 * 1024 * 1024
+
+
+def encode_frame(message: dict) -> bytes:
+    payload = msgpack.packb(message, use_bin_type=True)
+    return _HEADER.pack(len(payload)) + payload
+
+
+class UdsServer:
+    """
+    asyncio listener that dispatches each frame to `handlers[op](args)` on a
+    thread pool. At most `max_in_flight` requests per connection are queued;
+    beyond that the server stops reading, which pushes back on the client.
+    """
+
+    def __init__(self, path: str, handlers: dict[str, Callable[[dict], Any]],
+                 error_types: tuple = (ValueError,), workers: int = 8,
+                 max_in_flight: int = 256):
+        self.path = path
+        self.handlers = handlers
+        self.error_types = error_types
+        self.max_in_flight = max_in_flight
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="uds")
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self) -> None:
+        if os.path.exists(self.path):
+            os.unlink(self.path)   # stale socket from a previous run
+        self._server = await asyncio.start_unix_server(self._serve_client, path=self.path)
+        os.chmod(self.path, 0o660)
+        log.info(f"🔌 UDS transport listening on {self.path}")
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+    async def _serve_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        write_lock = asyncio.Lock()
+        slots = asyncio.Semaphore(self.max_in_flight)
+        tasks: set[asyncio.Task] = set()
+        cancelled = False
+        try:
+            while True:
+                header = await reader.readexactly(_HEADER.size)
+                (length,) = _HEADER.unpack(header)
+                if length > MAX_FRAME_BYTES:
+                    log.warning(f"UDS frame of {length} bytes exceeds limit — closing connection")
+                    break
+                payload = await reader.readexactly(length)
+                await slots.acquire()
+                task = asyncio.create_task(self._handle(payload, writer, write_lock))
+                task.add_done_callback(lambda t: slots.release())
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except asyncio.CancelledError:
+            # server shutting down: drop in-flight requests rather than wait on them
+            cancelled = True
+            for task in tasks:
+                task.cancel()
+            raise
+        finally:
+            if tasks and not cancelled:
+                await asyncio.gather(*tasks, return_exceptions=True)
+            writer.close()
+
+    async def _handle(self, payload: bytes, writer: asyncio.StreamWriter, write_lock: asyncio.Lock):
+        request_id = None
+        try:
+            request = msgpack.unpackb(payload, raw=False)
+            request_id = request.get("id")
+            handler = self.handlers.get(request.get("op"))
+            if handler is None:
+                response = {"id": request_id, "ok": False, "error": f"unknown op: {request.get('op')!r}"}
+            else:
+                loop = asyncio.get_running_loop()
+                result = await loop.run_in_executor(self._executor, handler, request.get("args") or {})
+                response = {"id": request_id, "ok": True, "result": result}
+        except self.error_types as exc:
+            response = {"id": request_id, "ok": False, "error": str(exc)}
+        except Exception as exc:
+            log.exception("UDS request failed")
+            response = {"id": request_id, "ok": False, "error": f"internal error: {exc}"}
+
+        async with write_lock:
+            writer.write(encode_frame(response))
+            await writer.drain()
+
+
+class UdsClient:
+    """
+    Small blocking client. `call` is one round trip; `pipeline` writes a
+    whole window of requests before reading any response. Keep windows to a
+    few hundred frames: the server stops reading at max_in_flight, so an
+    unbounded window can stall on full socket buffers.
+    """
+
+    def __init__(self, path: str, timeout: float = 5.0):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(timeout)
+        self.sock.connect(path)
+        self._ids = itertools.count(1)
+
+    def _recv_frame(self) -> dict:
+        header = self._recv_exact(_HEADER.size)
+        (length,) = _HEADER.unpack(header)
+        return msgpack.unpackb(self._recv_exact(length), raw=False)
+
+    def _recv_exact(self, n: int) -> bytes:
+        buf = bytearray()
+        while len(buf) < n:
+            chunk = self.sock.recv(n - len(buf))
+            if not chunk:
+                raise ConnectionError("UDS server closed the connection")
+            buf.extend(chunk)
+        return bytes(buf)
+
+    def call(self, op: str, **args) -> Any:
+        return self.pipeline([(op, args)])[0]
+
+    def pipeline(self, requests: list[tuple[str, dict]]) -> list[Any]:
+        ids = [next(self._ids) for _ in requests]
+        self.sock.sendall(b"".join(
+            encode_frame({"id": i, "op": op, "args": args}) for i, (op, args) in zip(ids, requests)
+        ))
+        responses = {}
+        while len(responses) < len(ids):
+            frame = self._recv_frame()
+            responses[frame["id"]] = frame
+        results = []
+        for i in ids:
+            frame = responses[i]
+            if not frame["ok"]:
+                raise ValueError(frame["error"])
+            results.append(frame["result"])
+        return results
+
+    def close(self) -> None:
+        self.sock.close()